@@ -0,0 +1,415 @@
+"""
+Benchmark the resolver and downloader of kaidame offline
+
+A local stand-in for the Modrinth v2 and CurseForge v1 APIs and their CDNs
+runs in its own process, with configurable latency, bandwidth and injected
+errors. Every run installs a synthetic getters CSV with the real code of
+kaidame in a fresh process and reports throughput, per-file latency and
+peak memory.
+
+    python benchmark.py --rows 10 100 1000 --threads 8 32 64
+
+Every run uses the given number of threads, with --adaptive they are the
+most kaidame may grow its workers to. With --locked every run first writes
+a lockfile, then times locking again, which re-resolves the locked Modrinth
+rows through /version_files/update, before installing from the lockfile.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import multiprocessing
+import functools
+import argparse
+import tempfile
+import hashlib
+import random
+import shutil
+import json
+import time
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+GAME_VERSION = "1.20.1"
+LOADER = "forge"
+# CurseForge mod ids of the synthetic rows start here
+CURSEFORGE_FIRST_ID = 100000
+
+
+class ServerConfig:
+    """
+    Behaviour of the fake services, see FakeHandler
+    """
+
+    def __init__(self, latency: float = 0, bandwidth: int = 0,
+                 error_rate: float = 0, rate_limit: float = 0,
+                 retry_after: float = 1, size: int = 256 * 1024):
+        """
+        Args:
+            latency: seconds before every response
+            bandwidth: bytes per second of every file download, 0 for no limit
+            error_rate: share of requests answered with a 500
+            rate_limit: share of requests answered with a 429
+            retry_after: Retry-After of the 429s, in seconds
+            size: size of every file in bytes
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.size = size
+
+
+def get_file_data(name: str, size: int) -> bytes:
+    """
+    Content of a synthetic file, the same for every request
+    """
+    block = hashlib.sha256(name.encode()).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+@functools.lru_cache(maxsize=None)
+def get_file_hashes(name: str, size: int) -> dict:
+    data = get_file_data(name, size)
+    return {'sha1': hashlib.sha1(data).hexdigest(),
+            'sha512': hashlib.sha512(data).hexdigest()}
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    Answers the API calls manage.py makes and serves the files they point to
+
+    Modrinth projects are BENCH<n> and CurseForge mods are numbered from
+    CURSEFORGE_FIRST_ID, any of them exists with one file.
+    """
+    protocol_version = 'HTTP/1.1'
+    config = ServerConfig()
+    base = ''
+    # sha1 -> Modrinth project, of the files handed out so far
+    modrinth_hashes = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.route(json.loads(self.rfile.read(length) or b'{}'))
+
+    def send_body(self, code: int, body: bytes, headers: dict = {}):
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data):
+        self.send_body(200, json.dumps(data).encode(),
+                       {'Content-Type': 'application/json'})
+
+    def modrinth_version(self, project_id: str) -> dict:
+        filename = f'{project_id.lower()}.jar'
+        size = self.config.size
+        self.modrinth_hashes[get_file_hashes(filename, size)['sha1']] = project_id
+        return {
+            'id': f'{project_id}V', 'project_id': project_id,
+            'game_versions': [GAME_VERSION], 'loaders': [LOADER],
+            'date_published': '2024-01-01T00:00:00Z', 'dependencies': [],
+            'files': [{
+                'url': f'{self.base}/data/{project_id}/versions/1/{filename}',
+                'filename': filename, 'size': size, 'primary': True,
+                'hashes': get_file_hashes(filename, size),
+            }],
+        }
+
+    def curseforge_file(self, mod_id: int) -> dict:
+        filename = f'cf{mod_id}.jar'
+        size = self.config.size
+        return {
+            'id': mod_id * 10, 'modId': mod_id, 'fileName': filename,
+            'fileDate': '2024-01-01T00:00:00Z', 'fileLength': size,
+            'gameVersions': [GAME_VERSION, LOADER.capitalize()],
+            'downloadUrl': f'{self.base}/files/{mod_id * 10}/{filename}',
+            'dependencies': [],
+            'hashes': [{'value': get_file_hashes(filename, size)['sha1'], 'algo': 1}],
+        }
+
+    def route(self, body):
+        config = self.config
+        if config.latency:
+            time.sleep(config.latency)
+        chance = random.random()
+        if chance < config.rate_limit:
+            return self.send_body(429, b'{}', {'Retry-After': str(config.retry_after)})
+        if chance < config.rate_limit + config.error_rate:
+            return self.send_body(500, b'{}')
+
+        url = urlparse(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        parts = path.strip('/').split('/')
+        if path == '/key':
+            return self.send_json({'token': 'benchmark'})
+        if path == '/v2/projects':
+            return self.send_json([{'id': id, 'game_versions': [GAME_VERSION],
+                                    'loaders': [LOADER], 'versions': [f'{id}V']}
+                                   for id in json.loads(query['ids'][0])])
+        if path == '/v2/versions':
+            return self.send_json([self.modrinth_version(id[:-1])
+                                   for id in json.loads(query['ids'][0])])
+        if path == '/v2/version_files/update' and body is not None:
+            # files are never updated, every hash maps to its own version
+            return self.send_json({
+                sha1: self.modrinth_version(self.modrinth_hashes[sha1])
+                for sha1 in body['hashes'] if sha1 in self.modrinth_hashes})
+        if parts[:2] == ['v2', 'project'] and parts[-1] == 'version':
+            return self.send_json([self.modrinth_version(parts[2])])
+        if path == '/v1/mods' and body is not None:
+            return self.send_json({'data': [{
+                'id': id,
+                'latestFilesIndexes': [{
+                    'gameVersion': GAME_VERSION, 'fileId': id * 10,
+                    'filename': f'cf{id}.jar', 'modLoader': 1,
+                }],
+            } for id in body['modIds']]})
+        if path == '/v1/mods/files' and body is not None:
+            return self.send_json({'data': [self.curseforge_file(id // 10)
+                                            for id in body['fileIds']]})
+        if parts[:2] == ['v1', 'mods'] and parts[-1] == 'files':
+            return self.send_json({'data': [self.curseforge_file(int(parts[2]))]})
+        if parts[0] in ('data', 'files'):
+            return self.send_file(parts[-1])
+        self.send_body(404, b'{}')
+
+    def send_file(self, filename: str):
+        data = get_file_data(filename, self.config.size)
+        start = 0
+        code = 200
+        headers = {'Accept-Ranges': 'bytes', 'ETag': f'"{filename}"'}
+        requested = self.headers.get('Range')
+        if requested:
+            start = int(requested.split('=')[1].split('-')[0])
+            code = 206
+            headers['Content-Range'] = f'bytes {start}-{len(data) - 1}/{len(data)}'
+        body = data[start:]
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not self.config.bandwidth:
+            self.wfile.write(body)
+            return
+        chunk_size = 16 * 1024
+        for i in range(0, len(body), chunk_size):
+            self.wfile.write(body[i:i + chunk_size])
+            time.sleep(len(body[i:i + chunk_size]) / self.config.bandwidth)
+
+
+def serve(config: ServerConfig, queue):
+    """
+    Run the fake services until the process is terminated, their base url
+    is put on queue
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHandler)
+    server.daemon_threads = True
+    FakeHandler.config = config
+    FakeHandler.base = f'http://127.0.0.1:{server.server_address[1]}'
+    queue.put(FakeHandler.base)
+    server.serve_forever()
+
+
+def make_getters(root: str, base: str, rows: int):
+    """
+    Write getters/common.csv with rows split between Modrinth and CurseForge
+    """
+    os.makedirs(os.path.join(root, 'getters'), exist_ok=True)
+    lines = ['url,filename,loader,comment']
+    for i in range(rows):
+        if i % 2 == 0:
+            url = f'{base}/data/BENCH{i:06d}'
+        else:
+            url = f'{base}/v1/mods/{CURSEFORGE_FIRST_ID + i}'
+        lines.append(f'"{url}","Row {i}","{LOADER}",""')
+    with open(os.path.join(root, 'getters', 'common.csv'), 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def get_peak_rss() -> int:
+    """
+    Peak resident memory of this process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def run_benchmark(base: str, rows: int, threads: int, use_async: bool,
+                  adaptive: bool = False, locked: bool = False) -> dict:
+    """
+    Install rows synthetic getters with kaidame, in a fresh process
+
+    Args:
+        locked: lock the rows first, then time locking them again and
+            installing from the lockfile
+
+    Returns:
+        dict with the number of files and bytes installed, failures, wall
+        time, the part of it spent locking, the duration of every file
+        download and the peak RSS
+    """
+    os.environ['TQDM_DISABLE'] = '1'
+    from kaidame import Config, Telemetry, build_installer
+    from kaidame.aio import AsyncDownloader
+    from kaidame.downloader import Downloader
+
+    config = Config(
+        modrinth_base_url=base, modrinth_api=base + '/v2',
+        curseforge_api=base + '/v1', curseforge_api_old=base + '/old/v1',
+        curseforge_api_key=base + '/key',
+        threads=threads, http_pool_size=threads, use_async=use_async,
+        min_threads=Config.min_threads if adaptive else threads,
+        use_cache=False, progress=False,
+    )
+    telemetry = Telemetry()
+    installer = build_installer(config, telemetry)
+
+    latencies = []
+
+    def timed(fetch):
+        @functools.wraps(fetch)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fetch(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        @functools.wraps(fetch)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fetch(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+        return async_wrapper if use_async else wrapper
+
+    Downloader.fetch_file = timed(Downloader.fetch_file)
+    AsyncDownloader.fetch_file = timed(AsyncDownloader.fetch_file)
+
+    root = tempfile.mkdtemp(prefix='kaidame-bench-')
+    try:
+        make_getters(root, base, rows)
+        os.chdir(root)
+        if locked:
+            # resolves every row through /projects and /versions
+            installer.resolver.lock_files()
+        start = time.perf_counter()
+        if locked:
+            # the locked Modrinth rows go through /version_files/update
+            installer.resolver.lock_files()
+        lock_elapsed = time.perf_counter() - start
+        results = installer.download_files(['common.csv'], use_async)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join('mods', file))
+                   for file in os.listdir('mods')) if os.path.exists('mods') else 0
+    finally:
+        os.chdir(os.path.dirname(root))
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        'files': sum(1 for result in results if result is True),
+        'failed': sum(1 for result in results if result is not True),
+        'bytes': size,
+        'seconds': elapsed,
+        'lock_seconds': lock_elapsed,
+        'latencies': latencies,
+        'rss': get_peak_rss(),
+        'connections': sum(telemetry.get_connection_count().values()),
+        # jobs the threaded engine ran at once in the end
+        'limit': telemetry.pools[-1]['limit'] if telemetry.pools else threads,
+    }
+
+
+def percentile(values: list, share: float) -> float:
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def print_result(rows: int, threads: int, result: dict):
+    seconds = result['seconds']
+    rss = f"{result['rss'] / 1024**2:7.1f}" if result['rss'] else '      ?'
+    print(f"{rows:>6} {threads:>7} {result['files']:>6} {result['failed']:>6} "
+          f"{seconds:>8.2f} {result['lock_seconds']:>7.2f} "
+          f"{result['files'] / seconds:>8.1f} "
+          f"{result['bytes'] / 1024**2 / seconds:>7.1f} "
+          f"{percentile(result['latencies'], 0.5) * 1000:>8.1f} "
+          f"{percentile(result['latencies'], 0.99) * 1000:>8.1f} "
+          f"{result['connections']:>6} {result['limit']:>5} {rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark manage.py against local fake Modrinth/CurseForge/CDN')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Getters rows of each run (default: 10 100 1000)')
+    parser.add_argument('--threads', type=int, nargs='+', default=[32],
+                        help='THREADS of each run (default: 32)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Use the asyncio engine')
+    parser.add_argument('--locked', action='store_true',
+                        help='Lock the rows first, then time locking again '
+                        'and installing from the lockfile')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Let the worker count adapt up to --threads '
+                        'instead of fixing it')
+    parser.add_argument('--size', type=int, default=256,
+                        help='File size in KiB (default: 256)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Latency of every response in ms')
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='Bandwidth of every download in MiB/s, 0 for no limit')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Share of requests answered with a 500')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Share of requests answered with a 429')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Retry-After of the 429s in seconds')
+    args = parser.parse_args()
+
+    config = ServerConfig(
+        latency=args.latency / 1000, bandwidth=int(args.bandwidth * 1024**2),
+        error_rate=args.error_rate, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, size=args.size * 1024)
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(config, queue), daemon=True)
+    server.start()
+    try:
+        base = queue.get(timeout=30)
+        print(f"{'rows':>6} {'threads':>7} {'files':>6} {'failed':>6} "
+              f"{'seconds':>8} {'lock s':>7} {'files/s':>8} {'MB/s':>7} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'conns':>6} {'jobs':>5} {'RSS MB':>7}")
+        for rows in args.rows:
+            for threads in args.threads:
+                # a fresh process per run keeps sessions and peak RSS apart
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(
+                        run_benchmark, base, rows, threads, args.use_async,
+                        args.adaptive, args.locked).result()
+                print_result(rows, threads, result)
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+kaidame: installs the mods, plugins and configs of a Minecraft pack from
+the getters CSVs
+
+Every component takes the Config it runs with, so several can be used side
+by side in one process:
+
+    from kaidame import Config, Telemetry, build_installer
+
+    config = Config(mc_version='1.20.1', use_async=True)
+    installer = build_installer(config, Telemetry())
+    installer.sync(['client.csv', 'common.csv'])
+
+Names are imported on first use, importing the package itself loads
+nothing heavy.
+"""
+
+# name -> module it is defined in
+_EXPORTS = {
+    'Config': 'config',
+    'GETTERS': 'config',
+    'CLIENT_CSVS': 'config',
+    'SERVER_CSVS': 'config',
+    'Telemetry': 'telemetry',
+    'HTTPClient': 'net',
+    'OfflineMiss': 'net',
+    'ArtifactCache': 'cache',
+    'Resolver': 'resolver',
+    'Downloader': 'downloader',
+    'DownloadFailed': 'downloader',
+    'Installer': 'installer',
+    'JarIndex': 'jars',
+    'Exporter': 'exporter',
+    'Mirror': 'mirror',
+    'build_installer': 'cli',
+    'main': 'cli',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,226 @@
+"""
+asyncio download engine, used when Config.use_async is set
+
+Imports aiohttp, so it is only imported by Downloader.run_jobs() when the
+engine is used.
+"""
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .downloader import (
+    DOWNLOAD_CHUNK_SIZE, DownloadFailed, Downloader, PartDownload, discard_part,
+    get_job_filename, get_job_order, is_retryable,
+)
+from .net import get_revalidation_headers
+from .telemetry import TransferTimer, get_profile_item, set_profile_item
+
+
+class AsyncDownloader:
+    """
+    asyncio download engine
+
+    Resolves unlocked rows and downloads files as tasks on one event loop,
+    with a concurrency limit per host so no single API or CDN gets
+    flooded. Shares the caches, settings and CurseForge key of the
+    Downloader it runs for.
+    """
+
+    def __init__(self, downloader: Downloader, session, quiet=True):
+        self.downloader = downloader
+        self.config = downloader.config
+        self.http = downloader.http
+        self.telemetry = downloader.telemetry
+        self.resolver = downloader.resolver
+        self.session = session
+        self.quiet = quiet
+        self.semaphores = {}
+        self.key_lock = asyncio.Lock()
+
+    def semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self.semaphores:
+            api_hosts = {urlparse(api).netloc for api in [
+                self.config.modrinth_api, self.config.curseforge_api,
+                self.config.curseforge_api_key]}
+            limit = (self.config.async_api_limit if host in api_hosts
+                     else self.config.async_cdn_limit)
+            self.semaphores[host] = asyncio.Semaphore(limit)
+        return self.semaphores[host]
+
+    async def get_json(self, url: str, params: dict = None, needs_key: bool = False):
+        """
+        Same as HTTPClient.api_request() for GET, the metadata cache is read
+        and written on a worker thread
+
+        Args:
+            needs_key: send the CurseForge key
+        """
+        path, cached, fresh = await asyncio.to_thread(
+            self.http.lookup_api_request, 'GET', url, params)
+        if fresh:
+            return cached['data']
+        headers = await self.curseforge_headers() if needs_key else {}
+        if cached is not None:
+            headers.update(get_revalidation_headers(cached))
+        async with self.semaphore(url):
+            async with self.session.get(url, params=params, headers=headers) as response:
+                if response.status == 304 and cached is not None:
+                    return await asyncio.to_thread(
+                        self.http.keep_api_response, path, url, cached)
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        return await asyncio.to_thread(
+            self.http.store_api_response, path, url, data, response.headers)
+
+    async def get_curseforge_key(self) -> str:
+        async with self.key_lock:
+            if self.http.needs_curseforge_key():
+                url = self.config.curseforge_api_key
+                async with self.semaphore(url):
+                    async with self.session.get(url) as response:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                with self.http.curseforge_key_lock:
+                    self.http.set_curseforge_key(data['token'])
+            return self.http.curseforge_key
+
+    async def curseforge_headers(self) -> dict:
+        return {'x-api-key': await self.get_curseforge_key()}
+
+    async def resolve_file(self, frame: dict) -> dict:
+        """
+        Same as Resolver.resolve_file(), without the bulk lookups
+        """
+        with self.telemetry.span('resolve', get_profile_item(frame['filename']),
+                                 urlparse(frame['url']).hostname):
+            return await self.resolve_row(frame, frame['loader'])
+
+    async def resolve_row(self, frame: dict, modloader: str) -> dict:
+        request = self.resolver.get_row_request(frame, modloader)
+        if request is None:
+            return {'url': frame['url'], 'filename': frame['filename'],
+                    'size': None, 'hashes': {}}
+        url, params, needs_key = request
+        data = await self.get_json(url, params, needs_key)
+        return self.resolver.pick_row_entry(frame, modloader, data)
+
+    async def fetch_file(self, url, dir, filename,
+                         size: int = None, hashes: dict = None):
+        """
+        Same as Downloader.fetch_file(), on the event loop
+
+        Opening the .part file, which rehashes what was already downloaded,
+        and verifying it run on a worker thread.
+        """
+        part = None
+        transfer = None
+        try:
+            part = await asyncio.to_thread(PartDownload, url, dir, filename, size, hashes)
+            async with self.semaphore(url):
+                timer = TransferTimer(self.telemetry, filename, url)
+                response = await self.session.get(url, headers=part.headers)
+                if part.needs_restart(response.status):
+                    response.release()
+                    await asyncio.to_thread(part.restart)
+                    response = await self.session.get(url)
+                async with response:
+                    timer.response()
+                    response.raise_for_status()
+                    file = await asyncio.to_thread(
+                        part.open, response.status, response.headers)
+                    transfer = self.downloader.progress.open(
+                        filename, part.get_total_size(), size is not None)
+                    transfer.update(part.offset)
+                    with file:
+                        async for chunk in response.content.iter_chunked(
+                                DOWNLOAD_CHUNK_SIZE):
+                            part.downloaded += len(chunk)
+                            timer.write_chunk(file, part.hasher, chunk)
+                            transfer.update(len(chunk))
+                    timer.done(part.downloaded)
+            await asyncio.to_thread(part.finish)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, IOError) as e:
+            if part is not None:
+                await asyncio.to_thread(discard_part, part.part_path, e)
+            raise
+        finally:
+            if transfer is not None:
+                self.downloader.progress.close(transfer)
+
+    async def install_job(self, job: dict, max_attempts: int = None) -> bool:
+        """
+        Same as Downloader.install_job(), retrying with backoff
+
+        Raises:
+            DownloadFailed once the job runs out of attempts
+        """
+        if max_attempts is None:
+            max_attempts = self.config.max_attempts
+        downloader = self.downloader
+        set_profile_item(job)
+        for attempt in range(max_attempts):
+            try:
+                if 'decrypt' in job:
+                    return await asyncio.to_thread(downloader.decrypt_job, job)
+                if job['entry'] is None:
+                    job['entry'] = await self.resolve_file(job['frame'])
+                entry = job['entry']
+                source = await asyncio.to_thread(downloader.lookup_job, job)
+                if source is None:
+                    await self.fetch_file(
+                        entry['url'], job['targets'][0], entry['filename'],
+                        entry.get('size'), entry.get('hashes'))
+                    source = await asyncio.to_thread(downloader.store_job, job)
+                await asyncio.to_thread(downloader.place_job, job, source)
+                return True
+            except Exception as e:
+                if attempt == max_attempts - 1 or not is_retryable(e):
+                    raise DownloadFailed(
+                        get_job_filename(job), job['targets'][0], attempt + 1, e)
+                await asyncio.sleep(downloader.get_retry_delay(attempt, e))
+
+
+async def run_jobs_async(downloader: Downloader, jobs: list):
+    """
+    Same as Downloader.run_jobs_threaded(), with the asyncio engine
+    """
+    telemetry = downloader.telemetry
+
+    async def on_request_start(session, context, params):
+        context.host = params.url.host
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        telemetry.count_connection(context.host)
+        telemetry.record_span('connect', context.host, context.connect_start,
+                              time.perf_counter(), context.host)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    # limits are enforced per host by AsyncDownloader.semaphore()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(
+        connector=connector, trace_configs=[trace_config]
+    ) as session:
+        engine = AsyncDownloader(downloader, session)
+
+        async def run(job):
+            try:
+                return await engine.install_job(job)
+            except Exception as e:
+                return e
+            finally:
+                downloader.progress.job_done(job)
+
+        # tasks queue on the host semaphores in the order they start,
+        # largest first
+        tasks = {i: asyncio.ensure_future(run(jobs[i])) for i in get_job_order(jobs)}
+        results = await asyncio.gather(*[tasks[i] for i in range(len(jobs))])
+    return list(results)
@@ -0,0 +1,112 @@
+"""
+Content addressed cache of downloaded files, shared by every instance
+"""
+import os
+
+from . import console
+from .config import Config, HASH_ALGOS
+from .files import link_file
+from .telemetry import Telemetry
+
+
+class ArtifactCache:
+    """
+    Verified downloads stored by hash under <cache dir>/<algo>/, installs
+    are hardlinked (or reflinked, or copied) from it
+    """
+
+    def __init__(self, config: Config, telemetry: Telemetry):
+        self.config = config
+        self.telemetry = telemetry
+
+    def path(self, entry: dict) -> str:
+        """
+        Path of an entry's file in the artifact cache, None if it has no hash
+        """
+        algo = next((algo for algo in HASH_ALGOS if algo in entry.get('hashes', {})),
+                    None)
+        if algo is None:
+            return None
+        digest = entry['hashes'][algo].lower()
+        return os.path.join(self.config.get_cache_dir(), algo, digest[:2], digest)
+
+    @staticmethod
+    def touch(path: str):
+        # last use is kept in a separate file, touching the artifact itself
+        # would change the mtime of every hardlinked install
+        with open(path + '.used', 'a'):
+            pass
+        os.utime(path + '.used')
+
+    def lookup(self, entry: dict) -> str:
+        """
+        Path of an entry's file in the artifact cache, None on a miss
+        """
+        if not self.config.use_cache:
+            return None
+        path = self.path(entry)
+        if path is None or not os.path.isfile(path):
+            return None
+        size = os.path.getsize(path)
+        if entry.get('size') is not None and size != entry['size']:
+            os.remove(path)
+            return None
+        self.touch(path)
+        self.telemetry.count('hits')
+        self.telemetry.count('bytes', size)
+        return path
+
+    def store(self, path: str, entry: dict, progress: console.ProgressRenderer = None):
+        """
+        Add a verified download to the artifact cache
+
+        Args:
+            progress: renderer of the running queue, warnings are shown
+                through it instead of printed from the worker
+        """
+        if not self.config.use_cache:
+            return
+        cache_path = self.path(entry)
+        if cache_path is None:
+            return
+        try:
+            if not os.path.exists(cache_path):
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                link_file(path, cache_path)
+            self.touch(cache_path)
+        except OSError as e:
+            # the cache is only an optimisation
+            message = (f"{console.YELLOW}Could not cache {entry['filename']}: "
+                       f"{e}{console.CLEAR} ")
+            if progress is None:
+                print(message)
+            else:
+                progress.message(message)
+
+    def evict(self, max_size: int = None):
+        """
+        Remove the least recently used artifacts until the cache fits max_size
+        """
+        max_size = self.config.cache_max_size if max_size is None else max_size
+        cache_dir = self.config.get_cache_dir()
+        artifacts = []
+        total = 0
+        walks = [os.walk(os.path.join(cache_dir, algo)) for algo in HASH_ALGOS]
+        for root, _, files in (step for walk in walks for step in walk):
+            for file in files:
+                if file.endswith(('.used', '.link')):
+                    continue
+                path = os.path.join(root, file)
+                used = path + '.used'
+                last_used = os.path.getmtime(used if os.path.exists(used) else path)
+                size = os.path.getsize(path)
+                artifacts.append((last_used, size, path))
+                total += size
+        artifacts.sort()
+        for _, size, path in artifacts:
+            if total <= max_size:
+                break
+            for file in [path, path + '.used']:
+                if os.path.exists(file):
+                    os.remove(file)
+            total -= size
@@ -0,0 +1,210 @@
+"""
+Command line interface of manage.py
+
+Only what a command needs is imported, so --key, --encrypt and the exports
+start without loading requests, urllib3 or tqdm.
+"""
+import argparse
+import time
+
+from . import console
+from .config import CLIENT_CSVS, SERVER_CSVS, Config
+from .telemetry import Telemetry
+
+# default of --serve, kept in sync with mirror.MIRROR_ADDRESS
+MIRROR_ADDRESS = '0.0.0.0:8770'
+
+
+def build_installer(config: Config, telemetry: Telemetry):
+    """
+    Wire up an Installer and the components it uses
+    """
+    from .cache import ArtifactCache
+    from .downloader import Downloader
+    from .installer import Installer
+    from .net import HTTPClient
+    from .resolver import Resolver
+    http = HTTPClient(config, telemetry)
+    resolver = Resolver(config, http, telemetry)
+    downloader = Downloader(config, http, ArtifactCache(config, telemetry),
+                            telemetry, resolver)
+    return Installer(config, resolver, downloader)
+
+
+def get_parser(config: Config) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Download mods for client or server')
+    parser.add_argument('--client', action='store_true',
+                        help='Download mods for client')
+    parser.add_argument('--server', action='store_true',
+                        help='Download mods for server')
+    parser.add_argument('--key', action='store_true',
+                        help='Generate key for encryption')
+    parser.add_argument('--encrypt', type=str, help='Encrypt file')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Re-encrypt legacy getters/client/*.jar.enc '
+                        'files in the chunked format')
+    parser.add_argument('--server-export', action='store_true',
+                        help='Export server files to server.zip')
+    parser.add_argument('--client-export', action='store_true',
+                        help='Export client files to client.zip')
+    parser.add_argument('--output', type=str,
+                        help='With --server-export/--client-export: write '
+                        'the archive here instead, - for stdout')
+    parser.add_argument('--since', type=str,
+                        help='With --server-export/--client-export: only '
+                        'export what changed since this export index or delta')
+    parser.add_argument('--apply-delta', type=str,
+                        help='Apply a delta archive made with --since')
+    parser.add_argument('--serve', type=str, nargs='?', const=MIRROR_ADDRESS,
+                        metavar='HOST:PORT',
+                        help='Serve the client pack to --from clients, '
+                        f'on {MIRROR_ADDRESS} by default')
+    parser.add_argument('--from', dest='mirror', type=str, metavar='URL',
+                        help='With --client: sync from a --serve mirror '
+                        'instead of the CDNs')
+    parser.add_argument('--sync', action='store_true',
+                        help='With --client/--server: only download changed '
+                        'files and remove stale ones instead of a clean install')
+    parser.add_argument('--verify', action='store_true',
+                        help='With --client/--server: check the installed '
+                        'files against their expected hashes')
+    parser.add_argument('--check', action='store_true',
+                        help='With --client/--server: look for duplicate mod '
+                        'IDs and jars built for another loader or Minecraft '
+                        'version, this also runs after every install')
+    parser.add_argument('--no-check', action='store_true',
+                        help='Do not check the jars after installing')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Download with the asyncio engine (needs aiohttp, '
+                        'see requirements-async.txt)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the shared artifact and API '
+                        'response caches')
+    parser.add_argument('--no-deps', action='store_true',
+                        help='Only install the listed rows, not their '
+                        'required dependencies')
+    parser.add_argument('--offline', action='store_true',
+                        help='Resolve from cached API responses and install '
+                        'from the artifact cache only')
+    parser.add_argument('--profile', type=str,
+                        help='Time every stage of every file and write the '
+                        'spans to this file')
+    parser.add_argument('--profile-format', choices=['json', 'chrome'],
+                        default='json',
+                        help='Format of --profile: json, or chrome for '
+                        'chrome://tracing and Perfetto')
+    parser.add_argument('--lock', action='store_true',
+                        help=f'Resolve all getters and write {config.lockfile}')
+    parser.add_argument('--update', action='store_true',
+                        help=f'Re-resolve only changed getters in {config.lockfile}')
+    return parser
+
+
+def main(argv: list = None, config: Config = None):
+    """
+    Run manage.py with the given arguments
+
+    Args:
+        argv: arguments, sys.argv[1:] by default
+        config: settings the flags are applied to, Config() by default
+    """
+    config = config or Config()
+    args = get_parser(config).parse_args(argv)
+
+    if args.use_async:
+        import importlib.util
+        if importlib.util.find_spec('aiohttp') is None:
+            print(f'{console.RED}--async needs aiohttp, install it with '
+                  f'pip install -r requirements-async.txt{console.CLEAR} ')
+            return
+        config.use_async = True
+    if args.no_cache:
+        config.use_cache = False
+    if args.profile:
+        config.profile = True
+    if args.offline:
+        config.offline = True
+    if args.no_deps:
+        config.follow_dependencies = False
+    if args.no_check:
+        config.check_jars = False
+    if args.lock or args.update:
+        # pick up new releases now, unchanged lists still come back as 304s
+        config.metadata_ttl = 0
+    telemetry = Telemetry(config.profile)
+
+    if args.client and args.verify:
+        start = time.time()
+        installer = build_installer(config, telemetry)
+        tables = None
+        if args.mirror:
+            from .mirror import get_mirror_tables
+            tables = get_mirror_tables(installer.downloader.http, args.mirror)[0]
+        installer.verify(CLIENT_CSVS, tables)
+        telemetry.print_done(start)
+    elif args.server and args.verify:
+        start = time.time()
+        build_installer(config, telemetry).verify(SERVER_CSVS)
+        telemetry.print_done(start)
+    elif args.client and args.check:
+        start = time.time()
+        build_installer(config, telemetry).check(CLIENT_CSVS)
+        telemetry.print_done(start)
+    elif args.server and args.check:
+        start = time.time()
+        build_installer(config, telemetry).check(SERVER_CSVS)
+        telemetry.print_done(start)
+    elif args.client and args.mirror:
+        start = time.time()
+        build_installer(config, telemetry).sync_from_mirror(args.mirror, CLIENT_CSVS)
+        telemetry.print_done(start)
+    elif args.client and args.sync:
+        start = time.time()
+        build_installer(config, telemetry).sync(CLIENT_CSVS)
+        telemetry.print_done(start)
+    elif args.server and args.sync:
+        start = time.time()
+        build_installer(config, telemetry).sync(SERVER_CSVS)
+        telemetry.print_done(start)
+    elif args.client:
+        start = time.time()
+        build_installer(config, telemetry).install(CLIENT_CSVS)
+        telemetry.print_done(start)
+    elif args.server:
+        start = time.time()
+        build_installer(config, telemetry).install(SERVER_CSVS)
+        telemetry.print_done(start)
+    elif args.serve:
+        from .mirror import Mirror
+        Mirror(build_installer(config, telemetry)).serve(args.serve)
+    elif args.lock or args.update:
+        start = time.time()
+        build_installer(config, telemetry).resolver.lock_files(update=args.update)
+        telemetry.print_done(start)
+    elif args.server_export:
+        from .exporter import Exporter
+        Exporter(config).export_server(args.output, args.since)
+    elif args.client_export:
+        from .exporter import Exporter
+        Exporter(config).export_client(args.output, args.since)
+    elif args.apply_delta:
+        from .exporter import Exporter
+        Exporter(config).apply_delta(args.apply_delta)
+    elif args.key:
+        from .crypto import generate_key, save_key
+        save_key(generate_key())
+        print(f'{console.GREEN}Key generated and saved! ./key{console.CLEAR} ')
+    elif args.encrypt:
+        from .crypto import encrypt_file, read_key
+        key = read_key()
+        encrypt_file(key, args.encrypt, args.encrypt + '.enc')
+    elif args.migrate:
+        from .crypto import migrate_crypto_client_files
+        migrate_crypto_client_files()
+    else:
+        print('Please specify --client or --server')
+
+    if args.profile:
+        telemetry.print_profile_summary(config.profile_top)
+        telemetry.write_profile(args.profile, args.profile_format)
@@ -0,0 +1,116 @@
+"""
+Settings shared by the components and the layout of an instance
+"""
+import os
+
+# CSV in ./getters -> directory its files are installed to
+GETTERS = {
+    'client.csv': 'mods/',
+    'common.csv': 'mods/',
+    'server.csv': 'mods/',
+    'plugins.csv': 'plugins/',
+}
+# progress bar of each getters CSV
+PHASES = {
+    'client.csv': "[ 💫 ] Downloading client files",
+    'common.csv': "[ 📦 ] Downloading common files",
+    'server.csv': "[ 💭 ] Downloading server files",
+    'plugins.csv': "[ 🧩 ] Downloading plugins     ",
+}
+CLIENT_CSVS = ['client.csv', 'common.csv']
+SERVER_CSVS = ['server.csv', 'plugins.csv', 'common.csv']
+# strongest first
+HASH_ALGOS = ['sha512', 'sha1', 'md5']
+# what was installed into a directory, see Installer.sync()
+MANIFEST = '.manifest.json'
+
+
+class Config:
+    """
+    Settings of a run, every component reads them from the Config it is
+    given instead of from globals
+
+    Any setting can be overridden with a keyword argument, e.g.
+    Config(mc_version='1.20.4', use_async=True). Paths are relative to the
+    working directory, which is the instance.
+    """
+    modrinth_base_url = "https://cdn.modrinth.com"
+    modrinth_api = "https://api.modrinth.com/v2"
+    curseforge_base_url = "https://www.curseforge.com"
+    curseforge_api = "https://api.curseforge.com/v1"
+    curseforge_api_old = "https://www.curseforge.com/api/v1"
+    curseforge_api_key = "https://cf.polymc.org/api"  # Thanks to PolyMC
+    curseforge_cdn = "https://edge.forgecdn.net"
+
+    mc_version = "1.20.1"
+    # loaders the jars of each directory are built for, Forge mods and Bukkit
+    # plugins by default as Ketting runs both
+    loaders = None
+    lockfile = 'getters/lock.json'
+    # also install the required dependencies of every row
+    follow_dependencies = True
+
+    use_threading = True
+    # jobs run on min_threads workers at first, doubled while the throughput
+    # keeps rising, up to threads, see downloader.WorkerLimit
+    min_threads = 8
+    # download with the asyncio engine instead of the thread pool
+    use_async = False
+    threads = max(32, os.cpu_count() or 1)
+    # keep-alive connections kept per host, threads by default
+    http_pool_size = None
+    # attempts per file before it is reported as failed
+    max_attempts = 5
+    # exponential backoff between attempts, in seconds
+    backoff_base = 1
+    backoff_max = 60
+    # longest Retry-After that is honoured, in seconds
+    retry_after_max = 300
+    # concurrent requests per host for the asyncio engine
+    async_api_limit = 8
+    async_cdn_limit = 16
+
+    # content addressed cache of downloaded files and API responses
+    use_cache = True
+    # $KAIDAME_CACHE, or kaidame in the user's cache directory by default
+    cache_dir = None
+    cache_max_size = 4 * 1024**3
+    # API responses are reused for this long before they are revalidated, in seconds
+    metadata_ttl = 60 * 60
+    # resolve from cached API responses and install from the artifact cache only
+    offline = False
+
+    # draw the progress of downloads, see console.ProgressRenderer
+    progress = True
+    # record a span for every stage of every file
+    profile = False
+    profile_top = 10
+    verify_workers = os.cpu_count() or 4
+    # look for conflicting jars after installs and syncs, see Installer.check()
+    check_jars = True
+    # exports are made from and deltas applied to this directory
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, **settings):
+        for name, value in settings.items():
+            if name.startswith('_') or not hasattr(Config, name) or callable(
+                    getattr(Config, name)):
+                raise TypeError(f'Unknown setting {name}')
+            setattr(self, name, value)
+        if self.http_pool_size is None:
+            self.http_pool_size = self.threads
+        if self.loaders is None:
+            # every Config gets its own dict, changing one changes no other
+            self.loaders = {'mods/': ['forge'], 'plugins/': ['bukkit']}
+
+    def get_cache_dir(self) -> str:
+        """
+        Directory of the caches shared by every instance of the user
+        """
+        if self.cache_dir:
+            return self.cache_dir
+        if os.environ.get('KAIDAME_CACHE'):
+            return os.environ['KAIDAME_CACHE']
+        base = (os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+                or os.path.expanduser('~/.cache'))
+        return os.path.join(base, 'kaidame')
@@ -0,0 +1,301 @@
+"""
+Terminal output: colours and progress bars
+
+ksilorama and tqdm are only imported once something is printed with them.
+"""
+import os
+import shutil
+import sys
+import threading
+import time
+
+_COLORS = {
+    'CLEAR': ('Style', 'RESET_ALL'),
+    'GREEN': ('Fore', 'GREEN'),
+    'YELLOW': ('Fore', 'YELLOW'),
+    'RED': ('Fore', 'RED'),
+    'CYAN': ('Fore', 'CYAN'),
+    'UPDATING': ('Fore', 'CYAN'),
+    'DECRYPTING': ('Fore', 'MAGENTA'),
+}
+
+BAR_FORMAT = "{desc}: {percentage:3.0f}% [{bar}] {n_fmt:>3}/{total_fmt:>3} [{elapsed:>5}<{remaining:>5}]"
+# seconds between frames of ProgressRenderer on a terminal
+PROGRESS_INTERVAL = 0.1
+# seconds between log lines of ProgressRenderer when not on a terminal
+PROGRESS_LOG_INTERVAL = 10
+# throughput is measured over this many seconds
+PROGRESS_RATE_WINDOW = 5
+# files in flight shown on a terminal
+PROGRESS_SLOWEST = 3
+
+
+def __getattr__(name: str) -> str:
+    if name not in _COLORS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import ksilorama as ks
+    group, attr = _COLORS[name]
+    value = getattr(getattr(ks, group), attr)
+    globals()[name] = value
+    return value
+
+
+def progress_bar(total: int, desc: str, position: int = None):
+    from tqdm import tqdm
+    return tqdm(total=total, desc=desc, unit="file", position=position,
+                bar_format=BAR_FORMAT, ascii=" =")
+
+
+def show_progress(downloaded, total):
+    """
+    Show download progress
+
+    Args:
+        downloaded: downloaded size in bytes
+        total: total size in bytes
+    """
+    max_width = 40
+    if total >= 1024**3:
+        total /= 1024**3
+        downloaded /= 1024**3
+        annotation = 'GB'
+    elif total >= 1024**2:
+        total /= 1024**2
+        downloaded /= 1024**2
+        annotation = 'MB'
+    elif total >= 1024**1:
+        total /= 1024
+        downloaded /= 1024
+        annotation = 'KB'
+    else:
+        annotation = 'B'
+    done = int(max_width * downloaded / total)
+    print(f'\r[{"="*done}{" "*(max_width-done)
+                          }] {downloaded:.1f}/{total:.1f} {annotation}', end='')
+
+
+class Transfer:
+    """
+    Bytes of one file in flight, only the worker moving them writes to it
+    """
+    __slots__ = ('name', 'size', 'done', 'start')
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.done = 0
+        self.start = time.monotonic()
+
+    def update(self, amount: int):
+        self.done += amount
+
+
+class ProgressRenderer:
+    """
+    One display for all jobs of a queue, drawn by its own thread
+
+    Workers never print: they bump counters that only they write to, a
+    Transfer each, and the renderer thread sums them up PROGRESS_INTERVAL
+    apart. On a terminal it redraws the files done per phase, the bytes,
+    throughput and ETA of the whole queue and the slowest files in flight.
+    Otherwise it logs a plain line every PROGRESS_LOG_INTERVAL.
+    """
+
+    def __init__(self, jobs: list, show: bool = True, stream=None):
+        """
+        Args:
+            jobs: jobs of build_jobs(), sizes known from their entries make
+                up the total for the ETA
+            show: False only counts, without a thread or any output
+        """
+        self.stream = stream or sys.stderr
+        self.phases = {}
+        self.total = 0
+        for job in jobs:
+            for phase in job['phases']:
+                self.phases[phase] = self.phases.get(phase, 0) + 1
+            if 'decrypt' in job:
+                self.total += os.path.getsize(job['decrypt']['path'])
+            elif job['entry'] is not None and job['entry'].get('size'):
+                self.total += job['entry']['size']
+        self.phase_done = dict.fromkeys(self.phases, 0)
+        self.files = len(jobs)
+        self.files_done = 0
+        # written by workers, appends and dict stores need no lock
+        self.active = {}
+        self.finished = []
+        self.skipped = []
+        self.learned = []
+        self.messages = []
+        # only used by the renderer thread
+        self.messages_seen = 0
+        self.finished_seen = 0
+        self.finished_bytes = 0
+        self.lines = 0
+        self.start = time.monotonic()
+        self.samples = [(self.start, 0)]
+        self.tty = self.stream.isatty()
+        self.stopped = threading.Event()
+        self.thread = None
+        if show and len(jobs) > 0:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def open(self, name: str, size: int = None, expected: bool = True) -> Transfer:
+        """
+        Start counting the bytes of a file
+
+        Args:
+            size: bytes the file will take, if known
+            expected: size is part of the total already
+        """
+        transfer = Transfer(name, size)
+        if size and not expected:
+            self.learned.append(size)
+        self.active[id(transfer)] = transfer
+        return transfer
+
+    def close(self, transfer: Transfer):
+        self.finished.append(transfer)
+        self.active.pop(id(transfer), None)
+
+    def skip(self, size: int):
+        """
+        Count a file that was installed without transferring it
+        """
+        self.skipped.append(size)
+
+    def message(self, text: str):
+        """
+        Show a line above the progress, e.g. a warning of a worker, from
+        the renderer thread so it does not cut through a frame
+        """
+        if self.thread is None:
+            # nothing is drawn that it could garble
+            print(text, file=self.stream, flush=True)
+            return
+        self.messages.append(text)
+
+    def get_messages(self) -> list:
+        # messages are only ever appended, take the new ones
+        messages = self.messages
+        count = len(messages)
+        new = messages[self.messages_seen:count]
+        self.messages_seen = count
+        return new
+
+    def job_done(self, job: dict):
+        for phase in job['phases']:
+            self.phase_done[phase] += 1
+        self.files_done += 1
+
+    def get_done(self) -> tuple:
+        """
+        Returns:
+            (bytes transferred, bytes done including skipped files, transfers
+            in flight)
+        """
+        # finished transfers are only ever appended, sum the new ones
+        finished = self.finished
+        count = len(finished)
+        for transfer in finished[self.finished_seen:count]:
+            self.finished_bytes += transfer.done
+        self.finished_seen = count
+        active = list(self.active.copy().values())
+        transferred = self.finished_bytes + sum(t.done for t in active)
+        return transferred, transferred + sum(self.skipped), active
+
+    def get_transferred(self) -> int:
+        """
+        Bytes transferred so far, unlike get_done() safe from any thread
+        """
+        # a transfer closing meanwhile is in both, count it once
+        transfers = {id(transfer): transfer for transfer in self.active.copy().values()}
+        transfers.update((id(transfer), transfer) for transfer in list(self.finished))
+        return sum(transfer.done for transfer in transfers.values())
+
+    def get_rate(self, transferred: int) -> float:
+        """
+        Bytes per second over the last PROGRESS_RATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        self.samples.append((now, transferred))
+        while len(self.samples) > 2 and now - self.samples[0][0] > PROGRESS_RATE_WINDOW:
+            self.samples.pop(0)
+        first_time, first_bytes = self.samples[0]
+        if now - first_time < 1e-3:
+            return 0.0
+        return (transferred - first_bytes) / (now - first_time)
+
+    def get_status(self) -> tuple:
+        """
+        Returns:
+            (summary line, transfers in flight)
+        """
+        transferred, done, active = self.get_done()
+        rate = self.get_rate(transferred)
+        total = max(self.total + sum(self.learned), done)
+        eta = format_duration((total - done) / rate) if rate > 0 else '?'
+        summary = (f"{self.files_done}/{self.files} files, "
+                   f"{format_size(done)}/{format_size(total)}, "
+                   f"{format_size(rate)}/s, ETA {eta}")
+        return summary, active
+
+    def render(self):
+        summary, active = self.get_status()
+        messages = self.get_messages()
+        if not self.tty:
+            for message in messages:
+                print(message, file=self.stream)
+            print(f"Progress: {summary}", file=self.stream, flush=True)
+            return
+        width = shutil.get_terminal_size().columns - 1
+        lines = [f"{phase}: {self.phase_done[phase]:>4}/{total:<4}"
+                 for phase, total in self.phases.items()]
+        lines.append(f"  {summary}, {len(active)} in flight")
+        now = time.monotonic()
+        # longest running first, they hold up the end of the queue
+        for transfer in sorted(active, key=lambda t: t.start)[:PROGRESS_SLOWEST]:
+            elapsed = now - transfer.start
+            percent = (f"{100 * transfer.done / transfer.size:3.0f}%"
+                       if transfer.size else '   ?')
+            lines.append(f"  {percent} {format_size(transfer.done / elapsed if elapsed else 0)}/s "
+                         f"{elapsed:5.1f}s {transfer.name}")
+        # messages stay above the frame, it is redrawn below them
+        text = ''.join(message + '\n' for message in messages)
+        text += ''.join(line[:width] + '\n' for line in lines)
+        if self.lines > 0:
+            # back to the first line of the last frame and clear it
+            text = f"\x1b[{self.lines}F\x1b[J" + text
+        self.stream.write(text)
+        self.stream.flush()
+        self.lines = len(lines)
+
+    def run(self):
+        interval = PROGRESS_INTERVAL if self.tty else PROGRESS_LOG_INTERVAL
+        while not self.stopped.wait(interval):
+            self.render()
+
+    def stop(self):
+        """
+        Stop the renderer thread and draw the final state
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.render()
+
+
+def format_size(size: float) -> str:
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
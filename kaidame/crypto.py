@@ -0,0 +1,270 @@
+"""
+The .enc format of the encrypted client jars in ./getters/client
+
+pycryptodome is only imported once something is encrypted or decrypted.
+"""
+import base64
+import concurrent.futures
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from . import console
+
+# binary .enc format: header, then chunks each sealed with AES-GCM
+ENC_MAGIC = b'KDENC\x00'
+ENC_VERSION = 2
+ENC_CHUNK_SIZE = 1024 * 1024
+ENC_TAG_SIZE = 16
+# magic, version, chunk size, nonce prefix
+ENC_HEADER = struct.Struct('>6sBI8s')
+# base64 characters read at once from the legacy CBC format
+LEGACY_CHUNK_SIZE = 1024 * 1024
+CLIENT_DIR = './getters/client'
+
+
+class DecryptionError(ValueError):
+    """
+    An encrypted file that cannot be decrypted, trying again will not help
+    """
+
+
+def encrypt_file(key: bytes, in_path: str, out_path: str,
+                 chunk_size: int = ENC_CHUNK_SIZE):
+    """
+    Encrypt the file into the chunked .enc format, one chunk in memory at a
+    time
+
+    Every chunk is sealed with AES-GCM under the nonce prefix of the header
+    and its index, and authenticates the header and whether it is the last
+    chunk, so chunks cannot be reordered, swapped between files or dropped.
+    """
+    from Crypto.Random import get_random_bytes
+    prefix = get_random_bytes(8)
+    header = ENC_HEADER.pack(ENC_MAGIC, ENC_VERSION, chunk_size, prefix)
+    tmp_path = out_path + '.tmp'
+    with open(in_path, 'rb') as infile, open(tmp_path, 'wb') as outfile:
+        outfile.write(header)
+        index = 0
+        chunk = infile.read(chunk_size)
+        while True:
+            # read ahead to know if this chunk is the last one
+            next_chunk = infile.read(chunk_size) if len(chunk) == chunk_size else b''
+            final = len(next_chunk) == 0
+            cipher = get_chunk_cipher(key, header, index, final)
+            ct, tag = cipher.encrypt_and_digest(chunk)
+            outfile.write(ct)
+            outfile.write(tag)
+            if final:
+                break
+            chunk = next_chunk
+            index += 1
+    os.replace(tmp_path, out_path)
+
+
+def get_chunk_cipher(key: bytes, header: bytes, index: int, final: bool):
+    """
+    AES-GCM cipher of one chunk of the .enc format
+    """
+    from Crypto.Cipher import AES
+    prefix = header[-8:]
+    cipher = AES.new(key, AES.MODE_GCM,
+                     nonce=prefix + struct.pack('>I', index),
+                     mac_len=ENC_TAG_SIZE)
+    cipher.update(header + struct.pack('>I?', index, final))
+    return cipher
+
+
+def read_enc_header(in_path: str) -> bytes:
+    """
+    Header of a .enc file, None for files in the legacy CBC format
+
+    Raises:
+        DecryptionError: the file is in a newer format
+    """
+    with open(in_path, 'rb') as file:
+        header = file.read(ENC_HEADER.size)
+    if not header.startswith(ENC_MAGIC):
+        return None
+    if len(header) < ENC_HEADER.size:
+        raise DecryptionError(f'{in_path} is truncated')
+    _, version, _, _ = ENC_HEADER.unpack(header)
+    if version != ENC_VERSION:
+        raise DecryptionError(f'{in_path} has unsupported format version {version}')
+    return header
+
+
+def get_enc_chunks(in_path: str, header: bytes) -> list:
+    """
+    Chunks of a .enc file
+
+    Returns:
+        list of (index, offset in the file, ciphertext length)
+    """
+    _, _, chunk_size, _ = ENC_HEADER.unpack(header)
+    record_size = chunk_size + ENC_TAG_SIZE
+    body = os.path.getsize(in_path) - ENC_HEADER.size
+    count = max(1, -(-body // record_size))
+    last = body - (count - 1) * record_size - ENC_TAG_SIZE
+    if last < 0:
+        raise DecryptionError(f'{in_path} is truncated')
+    return [(index, ENC_HEADER.size + index * record_size,
+             chunk_size if index < count - 1 else last)
+            for index in range(count)]
+
+
+def decrypt_chunk(key: bytes, in_path: str, out_path: str, header: bytes,
+                  chunk: tuple, final: bool) -> int:
+    """
+    Decrypt one chunk of a .enc file into its place in out_path
+
+    Returns:
+        ciphertext bytes read, for progress
+
+    Raises:
+        DecryptionError: the chunk does not authenticate
+    """
+    _, _, chunk_size, _ = ENC_HEADER.unpack(header)
+    index, offset, length = chunk
+    with open(in_path, 'rb') as infile:
+        infile.seek(offset)
+        ct = infile.read(length)
+        tag = infile.read(ENC_TAG_SIZE)
+    cipher = get_chunk_cipher(key, header, index, final)
+    try:
+        pt = cipher.decrypt_and_verify(ct, tag)
+    except ValueError:
+        raise DecryptionError(f'{in_path}: chunk {index} failed authentication '
+                              '(wrong key or corrupted file)')
+    with open(out_path, 'r+b') as outfile:
+        outfile.seek(index * chunk_size)
+        outfile.write(pt)
+    return length + ENC_TAG_SIZE
+
+
+def decrypt_file(key: bytes, in_path: str, out_path: str,
+                 executor: ThreadPoolExecutor = None, progress=None):
+    """
+    Decrypt a .enc file, in either the chunked or the legacy CBC format
+
+    Args:
+        executor: decrypt chunks in parallel on this pool
+        progress: called with the number of bytes of in_path processed
+    """
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    header = read_enc_header(in_path)
+    tmp_path = out_path + '.tmp'
+    try:
+        if header is None:
+            decrypt_legacy_file(key, in_path, tmp_path, progress)
+        else:
+            chunks = get_enc_chunks(in_path, header)
+            with open(tmp_path, 'wb') as outfile:
+                outfile.truncate(sum(length for _, _, length in chunks))
+            args = [(key, in_path, tmp_path, header, chunk,
+                     chunk is chunks[-1]) for chunk in chunks]
+            if executor is None:
+                done = (decrypt_chunk(*arg) for arg in args)
+            else:
+                done = concurrent.futures.as_completed(
+                    [executor.submit(decrypt_chunk, *arg) for arg in args])
+            for result in done:
+                read = result if executor is None else result.result()
+                if progress:
+                    progress(read)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def decrypt_legacy_file(key: bytes, in_path: str, out_path: str,
+                        progress=None):
+    """
+    Decrypt the file from the legacy base64 AES-CBC format
+    """
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import pad, unpad
+    processed = 0
+    total_size = os.path.getsize(in_path)
+
+    cipher = AES.new(key, AES.MODE_CBC)
+
+    with open(in_path, 'rb') as infile, open(out_path, 'wb') as outfile:
+        while True:
+            chunk = infile.read(LEGACY_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            processed += len(chunk)
+            if progress:
+                progress(len(chunk))
+
+            # Decode base64
+            chunk = base64.b64decode(chunk)
+
+            # For last chunk, handle padding
+            if len(chunk) % AES.block_size != 0:
+                chunk = pad(chunk, AES.block_size)
+
+            # Decrypt and write
+            pt = cipher.decrypt(chunk)
+
+            # Remove padding from last chunk
+            if processed >= total_size:
+                pt = unpad(pt, AES.block_size)
+
+            outfile.write(pt)
+
+
+def generate_key():
+    from Crypto.Random import get_random_bytes
+    return get_random_bytes(32)
+
+
+def read_key():
+    try:
+        with open('key', 'r') as file:
+            key = file.read()
+    except FileNotFoundError:
+        raise FileNotFoundError('Key not found! Please create a ./key first.')
+    return base64.b64decode(key)
+
+
+def save_key(key):
+    key = base64.b64encode(key).decode('utf-8')
+    with open('key', 'w') as file:
+        file.write(key)
+
+
+def migrate_crypto_client_files():
+    """
+    Re-encrypt ./getters/client/*.jar.enc still in the legacy CBC format
+    """
+    if not os.path.exists(CLIENT_DIR):
+        return
+    key = read_key()
+    for file in os.listdir(CLIENT_DIR):
+        in_path = f'{CLIENT_DIR}/{file}'
+        if not file.endswith('.jar.enc') or read_enc_header(in_path):
+            continue
+        print(f"Migrating {file}... ", end='')
+        plain_path = in_path + '.plain'
+        try:
+            decrypt_legacy_file(key, in_path, plain_path)
+            encrypt_file(key, plain_path, in_path)
+        finally:
+            if os.path.exists(plain_path):
+                os.remove(plain_path)
+        print(f'{console.GREEN}Done!{console.CLEAR} ')
+
+
+def get_crypto_client_files() -> list:
+    """
+    Names of the jars ./getters/client/*.jar.enc decrypt to
+    """
+    if not os.path.exists(CLIENT_DIR):
+        return []
+    return [file[:-4] for file in os.listdir(CLIENT_DIR)
+            if file.endswith('.jar.enc')]
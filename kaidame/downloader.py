@@ -0,0 +1,751 @@
+"""
+Downloading, caching and placing the files of resolved rows
+"""
+import concurrent.futures
+import hashlib
+import heapq
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import console
+from .cache import ArtifactCache
+from .config import Config, GETTERS, HASH_ALGOS, PHASES
+from .crypto import DecryptionError, decrypt_file
+from .files import link_file
+from .net import HTTPClient, OfflineMiss
+from .resolver import Resolver
+from .telemetry import Telemetry, TransferTimer, get_profile_item, set_profile_item
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# seconds of throughput WorkerLimit measures before it changes the workers
+WORKER_SAMPLE_INTERVAL = 0.5
+# share the throughput has to rise by for more workers to be kept
+WORKER_GAIN = 1.1
+
+
+class DownloadFailed(Exception):
+    """
+    A row that could not be installed, with the error of its last attempt
+    """
+
+    def __init__(self, filename: str, dir: str, attempts: int, error: Exception):
+        super().__init__(f"{filename}: {error}")
+        self.filename = filename
+        self.dir = dir
+        self.attempts = attempts
+        self.error = error
+
+
+class IncompleteDownload(ValueError):
+    """
+    The connection ended before the whole body arrived, the .part file
+    can be resumed
+    """
+
+
+def get_error_status(error: Exception) -> int:
+    """
+    HTTP status of a failed request, for requests and aiohttp errors
+    """
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return response.status_code
+    return getattr(error, 'status', None)
+
+
+def get_retry_after(error: Exception) -> float:
+    """
+    Seconds a 429/503 response asked to wait with Retry-After, if any
+    """
+    response = getattr(error, 'response', None)
+    headers = response.headers if response is not None else getattr(
+        error, 'headers', None)
+    if get_error_status(error) not in (429, 503) or not headers:
+        return None
+    retry_after = headers.get('retry-after')
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        date = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether another attempt could succeed
+    """
+    status = get_error_status(error)
+    if status is not None:
+        return status >= 500 or status in (408, 429)
+    # resolving found no file for the game version or loader
+    return not isinstance(error, (IndexError, KeyError, DecryptionError, OfflineMiss))
+
+
+def get_content_length(headers) -> int:
+    """
+    Size of the body on the wire, None if unknown or compressed
+    """
+    if headers.get('content-encoding', 'identity') != 'identity':
+        return None
+    content_length = headers.get('content-length')
+    return int(content_length) if content_length else None
+
+
+def check_download(downloaded: int, content_length: int, size: int,
+                   hasher, hashes: dict, offset: int = 0):
+    """
+    Raise ValueError if a finished download does not match what was expected
+
+    Args:
+        downloaded: bytes received in this response
+        offset: bytes that were already on disk when it was resumed
+    """
+    RED, CLEAR = console.RED, console.CLEAR
+    if content_length is not None and downloaded != content_length:
+        raise IncompleteDownload(f"{RED}Download incomplete: {
+                                 downloaded}/{content_length} bytes{CLEAR} ")
+    if size is not None and offset + downloaded != size:
+        raise ValueError(f"{RED}Size mismatch: got {
+                         offset + downloaded}, expected {size} bytes{CLEAR} ")
+    if hasher and hasher.hexdigest() != hashes[hasher.name].lower():
+        raise ValueError(f"{RED}{hasher.name} mismatch: got {
+                         hasher.hexdigest()}, expected {hashes[hasher.name]}{CLEAR} ")
+
+
+def read_part_meta(part_path: str) -> dict:
+    meta_path = part_path + '.json'
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as file:
+            return json.load(file)
+    except (ValueError, IOError):
+        return None
+
+
+def remove_part(part_path: str):
+    for path in [part_path, part_path + '.json']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_resume_headers(url: str, part_path: str, size: int = None) -> tuple:
+    """
+    Request headers to resume a partial download
+
+    Args:
+        size: expected size of the file, a .part file that already has as
+            many bytes can not be resumed and is removed
+
+    Returns:
+        (bytes already on disk, headers), (0, {}) if it can not be resumed
+    """
+    meta = read_part_meta(part_path)
+    if meta is None or meta.get('url') != url or not os.path.exists(part_path):
+        return 0, {}
+    offset = os.path.getsize(part_path)
+    if offset == 0:
+        return 0, {}
+    if size is not None and offset >= size:
+        # interrupted after the last byte, or longer than the file: the
+        # server would answer the Range with a 416
+        remove_part(part_path)
+        return 0, {}
+    # the server only sends the rest if the file did not change meanwhile
+    return offset, {'Range': f'bytes={offset}-', 'If-Range': meta['validator']}
+
+
+def open_part(part_path: str, url: str, status: int, headers,
+              offset: int, hasher) -> tuple:
+    """
+    Open the .part file for a response
+
+    Appends to it when the server resumed the download, otherwise starts
+    over. Remembers the validator of the response, so an interrupted
+    download can be resumed by a later attempt or run.
+
+    Returns:
+        (file, bytes already on disk)
+    """
+    content_range = headers.get('content-range', '')
+    if status == 206 and offset > 0 and content_range.startswith(f'bytes {offset}-'):
+        if hasher:
+            with open(part_path, 'rb') as file:
+                while True:
+                    chunk = file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+        mode = 'ab'
+    else:
+        offset = 0
+        mode = 'wb'
+    etag = headers.get('etag')
+    if etag is not None and etag.startswith('W/'):
+        # weak ETags can not be used in If-Range
+        etag = None
+    validator = etag or headers.get('last-modified')
+    if headers.get('accept-ranges') == 'bytes' and validator:
+        with open(part_path + '.json', 'w') as file:
+            json.dump({'url': url, 'validator': validator}, file)
+    elif os.path.exists(part_path + '.json'):
+        os.remove(part_path + '.json')
+    return open(part_path, mode), offset
+
+
+def discard_part(part_path: str, error: Exception):
+    """
+    Clean up after a failed attempt, keeping .part files that can be resumed
+    """
+    import requests
+    corrupt = (isinstance(error, ValueError)
+               and not isinstance(error, (IncompleteDownload, requests.RequestException)))
+    # a 416 means the .part file can never be resumed
+    if corrupt or get_error_status(error) == 416 or read_part_meta(part_path) is None:
+        remove_part(part_path)
+
+
+class PartDownload:
+    """
+    One attempt at downloading a file through its .part file, the part of
+    fetching a file that does not depend on the HTTP library
+
+    Args:
+        size: expected size in bytes, if known
+        hashes: expected hashes by algorithm (sha512, sha1, md5), if known
+    """
+
+    def __init__(self, url: str, dir: str, filename: str,
+                 size: int = None, hashes: dict = None):
+        self.url = url
+        self.size = size
+        self.hashes = hashes or {}
+        algo = next((algo for algo in HASH_ALGOS if algo in self.hashes), None)
+        self.hasher = hashlib.new(algo) if algo else None
+        os.makedirs(dir, exist_ok=True)
+        self.path = os.path.join(dir, filename)
+        self.part_path = self.path + '.part'
+        self.offset, self.headers = get_resume_headers(url, self.part_path, size)
+        self.content_length = None
+        self.downloaded = 0
+
+    def needs_restart(self, status: int) -> bool:
+        """
+        Check if the server refused the Range request, so the .part file
+        has to be removed with restart() and the file requested again
+        """
+        # the .part file is complete or longer than the file
+        return status == 416 and self.offset > 0
+
+    def restart(self):
+        remove_part(self.part_path)
+        self.offset = 0
+        self.headers = {}
+
+    def open(self, status: int, headers):
+        """
+        Open the .part file for the response, see open_part()
+
+        Returns:
+            file
+        """
+        self.content_length = get_content_length(headers)
+        file, self.offset = open_part(self.part_path, self.url, status, headers,
+                                      self.offset, self.hasher)
+        return file
+
+    def get_total_size(self) -> int:
+        if self.content_length:
+            return self.offset + self.content_length
+        return self.size
+
+    def finish(self):
+        """
+        Verify the closed .part file and rename it into place
+
+        Raises:
+            ValueError if it does not match what was expected
+        """
+        check_download(self.downloaded, self.content_length, self.size,
+                       self.hasher, self.hashes, self.offset)
+        os.replace(self.part_path, self.path)
+        remove_part(self.part_path)
+
+
+def get_job_filename(job: dict) -> str:
+    if job['entry'] is None:
+        return job['frame']['filename']
+    return job['entry']['filename']
+
+
+def get_job_size(job: dict) -> int:
+    """
+    Bytes a job moves, None if its entry does not say
+    """
+    if 'decrypt' in job:
+        return job['decrypt']['source']['size']
+    if job['entry'] is None:
+        return None
+    return job['entry'].get('size')
+
+
+def get_job_order(jobs: list) -> list:
+    """
+    Order to start jobs in: largest first, so the longest transfers run
+    alongside the small ones instead of alone at the end of the queue
+
+    Jobs of unknown size count as the average of the known sizes.
+
+    Returns:
+        indexes into jobs
+    """
+    sizes = [get_job_size(job) for job in jobs]
+    known = [size for size in sizes if size]
+    average = sum(known) / len(known) if len(known) > 0 else 0
+    # sorted() is stable, equal sizes keep the order of the CSVs
+    return sorted(range(len(jobs)), key=lambda i: -(sizes[i] or average))
+
+
+class WorkerLimit:
+    """
+    How many jobs run at once
+
+    Starts at Config.min_threads and doubles every WORKER_SAMPLE_INTERVAL
+    for as long as the throughput rises by WORKER_GAIN, up to
+    Config.threads. The first doubling that does not pay off is undone and
+    the count stays there for the rest of the queue.
+    """
+
+    def __init__(self, minimum: int, maximum: int):
+        self.maximum = maximum
+        self.limit = max(1, min(minimum, maximum))
+        self.settled = self.limit >= maximum
+        # (rate, limit) of the fastest sample
+        self.best = None
+        # (time, bytes) the current sample started at
+        self.sample = None
+
+    def update(self, now: float, transferred: int, busy: bool) -> int:
+        """
+        Take a throughput sample
+
+        Args:
+            now: time.monotonic()
+            transferred: bytes moved by the queue so far
+            busy: jobs are waiting for a worker, samples are only taken
+                while the limit is what holds the queue back
+
+        Returns:
+            the number of jobs to run at once
+        """
+        if self.settled:
+            return self.limit
+        if not busy or self.sample is None:
+            self.sample = (now, transferred)
+            return self.limit
+        start, start_bytes = self.sample
+        if now - start < WORKER_SAMPLE_INTERVAL:
+            return self.limit
+        rate = (transferred - start_bytes) / (now - start)
+        self.sample = (now, transferred)
+        if self.best is None or rate > self.best[0] * WORKER_GAIN:
+            self.best = (rate, self.limit)
+            self.limit = min(self.maximum, self.limit * 2)
+            self.settled = self.best[1] >= self.maximum
+        else:
+            self.limit = self.best[1]
+            self.settled = True
+        return self.limit
+
+
+def build_jobs(tables: dict) -> list:
+    """
+    Merge resolved getters into one deduplicated list of download jobs
+
+    A file wanted by several CSVs or in several directories is downloaded
+    once and copied into every other target directory.
+
+    Args:
+        tables: csv name -> (frame, entry) pairs, see Resolver.get_entries()
+
+    Returns:
+        jobs with the row, its entry (None if not resolved yet), the target
+        directories and the progress bars (phases) it counts towards
+    """
+    jobs = {}
+    for csv_name, items in tables.items():
+        for frame, entry in items:
+            if isinstance(entry, Exception):
+                # rows that failed to resolve get another try while downloading
+                entry = None
+            key = entry['url'] if entry is not None else (frame['url'], frame['loader'])
+            job = jobs.get(key)
+            if job is None:
+                job = {'frame': frame, 'entry': entry, 'targets': [], 'phases': []}
+                jobs[key] = job
+            if GETTERS[csv_name] not in job['targets']:
+                job['targets'].append(GETTERS[csv_name])
+            if PHASES[csv_name] not in job['phases']:
+                job['phases'].append(PHASES[csv_name])
+    return list(jobs.values())
+
+
+def print_failures(results: list) -> int:
+    """
+    Report the rows that could not be installed
+
+    Returns:
+        number of failed rows
+    """
+    RED, CLEAR = console.RED, console.CLEAR
+    failures = [result for result in results if isinstance(result, Exception)]
+    if len(failures) == 0:
+        return 0
+    print(f"{RED}Failed to install {len(failures)} files:{CLEAR} ")
+    for failure in failures:
+        if isinstance(failure, DownloadFailed):
+            print(f"{RED}  {failure.dir}{failure.filename}: {failure.error} "
+                  f"(after {failure.attempts} attempts){CLEAR} ")
+        else:
+            print(f"{RED}  {failure}{CLEAR} ")
+    return len(failures)
+
+
+class Downloader:
+    """
+    Installs jobs from build_jobs(): resolves what is left, downloads into
+    the artifact cache and links the file into every target directory
+    """
+
+    def __init__(self, config: Config, http: HTTPClient, cache: ArtifactCache,
+                 telemetry: Telemetry, resolver: Resolver):
+        self.config = config
+        self.http = http
+        self.cache = cache
+        self.telemetry = telemetry
+        self.resolver = resolver
+        self.decrypt_pool = None
+        self.decrypt_pool_lock = threading.Lock()
+        # display of the running queue, see run_jobs()
+        self.progress = console.ProgressRenderer([], show=False)
+
+    def get_decrypt_pool(self) -> ThreadPoolExecutor:
+        """
+        Thread pool the chunks of encrypted client jars are decrypted on
+
+        Kept apart from the download workers so a few large jars use every
+        core without holding up the network jobs.
+        """
+        with self.decrypt_pool_lock:
+            if self.decrypt_pool is None:
+                self.decrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+            return self.decrypt_pool
+
+    def get_retry_delay(self, attempt: int, error: Exception = None) -> float:
+        """
+        Seconds to wait before retrying after the given (0-based) attempt
+
+        Honours Retry-After, otherwise exponential backoff with full jitter so
+        workers that failed together do not retry together.
+        """
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.config.retry_after_max)
+        return random.uniform(0, min(self.config.backoff_max,
+                                     self.config.backoff_base * 2 ** attempt))
+
+    def fetch_file(self, url, dir, filename, quiet=False,
+                   size: int = None, hashes: dict = None):
+        """
+        Download a file into dir, a single attempt
+
+        The response is streamed into a .part file next to the destination and
+        renamed into place only once its size and hash match the expected ones.
+        If the connection drops, the .part file is resumed with a Range request
+        by the next attempt, or by the next run.
+
+        Args:
+            size: expected size in bytes, if known
+            hashes: expected hashes by algorithm (sha512, sha1, md5), if known
+
+        Raises:
+            requests.RequestException, ValueError or IOError
+        """
+        import requests
+        part = None
+        transfer = None
+        try:
+            part = PartDownload(url, dir, filename, size, hashes)
+            timer = TransferTimer(self.telemetry, filename, url)
+            response = self.http.get(url, stream=True, headers=part.headers)
+            if part.needs_restart(response.status_code):
+                response.close()
+                part.restart()
+                response = self.http.get(url, stream=True)
+            timer.response()
+            if not response.ok:
+                # give the connection back to the pool before raising
+                response.close()
+            response.raise_for_status()
+
+            file = part.open(response.status_code, response.headers)
+            total_size = part.get_total_size()
+            transfer = self.progress.open(filename, total_size, size is not None)
+            transfer.update(part.offset)
+
+            shown = 0
+            with response, file:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    part.downloaded += len(chunk)
+                    timer.write_chunk(file, part.hasher, chunk)
+                    transfer.update(len(chunk))
+                    # redrawing for every chunk would cost more than the chunk
+                    if (not quiet and total_size
+                            and time.monotonic() - shown >= console.PROGRESS_INTERVAL):
+                        console.show_progress(part.offset + part.downloaded, total_size)
+                        shown = time.monotonic()
+
+            if not quiet:
+                if total_size:
+                    console.show_progress(part.offset + part.downloaded, total_size)
+                print()  # New line after download
+            timer.done(part.downloaded)
+            part.finish()
+        except (requests.RequestException, ValueError, IOError) as e:
+            if part is not None:
+                discard_part(part.part_path, e)
+            raise
+        finally:
+            if transfer is not None:
+                self.progress.close(transfer)
+
+    def download_file(self, url, dir, filename, max_retries=5, quiet=False,
+                      size: int = None, hashes: dict = None):
+        """
+        Download a file into dir, retrying with backoff, see fetch_file()
+        """
+        import requests
+        for attempt in range(max_retries):
+            try:
+                self.fetch_file(url, dir, filename, quiet, size, hashes)
+                return True
+            except (requests.RequestException, ValueError, IOError) as e:
+                if attempt == max_retries - 1 or not is_retryable(e):
+                    print(f"\n{console.RED}Error downloading {filename}: "
+                          f"{str(e)}{console.CLEAR} ")
+                    return False
+                prefix = ''
+                if self.config.use_threading:
+                    prefix = '\n'
+                print(f"{prefix}{console.YELLOW}Something went wrong. Retrying download... (attempt {
+                      attempt + 2}/{max_retries}){console.CLEAR} ")
+                time.sleep(self.get_retry_delay(attempt, e))
+
+    def check_online(self, entry: dict):
+        """
+        Raises:
+            OfflineMiss: the file of entry would have to be downloaded while offline
+        """
+        if self.config.offline:
+            raise OfflineMiss(f"{entry['filename']} is not in the artifact cache, "
+                              "cannot download it offline")
+
+    @staticmethod
+    def place_job(job: dict, source: str):
+        """
+        Install the file of a job into each of its target directories from source
+        """
+        filename = job['entry']['filename']
+        for dir in job['targets']:
+            os.makedirs(dir, exist_ok=True)
+            path = os.path.join(dir, filename)
+            if os.path.exists(path) and os.path.samefile(path, source):
+                continue
+            link_file(source, path)
+
+    def decrypt_job(self, job: dict) -> bool:
+        """
+        Decrypt the jar of a job from Installer.get_crypto_client_jobs(), its
+        chunks in parallel on the decrypt pool
+        """
+        decrypt = job['decrypt']
+        size = os.path.getsize(decrypt['path'])
+        transfer = self.progress.open(job['entry']['filename'], size)
+        try:
+            with self.telemetry.span('decrypt',
+                                     get_profile_item(job['entry']['filename'])) as span:
+                decrypt_file(decrypt['key'], decrypt['path'],
+                             os.path.join(job['targets'][0], job['entry']['filename']),
+                             self.get_decrypt_pool(), transfer.update)
+                span['bytes'] = size
+        finally:
+            self.progress.close(transfer)
+        return True
+
+    def install_job(self, job: dict) -> bool:
+        """
+        Resolve and download a job into its first target directory and link it
+        into the others, a single attempt that raises on failure
+
+        Files already in the artifact cache are linked from there instead.
+        """
+        set_profile_item(job)
+        if 'decrypt' in job:
+            return self.decrypt_job(job)
+        if job['entry'] is None:
+            job['entry'] = self.resolver.resolve_file(job['frame'], job['frame']['loader'])
+        entry = job['entry']
+        source = self.lookup_job(job)
+        if source is None:
+            self.fetch_file(entry['url'], job['targets'][0], entry['filename'], True,
+                            entry.get('size'), entry.get('hashes'))
+            source = self.store_job(job)
+        self.place_job(job, source)
+        return True
+
+    def lookup_job(self, job: dict) -> str:
+        """
+        Path of the file of a resolved job in the artifact cache
+
+        Returns:
+            None if it has to be downloaded
+
+        Raises:
+            OfflineMiss: it has to be downloaded while offline
+        """
+        source = self.cache.lookup(job['entry'])
+        if source is None:
+            self.check_online(job['entry'])
+        else:
+            self.progress.skip(os.path.getsize(source))
+        return source
+
+    def store_job(self, job: dict) -> str:
+        """
+        Add the downloaded file of a job to the artifact cache
+
+        Returns:
+            its path in the first target directory
+        """
+        source = os.path.join(job['targets'][0], job['entry']['filename'])
+        self.cache.store(source, job['entry'], self.progress)
+        return source
+
+    def run_jobs(self, jobs: list) -> list:
+        """
+        Install jobs with the configured engine, see Config.use_async
+
+        Returns:
+            list aligned with jobs, True for installed files and DownloadFailed
+            for the others
+        """
+        if len(jobs) == 0:
+            return []
+        self.progress = console.ProgressRenderer(jobs, self.config.progress)
+        try:
+            if self.config.use_async:
+                import asyncio
+                from .aio import run_jobs_async
+                results = asyncio.run(run_jobs_async(self, jobs))
+            else:
+                results = self.run_jobs_threaded(jobs)
+        finally:
+            self.progress.stop()
+            self.progress = console.ProgressRenderer([], show=False)
+        if self.config.use_cache:
+            self.cache.evict()
+        return results
+
+    def run_jobs_threaded(self, jobs: list, max_attempts: int = None) -> list:
+        """
+        Install jobs on the thread pool
+
+        Every job is tried once and only the jobs that failed are queued again,
+        after an exponential backoff with jitter or the server's Retry-After,
+        until they succeed or run out of attempts.
+
+        Returns:
+            list aligned with jobs, True for installed files and DownloadFailed
+            for the others
+        """
+        if max_attempts is None:
+            max_attempts = self.config.max_attempts
+        results = [None] * len(jobs)
+        attempts = [0] * len(jobs)
+        order = get_job_order(jobs)
+        rank = {i: position for position, i in enumerate(order)}
+        # (not before, rank, job), the ranks are in order so this is a heap
+        queue = [(0, rank[i], i) for i in order]
+        running = {}
+        if self.config.use_threading:
+            limit = WorkerLimit(self.config.min_threads, self.config.threads)
+        else:
+            limit = WorkerLimit(1, 1)
+        # thread -> [first job start, seconds busy], each only written by its thread
+        workers = {}
+
+        def run(job: dict):
+            start = time.perf_counter()
+            try:
+                return self.install_job(job)
+            finally:
+                worker = workers.setdefault(threading.get_ident(), [start, 0])
+                worker[1] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=limit.maximum) as executor:
+            while len(queue) > 0 or len(running) > 0:
+                now = time.monotonic()
+                # jobs are waiting for a worker, not for their backoff
+                busy = len(running) >= limit.limit or (
+                    len(queue) > 0 and queue[0][0] <= now)
+                wanted = limit.update(now, self.progress.get_transferred(), busy)
+                # Submit the jobs that are due, largest first
+                while (len(queue) > 0 and queue[0][0] <= now
+                       and len(running) < wanted):
+                    _, _, i = heapq.heappop(queue)
+                    attempts[i] += 1
+                    running[executor.submit(run, jobs[i])] = i
+                timeout = None
+                if len(queue) > 0 and len(running) < wanted:
+                    timeout = max(0, queue[0][0] - now)
+                if not limit.settled:
+                    # wake up for the next throughput sample
+                    timeout = (WORKER_SAMPLE_INTERVAL if timeout is None
+                               else min(timeout, WORKER_SAMPLE_INTERVAL))
+                if len(running) == 0:
+                    time.sleep(timeout)
+                    continue
+                done, _ = concurrent.futures.wait(
+                    running, timeout=timeout,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                # Update progress as downloads complete
+                for future in done:
+                    i = running.pop(future)
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        if attempts[i] < max_attempts and is_retryable(e):
+                            delay = self.get_retry_delay(attempts[i] - 1, e)
+                            heapq.heappush(queue, (time.monotonic() + delay, rank[i], i))
+                            continue
+                        results[i] = DownloadFailed(
+                            get_job_filename(jobs[i]), jobs[i]['targets'][0],
+                            attempts[i], e)
+                    self.progress.job_done(jobs[i])
+        end = time.perf_counter()
+        self.telemetry.record_workers(
+            [(busy, end - first) for first, busy in workers.values()],
+            end - start, limit.limit, limit.maximum)
+        return results
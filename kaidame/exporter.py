@@ -0,0 +1,532 @@
+"""
+Exporting the pack as zip archives and applying delta exports
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import console
+from .config import Config
+from .files import hash_file
+
+# exports store these as is, they are compressed already
+EXPORT_STORED_EXTENSIONS = ('.jar', '.zip', '.png')
+EXPORT_COMPRESS_LEVEL = 6
+EXPORT_INDEX_VERSION = 1
+# delta exports, see Exporter.apply_delta()
+DELTA_MANIFEST = 'delta.json'
+DELTA_VERSION = 1
+DELTA_STAGING = '.delta-staging'
+DELTA_BACKUP = '.delta-backup'
+DELTA_JOURNAL = '.delta-journal.json'
+
+
+class ZipStreamWriter:
+    """
+    Minimal zip writer for entries that are already compressed
+
+    Entries are written front to back with their sizes and CRC known up
+    front, so the output needs no seeking and can be a pipe. Zip64 records
+    are added when sizes, offsets or the entry count need them.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.offset = 0
+        self.entries = []
+
+    def write(self, data: bytes):
+        self.fp.write(data)
+        self.offset += len(data)
+
+    def add(self, arcname: str, date_time: tuple, method: int, crc: int,
+            size: int, compress_size: int, chunks):
+        """
+        Write one entry
+
+        Args:
+            method: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED
+            chunks: iterable of the compressed bytes, compress_size in total
+        """
+        name = arcname.encode('utf-8')
+        flags = 0x800 if not arcname.isascii() else 0
+        zip64 = size >= 0xFFFFFFFF or compress_size >= 0xFFFFFFFF
+        extra = struct.pack('<HHQQ', 1, 16, size, compress_size) if zip64 else b''
+        dostime = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+        dosdate = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+        entry = {
+            'name': name, 'flags': flags, 'method': method, 'dostime': dostime,
+            'dosdate': dosdate, 'crc': crc, 'size': size,
+            'compress_size': compress_size, 'offset': self.offset,
+        }
+        self.write(struct.pack(
+            '<4s5H3L2H', b'PK\x03\x04', 45 if zip64 else 20, flags, method,
+            dostime, dosdate, crc,
+            0xFFFFFFFF if zip64 else compress_size,
+            0xFFFFFFFF if zip64 else size, len(name), len(extra)))
+        self.write(name + extra)
+        written = 0
+        for chunk in chunks:
+            self.write(chunk)
+            written += len(chunk)
+        if written != compress_size:
+            raise ValueError(f'{arcname} changed while it was exported')
+        self.entries.append(entry)
+
+    def close(self):
+        """
+        Write the central directory
+        """
+        start = self.offset
+        for entry in self.entries:
+            values = [entry['size'], entry['compress_size'], entry['offset']]
+            zip64 = [value for value in values if value >= 0xFFFFFFFF]
+            extra = struct.pack(f'<HH{len(zip64)}Q', 1, 8 * len(zip64),
+                                *zip64) if zip64 else b''
+            self.write(struct.pack(
+                '<4s6H3L5H2L', b'PK\x01\x02', 45 if zip64 else 20,
+                45 if zip64 else 20, entry['flags'], entry['method'],
+                entry['dostime'], entry['dosdate'], entry['crc'],
+                min(entry['compress_size'], 0xFFFFFFFF),
+                min(entry['size'], 0xFFFFFFFF),
+                len(entry['name']), len(extra), 0, 0, 0, 0,
+                min(entry['offset'], 0xFFFFFFFF)))
+            self.write(entry['name'] + extra)
+        end = self.offset
+        count = len(self.entries)
+        if count >= 0xFFFF or start >= 0xFFFFFFFF or end - start >= 0xFFFFFFFF:
+            self.write(struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45,
+                                   0, 0, count, count, end - start, start))
+            self.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, end, 1))
+        self.write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0, min(count, 0xFFFF),
+            min(count, 0xFFFF), min(end - start, 0xFFFFFFFF),
+            min(start, 0xFFFFFFFF), 0))
+        self.fp.flush()
+
+
+def get_export_files(source_dir: str, includes: list, extensions: list) -> list:
+    """
+    Files that go into an export
+
+    Returns:
+        list of (path, name in the archive)
+    """
+    files = []
+    # Add folders and specific files
+    for item in includes:
+        path = os.path.join(source_dir, item)
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for file in sorted(names):
+                    file_path = os.path.join(root, file)
+                    arc_path = os.path.relpath(file_path, source_dir)
+                    files.append((file_path, arc_path.replace(os.sep, '/')))
+        elif os.path.isfile(path):
+            files.append((path, os.path.basename(path)))
+
+    # Add files with specific extensions
+    for file in sorted(os.listdir(source_dir)):
+        if any(file.endswith(ext) for ext in extensions):
+            files.append((os.path.join(source_dir, file), file))
+    return files
+
+
+def read_export_index(zip_path: str) -> dict:
+    """
+    Entries of the previous export of zip_path, if the archive is still
+    the one the index was written for
+    """
+    try:
+        with open(zip_path + '.index.json', 'r') as file:
+            index = json.load(file)
+        stat = os.stat(zip_path)
+    except (OSError, ValueError):
+        return {}
+    if (index.get('version') != EXPORT_INDEX_VERSION
+            or index.get('archive') != [stat.st_size, stat.st_mtime_ns]):
+        return {}
+    return index['entries']
+
+
+def write_export_index(zip_path: str, entries: dict):
+    stat = os.stat(zip_path)
+    with open(zip_path + '.index.json', 'w') as file:
+        json.dump({'version': EXPORT_INDEX_VERSION,
+                   'archive': [stat.st_size, stat.st_mtime_ns],
+                   'entries': entries}, file, indent=2, sort_keys=True)
+
+
+def prepare_export_entry(path: str, arcname: str, record: dict) -> dict:
+    """
+    Compress or checksum one file for ZipStreamWriter, on a worker thread
+
+    Args:
+        record: index entry of the file from the previous export, if the
+            file still matches it the old compressed entry is reused
+
+    Returns:
+        dict with the zip fields of the entry, 'data' holds the deflated
+        bytes and is None for entries stored as is or reused
+    """
+    stat = os.stat(path)
+    method = (zipfile.ZIP_STORED if path.lower().endswith(EXPORT_STORED_EXTENSIONS)
+              else zipfile.ZIP_DEFLATED)
+    mtime = time.localtime(stat.st_mtime)
+    prepared = {
+        'path': path, 'arcname': arcname, 'method': method, 'size': stat.st_size,
+        'date_time': max(mtime[:6], (1980, 1, 1, 0, 0, 0)), 'data': None,
+        'reuse': False, 'record': {'size': stat.st_size,
+                                   'mtime_ns': stat.st_mtime_ns},
+    }
+    if (record is not None and record['size'] == stat.st_size
+            and record['method'] == method):
+        if record['mtime_ns'] == stat.st_mtime_ns:
+            sha1 = record['sha1']
+        else:
+            sha1 = hash_file(path)['sha1']
+        if sha1 == record['sha1']:
+            prepared.update(reuse=True, crc=record['crc'],
+                            compress_size=record['compress_size'])
+            prepared['record'].update(record, mtime_ns=stat.st_mtime_ns)
+            return prepared
+
+    crc = 0
+    sha1 = hashlib.sha1()
+    compressor = zlib.compressobj(EXPORT_COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    data = []
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            crc = zlib.crc32(chunk, crc)
+            sha1.update(chunk)
+            if method == zipfile.ZIP_DEFLATED:
+                data.append(compressor.compress(chunk))
+    if method == zipfile.ZIP_DEFLATED:
+        data.append(compressor.flush())
+        prepared['data'] = b''.join(data)
+        compress_size = len(prepared['data'])
+    else:
+        compress_size = stat.st_size
+    prepared.update(crc=crc, compress_size=compress_size)
+    prepared['record'].update(method=method, crc=crc, sha1=sha1.hexdigest(),
+                              compress_size=compress_size)
+    return prepared
+
+
+def read_file_chunks(path: str, offset: int = 0, length: int = None):
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        while length is None or length > 0:
+            chunk = file.read(1024 * 1024 if length is None
+                              else min(1024 * 1024, length))
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+
+
+def get_entry_data_offset(zip_path: str, info: zipfile.ZipInfo) -> int:
+    """
+    Where the compressed bytes of an entry of zip_path start
+    """
+    with open(zip_path, 'rb') as file:
+        file.seek(info.header_offset)
+        header = file.read(30)
+    name_length, extra_length = struct.unpack('<2H', header[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+
+def read_delta_base(path: str) -> dict:
+    """
+    Files of an earlier export and their sha1
+
+    Args:
+        path: <zip>.index.json of a full export, or a delta archive, whose
+            manifest describes the pack after applying it
+
+    Returns:
+        name in the archive -> sha1
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            delta = json.loads(zf.read(DELTA_MANIFEST))
+        if delta.get('version') != DELTA_VERSION:
+            raise ValueError(f'{path} has unsupported delta version')
+        return delta['files']
+    with open(path, 'r') as file:
+        index = json.load(file)
+    if index.get('version') != EXPORT_INDEX_VERSION:
+        raise ValueError(f'{path} is not an export index')
+    return {arc: entry['sha1'] for arc, entry in index['entries'].items()}
+
+
+def get_delta_files(files: list, base: dict) -> tuple:
+    """
+    Files changed since base, hashed on the thread pool
+
+    Returns:
+        (changed files as (path, name in the archive), DELTA_MANIFEST content)
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        hashes = list(executor.map(lambda file: hash_file(file[0])['sha1'], files))
+    current = {arc: sha1 for (_, arc), sha1 in zip(files, hashes)}
+    changed = [(path, arc) for path, arc in files if base.get(arc) != current[arc]]
+    deleted = sorted(arc for arc in base if arc not in current)
+    return changed, {
+        'version': DELTA_VERSION,
+        'files': current,
+        'base': {arc: base[arc] for _, arc in changed if arc in base}
+        | {arc: base[arc] for arc in deleted},
+        'deleted': deleted,
+    }
+
+
+def get_delta_path(root: str, arcname: str) -> str:
+    """
+    Where a file of a delta goes, refusing names that leave root
+    """
+    path = os.path.normpath(os.path.join(root, arcname))
+    if os.path.isabs(arcname) or not path.startswith(root + os.sep):
+        raise ValueError(f'Refusing to write {arcname} outside of {root}')
+    return path
+
+
+def rollback_delta(root: str) -> bool:
+    """
+    Undo a delta whose Exporter.apply_delta() was interrupted, from its journal
+
+    Returns:
+        True if there was anything to undo
+    """
+    journal_path = os.path.join(root, DELTA_JOURNAL)
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path, 'r') as file:
+        journal = json.load(file)
+    backup = os.path.join(root, DELTA_BACKUP)
+    for arcname in reversed(journal['files']):
+        path = get_delta_path(root, arcname)
+        backup_path = os.path.join(backup, arcname)
+        if os.path.exists(backup_path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(backup_path, path)
+        elif arcname not in journal['existed'] and os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(backup, ignore_errors=True)
+    os.remove(journal_path)
+    return True
+
+
+class Exporter:
+    """
+    Makes full and delta exports of the root directory of a Config and
+    applies delta exports to it
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    def export_zip(self, zip_path: str, includes: list, extensions: list,
+                   output: str = None, since: str = None) -> bool:
+        """
+        Export files and folders of the root directory into a zip
+
+        Already compressed types are stored as is and the rest is deflated on
+        the thread pool. Entries of files unchanged since the last export to
+        zip_path are copied from it without compressing them again.
+
+        Args:
+            output: where to write the archive, zip_path by default and '-'
+                for stdout
+            since: manifest of an earlier export, see read_delta_base(). Only
+                the files that changed since are exported, with DELTA_MANIFEST
+                listing the deleted ones, for Exporter.apply_delta()
+        """
+        source_dir = self.config.root
+        if since is not None and output is None:
+            root, ext = os.path.splitext(zip_path)
+            output = f'{root}-delta{ext}'
+        output = output or zip_path
+        to_stdout = output == '-'
+        log = sys.stderr if to_stdout else sys.stdout
+        # an earlier export is only reused when it is what gets rewritten
+        index = read_export_index(output) if not to_stdout and since is None else {}
+        tmp_path = output + '.tmp'
+        reused = 0
+        old = fp = None
+        try:
+            files = get_export_files(source_dir, includes, extensions)
+            if since is not None:
+                files, delta = get_delta_files(files, read_delta_base(since))
+            old = zipfile.ZipFile(output) if len(index) > 0 else None
+            fp = sys.stdout.buffer if to_stdout else open(tmp_path, 'wb')
+            entries = {}
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                writer = ZipStreamWriter(fp)
+                # a window of files is compressed ahead of the writer
+                window = os.cpu_count() * 2
+                futures = [executor.submit(prepare_export_entry, path, arc,
+                                           index.get(arc))
+                           for path, arc in files[:window]]
+                for i in range(len(files)):
+                    prepared = futures[i].result()
+                    futures[i] = None
+                    if i + window < len(files):
+                        path, arc = files[i + window]
+                        futures.append(executor.submit(
+                            prepare_export_entry, path, arc, index.get(arc)))
+                    if prepared['reuse']:
+                        reused += 1
+                        info = old.getinfo(prepared['arcname'])
+                        chunks = read_file_chunks(
+                            output, get_entry_data_offset(output, info),
+                            prepared['compress_size'])
+                    elif prepared['data'] is not None:
+                        chunks = [prepared['data']]
+                    else:
+                        chunks = read_file_chunks(prepared['path'])
+                    writer.add(prepared['arcname'], prepared['date_time'],
+                               prepared['method'], prepared['crc'],
+                               prepared['size'], prepared['compress_size'], chunks)
+                    entries[prepared['arcname']] = prepared['record']
+                if since is not None:
+                    data = json.dumps(delta, indent=2, sort_keys=True).encode()
+                    compressed = zlib.compress(data, EXPORT_COMPRESS_LEVEL, wbits=-15)
+                    writer.add(DELTA_MANIFEST, time.localtime()[:6],
+                               zipfile.ZIP_DEFLATED, zlib.crc32(data), len(data),
+                               len(compressed), [compressed])
+                writer.close()
+            if not to_stdout:
+                if old is not None:
+                    old.close()
+                    old = None
+                fp.close()
+                fp = None
+                os.replace(tmp_path, output)
+                if since is None:
+                    write_export_index(output, entries)
+            destination = 'stdout' if to_stdout else output
+            if since is not None:
+                print(f"{console.GREEN}Exported {len(entries)} changed files and "
+                      f"{len(delta['deleted'])} deletions to {destination}{console.CLEAR} ",
+                      file=log)
+            else:
+                print(f"{console.GREEN}Exported {len(entries)} files to {destination} "
+                      f"({reused} unchanged){console.CLEAR} ", file=log)
+            return True
+
+        except Exception as e:
+            print(f"Error exporting {os.path.basename(zip_path)}: {e}", file=log)
+            return False
+        finally:
+            if old is not None:
+                old.close()
+            if fp is not None and not to_stdout:
+                fp.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def export_server(self, output: str = None, since: str = None) -> bool:
+        """Export server files and folders to server.zip"""
+        return self.export_zip(
+            os.path.join(self.config.root, "server.zip"),
+            ["config", "mods", "plugins"], [".sh", ".bat", ".jar", ".yml"],
+            output, since)
+
+    def export_client(self, output: str = None, since: str = None) -> bool:
+        """Export client files and folders to client.zip"""
+        return self.export_zip(
+            os.path.join(self.config.root, "client.zip"),
+            ["mods", "config"], [], output, since)
+
+    def apply_delta(self, path: str) -> bool:
+        """
+        Apply a delta archive from export_zip() to the root directory
+
+        Files that were changed locally since the base of the delta are not
+        overwritten. Every file is extracted and checked against its sha1
+        before anything is touched, then all of them are swapped in, with the
+        replaced files kept aside until the end so that a failure, even an
+        interrupted run, rolls the whole delta back.
+        """
+        root = self.config.root
+        staging = os.path.join(root, DELTA_STAGING)
+        backup = os.path.join(root, DELTA_BACKUP)
+        journal_path = os.path.join(root, DELTA_JOURNAL)
+        try:
+            if rollback_delta(root):
+                print(f"{console.YELLOW}Rolled back an interrupted delta{console.CLEAR} ")
+            with zipfile.ZipFile(path) as zf:
+                delta = json.loads(zf.read(DELTA_MANIFEST))
+                if delta.get('version') != DELTA_VERSION:
+                    raise ValueError(f'{path} has unsupported delta version')
+                names = [info.filename for info in zf.infolist()
+                         if info.filename != DELTA_MANIFEST]
+
+                # local changes would be lost
+                conflicts = []
+                for arcname in names + delta['deleted']:
+                    target = get_delta_path(root, arcname)
+                    if not os.path.exists(target):
+                        continue
+                    sha1 = hash_file(target)['sha1']
+                    if sha1 not in (delta['base'].get(arcname), delta['files'].get(arcname)):
+                        conflicts.append(arcname)
+                if len(conflicts) > 0:
+                    print(f"{console.RED}Not applying {path}, these files were changed "
+                          f"locally:{console.CLEAR} ")
+                    for arcname in conflicts:
+                        print(f"{console.RED}  {arcname}{console.CLEAR} ")
+                    return False
+
+                # extract and verify everything first
+                shutil.rmtree(staging, ignore_errors=True)
+                for arcname in names:
+                    staged = get_delta_path(staging, arcname)
+                    os.makedirs(os.path.dirname(staged), exist_ok=True)
+                    sha1 = hashlib.sha1()
+                    with zf.open(arcname) as src, open(staged, 'wb') as dst:
+                        while chunk := src.read(1024 * 1024):
+                            sha1.update(chunk)
+                            dst.write(chunk)
+                    if sha1.hexdigest() != delta['files'].get(arcname):
+                        raise ValueError(f'{arcname} does not match its sha1')
+
+            # swap the files in, keeping what they replace until the end
+            files = names + delta['deleted']
+            existed = [arcname for arcname in files
+                       if os.path.exists(get_delta_path(root, arcname))]
+            with open(journal_path, 'w') as file:
+                json.dump({'files': files, 'existed': existed}, file)
+            try:
+                for arcname in files:
+                    target = get_delta_path(root, arcname)
+                    if arcname in existed:
+                        backup_path = get_delta_path(backup, arcname)
+                        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+                        os.replace(target, backup_path)
+                    if arcname in names:
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        os.replace(get_delta_path(staging, arcname), target)
+            except BaseException:
+                rollback_delta(root)
+                raise
+            os.remove(journal_path)
+            shutil.rmtree(backup, ignore_errors=True)
+            print(f"{console.GREEN}Applied {path}: {len(names)} files updated, "
+                  f"{len(delta['deleted'])} removed{console.CLEAR} ")
+            return True
+
+        except Exception as e:
+            print(f"{console.RED}Error applying {path}: {e}{console.CLEAR} ")
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
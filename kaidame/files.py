@@ -0,0 +1,137 @@
+"""
+Files on disk: hashing, the manifest of a directory and linking
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+
+from .config import HASH_ALGOS, MANIFEST
+
+
+def hash_file(path: str, algos: list = ['sha1']) -> dict:
+    """
+    Hash a file with several algorithms in one read
+    """
+    hashers = {algo: hashlib.new(algo) for algo in algos}
+    with open(path, 'rb') as file:
+        # empty files cannot be mapped
+        if os.fstat(file.fileno()).st_size > 0:
+            # hashlib releases the GIL on large buffers, so mapped files
+            # hash in parallel from threads without copying
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for hasher in hashers.values():
+                    hasher.update(data)
+    return {algo: hasher.hexdigest() for algo, hasher in hashers.items()}
+
+
+def stat_source(path: str) -> dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_manifest(dir: str) -> dict:
+    """
+    Read the manifest of a directory, filename -> record
+    """
+    path = os.path.join(dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (ValueError, IOError):
+        # a broken manifest only costs re-hashing
+        return {}
+
+
+def write_manifest(dir: str, manifest: dict):
+    os.makedirs(dir, exist_ok=True)
+    path = os.path.join(dir, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def manifest_record(dir: str, filename: str, url: str = None,
+                    hashes: dict = None, source: dict = None) -> dict:
+    """
+    Describe a file in a directory for its manifest
+    """
+    record = stat_source(os.path.join(dir, filename))
+    record['hashes'] = dict(hashes or {})
+    if url is not None:
+        record['url'] = url
+    if source is not None:
+        record['source'] = source
+    return record
+
+
+def get_file_hash(dir: str, filename: str, algo: str, manifest: dict) -> str:
+    """
+    Hash of a file on disk, taken from the manifest while the file is unchanged
+    """
+    path = os.path.join(dir, filename)
+    stat = stat_source(path)
+    record = manifest.get(filename)
+    if (record is None or record.get('size') != stat['size']
+            or record.get('mtime_ns') != stat['mtime_ns']):
+        record = dict(stat, hashes={})
+        manifest[filename] = record
+    if algo not in record['hashes']:
+        record['hashes'].update(hash_file(path, [algo]))
+    return record['hashes'][algo]
+
+
+def is_up_to_date(dir: str, entry: dict, manifest: dict) -> bool:
+    """
+    Check whether the file of a resolved entry is already installed in dir
+    """
+    filename = entry['filename']
+    path = os.path.join(dir, filename)
+    if not os.path.isfile(path):
+        return False
+    if entry.get('size') is not None and os.path.getsize(path) != entry['size']:
+        return False
+    for algo in HASH_ALGOS:
+        if algo in entry.get('hashes', {}):
+            return get_file_hash(dir, filename, algo, manifest) == entry['hashes'][algo]
+    # nothing to verify against, trust files this script installed from the same url
+    record = manifest.get(filename)
+    return record is not None and record.get('url') == entry['url']
+
+
+def reflink_file(src: str, dst: str) -> bool:
+    """
+    Copy-on-write clone src to dst where the filesystem supports it
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, 'rb') as infile, open(dst, 'wb') as outfile:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_file(src: str, dst: str):
+    """
+    Make dst the same file as src: a hardlink, a reflink or a copy,
+    whichever works first
+    """
+    tmp_path = dst + '.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        if not reflink_file(src, tmp_path):
+            shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
@@ -0,0 +1,466 @@
+"""
+Installing the getters into ./mods and ./plugins: clean installs, syncs
+and verification
+"""
+import concurrent.futures
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import console
+from .config import Config, GETTERS, HASH_ALGOS, MANIFEST, PHASES
+from .crypto import CLIENT_DIR, get_crypto_client_files, read_key
+from .downloader import (
+    DownloadFailed, Downloader, build_jobs, print_failures, remove_part,
+)
+from .files import (
+    hash_file, is_up_to_date, manifest_record, read_manifest, stat_source,
+    write_manifest,
+)
+from .jars import JarIndex, get_jar_problems
+from .resolver import Resolver
+
+# stat cache of --verify, in the cache directory
+VERIFY_CACHE = 'verify.json'
+
+
+def clear_dir(dir: str, extensions=['.jar', '.zip']):
+    """
+    Clear the directory
+    """
+    if not os.path.exists(dir):
+        return
+    print(f"Clearing {dir}... ", end='')
+    for file in os.listdir(dir):
+        if any(file.endswith(ext) for ext in extensions):
+            os.remove(dir + file)
+    print(f'{console.GREEN}Done!{console.CLEAR} ')
+
+
+def hash_installed_file(path: str, algos: list, cache: dict) -> dict:
+    """
+    Hash an installed file, reusing the cached hashes while its size,
+    mtime and inode are unchanged
+
+    Returns:
+        the file's record for the verify cache
+    """
+    stat = os.stat(path)
+    current = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+               'ino': stat.st_ino}
+    record = cache.get(os.path.abspath(path))
+    if record is None or any(record.get(key) != value
+                             for key, value in current.items()):
+        record = dict(current, hashes={})
+    missing = [algo for algo in algos if algo not in record['hashes']]
+    if len(missing) > 0:
+        record = dict(record, hashes=dict(record['hashes'],
+                                          **hash_file(path, missing)))
+    return record
+
+
+class Installer:
+    """
+    Puts the files of getters CSVs in place with a Downloader and checks
+    what is installed
+    """
+
+    def __init__(self, config: Config, resolver: Resolver, downloader: Downloader):
+        self.config = config
+        self.resolver = resolver
+        self.downloader = downloader
+
+    def get_crypto_client_jobs(self, phase: str, manifest: dict = None) -> list:
+        """
+        Jobs decrypting ./getters/client/*.jar.enc into ./mods
+
+        They run in the same queue as the downloads, see
+        Downloader.decrypt_job().
+
+        Args:
+            phase: progress bar the jobs count towards
+            manifest: manifest of ./mods, files whose source did not change
+                since they were recorded in it are not decrypted again
+        """
+        # install files from ./getters/client
+        if not os.path.exists(CLIENT_DIR):
+            return []
+        jobs = []
+        for file in sorted(os.listdir(CLIENT_DIR)):
+            # check if file is a jar file
+            if file.endswith('.jar.enc'):
+                in_path = f'{CLIENT_DIR}/{file}'
+                source = stat_source(in_path)
+                if manifest is not None:
+                    record = manifest.get(file[:-4])
+                    if (record is not None and record.get('source') == source
+                            and os.path.exists(f'./mods/{file[:-4]}')):
+                        continue
+                jobs.append({'frame': None, 'entry': {'filename': file[:-4]},
+                             'targets': ['mods/'], 'phases': [phase],
+                             'decrypt': {'path': in_path, 'source': source}})
+        if len(jobs) == 0:
+            return []
+        try:
+            key = read_key()
+        except Exception as e:
+            print(f'{console.YELLOW}{e} Skipping encrypted stuff...{console.CLEAR} ')
+            return []
+        for job in jobs:
+            job['decrypt']['key'] = key
+        return jobs
+
+    def download_files(self, csv_names: list, bulk_only: bool = False) -> list:
+        """
+        Download the files of several getters CSVs through one shared queue
+
+        The encrypted client jars are decrypted in the same queue when
+        client.csv is one of them.
+
+        Returns:
+            results of Downloader.run_jobs()
+        """
+        jobs = []
+        if 'client.csv' in csv_names:
+            jobs += self.get_crypto_client_jobs(PHASES['client.csv'])
+        jobs += build_jobs(self.resolver.get_entries(csv_names, bulk_only))
+        return self.downloader.run_jobs(jobs)
+
+    def install(self, csv_names: list) -> bool:
+        """
+        Clean install: empty ./mods and ./plugins and download everything
+
+        Returns:
+            True if every file was installed
+        """
+        clear_dir('mods/')
+        clear_dir('plugins/')
+        ok = print_failures(
+            self.download_files(csv_names, self.config.use_async)) == 0
+        if self.config.check_jars:
+            self.check(csv_names)
+        return ok
+
+    def sync(self, csv_names: list, tables: dict = None) -> bool:
+        """
+        Bring ./mods and ./plugins in line with the given getters CSVs
+
+        Only missing or changed files are downloaded and only files that are
+        no longer wanted are removed. What got installed is kept in each
+        directory's manifest so unchanged files are not re-hashed next time.
+
+        Args:
+            tables: resolved getters, see Resolver.get_entries(), resolved
+                from csv_names if not given
+
+        Returns:
+            True if everything is in place
+        """
+        if tables is None:
+            tables = self.resolver.get_entries(csv_names)
+        wanted = {dir: [] for dir in GETTERS.values()}
+        results = []
+        for csv_name, items in tables.items():
+            dir = GETTERS[csv_name]
+            for frame, entry in items:
+                if isinstance(entry, Exception):
+                    results.append(DownloadFailed(frame['filename'], dir, 1, entry))
+                else:
+                    wanted[dir].append((frame, entry))
+        # decrypted client jars are managed by get_crypto_client_jobs()
+        keep = set(get_crypto_client_files()) if 'client.csv' in csv_names else set()
+
+        manifests = {}
+        jobs = {}
+        for dir, items in wanted.items():
+            manifest = manifests[dir] = read_manifest(dir)
+            desired = {entry['filename'] for _, entry in items} | keep
+            # remove what is no longer wanted
+            removed = 0
+            if os.path.exists(dir):
+                for file in os.listdir(dir):
+                    if file.endswith(('.jar', '.zip')) and file not in desired:
+                        os.remove(os.path.join(dir, file))
+                        removed += 1
+                    elif file.endswith('.part') and file[:-5] not in desired:
+                        remove_part(os.path.join(dir, file))
+            for file in list(manifest):
+                if file not in desired:
+                    del manifest[file]
+            # queue what is missing or changed, once for all directories
+            seen = set()
+            missing = 0
+            for frame, entry in items:
+                if entry['filename'] in seen:
+                    continue
+                seen.add(entry['filename'])
+                if not is_up_to_date(dir, entry, manifest):
+                    missing += 1
+                    job = jobs.setdefault(entry['url'], {
+                        'frame': frame, 'entry': entry, 'targets': [], 'phases': []})
+                    job['targets'].append(dir)
+                    job['phases'].append(f"[ 🔄 ] Syncing {dir:<8}")
+            print(f"Syncing {dir}: {len(desired) - missing - len(keep)} up to date, "
+                  f"{missing} to download, {removed} removed")
+
+        jobs = list(jobs.values())
+        if len(keep) > 0:
+            jobs = self.get_crypto_client_jobs(
+                f"[ 🔄 ] Syncing {'mods/':<8}", manifests['mods/']) + jobs
+        synced = self.downloader.run_jobs(jobs)
+        results += synced
+        for job, result in zip(jobs, synced):
+            if result is not True:
+                continue
+            entry = job['entry']
+            if 'decrypt' in job:
+                # GCM already authenticated the plaintext, keep its hash for --verify
+                hashes = hash_file(os.path.join('mods/', entry['filename']))
+                manifests['mods/'][entry['filename']] = manifest_record(
+                    'mods/', entry['filename'], hashes=hashes,
+                    source=job['decrypt']['source'])
+                continue
+            # fetch_file() already verified the known hashes
+            hashes = entry['hashes'] or hash_file(
+                os.path.join(job['targets'][0], entry['filename']))
+            for dir in job['targets']:
+                manifests[dir][entry['filename']] = manifest_record(
+                    dir, entry['filename'], entry['url'], hashes)
+
+        for dir, manifest in manifests.items():
+            if len(manifest) > 0 or os.path.exists(os.path.join(dir, MANIFEST)):
+                write_manifest(dir, manifest)
+        ok = print_failures(results) == 0
+        if self.config.check_jars:
+            self.check(csv_names)
+        return ok
+
+    def sync_from_mirror(self, mirror: str, csv_names: list) -> bool:
+        """
+        Sync the client from a mirror started with --serve
+
+        Jars go through sync() and are verified against the hashes the
+        mirror publishes. Published config files are replaced where they
+        differ, local config files the mirror does not have are kept.
+
+        Returns:
+            True if everything is in place
+        """
+        from .mirror import MIRROR_DIRS, get_mirror_tables
+        tables, files = get_mirror_tables(self.downloader.http, mirror)
+        ok = self.sync(csv_names, tables)
+        pending = []
+        for row in files:
+            path = row['path']
+            algo = next((algo for algo in HASH_ALGOS if algo in row['hashes']), None)
+            if (not os.path.isfile(path) or os.path.getsize(path) != row['size']
+                    or hash_file(path, [algo])[algo] != row['hashes'][algo]):
+                pending.append(row)
+        print(f"Syncing {', '.join(MIRROR_DIRS)}: {len(files) - len(pending)} up to date, "
+              f"{len(pending)} to download")
+        with ThreadPoolExecutor(max_workers=self.config.threads) as executor:
+            results = list(executor.map(
+                lambda row: self.downloader.download_file(
+                    row['url'], os.path.dirname(row['path']),
+                    os.path.basename(row['path']),
+                    quiet=True, size=row['size'], hashes=row['hashes']),
+                pending))
+        return ok and all(results)
+
+    def read_verify_cache(self) -> dict:
+        """
+        Read the stat cache of verify(), absolute path -> record
+        """
+        if not self.config.use_cache:
+            return {}
+        path = os.path.join(self.config.get_cache_dir(), VERIFY_CACHE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (ValueError, IOError):
+            # a broken cache only costs re-hashing
+            return {}
+
+    def write_verify_cache(self, cache: dict):
+        if not self.config.use_cache:
+            return
+        # the cache is shared by every instance, forget files that are gone
+        cache = {path: record for path, record in cache.items()
+                 if os.path.exists(path)}
+        cache_dir = self.config.get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, VERIFY_CACHE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(cache, file, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def get_expected_files(self, csv_names: list, tables: dict = None) -> dict:
+        """
+        Expected hashes of the files the given getters CSVs install
+
+        Args:
+            tables: resolved getters, resolved from csv_names if not given
+
+        Returns:
+            dir -> filename -> hashes, or the exception if the row did not resolve
+        """
+        if tables is None:
+            tables = self.resolver.get_entries(csv_names)
+        expected = {dir: {} for dir in GETTERS.values()}
+        for csv_name, items in tables.items():
+            dir = GETTERS[csv_name]
+            for frame, entry in items:
+                if isinstance(entry, Exception):
+                    expected[dir].setdefault(frame['filename'], entry)
+                else:
+                    expected[dir][entry['filename']] = entry.get('hashes') or {}
+        if 'client.csv' in csv_names:
+            # decrypted jars are checked against what their unchanged source
+            # decrypted to last time
+            manifest = read_manifest('mods/')
+            for filename in get_crypto_client_files():
+                record = manifest.get(filename, {})
+                source = stat_source(f'{CLIENT_DIR}/{filename}.enc')
+                expected['mods/'][filename] = (
+                    record.get('hashes', {}) if record.get('source') == source else {})
+        return expected
+
+    def verify(self, csv_names: list, tables: dict = None) -> bool:
+        """
+        Check the files installed from the given getters CSVs against their
+        expected hashes
+
+        Files are hashed from memory maps on a thread pool. Their hashes are
+        kept in a stat cache, so files whose size, mtime and inode did not
+        change are not read again. Corrupt files are dropped from the
+        directory manifests, so the next sync() downloads them again.
+
+        Args:
+            tables: resolved getters, resolved from csv_names if not given
+
+        Returns:
+            True if every expected file is present and intact
+        """
+        RED, YELLOW, CLEAR = console.RED, console.YELLOW, console.CLEAR
+        expected = self.get_expected_files(csv_names, tables)
+        cache = self.read_verify_cache()
+        checks = {}
+        missing = []
+        unknown = []
+        unexpected = []
+        for dir, files in expected.items():
+            for filename, hashes in sorted(files.items()):
+                path = os.path.join(dir, filename)
+                if isinstance(hashes, Exception):
+                    unknown.append((path, f'could not be resolved: {hashes}'))
+                    continue
+                algo = next((algo for algo in HASH_ALGOS if algo in hashes), None)
+                if not os.path.isfile(path):
+                    missing.append(path)
+                elif algo is None:
+                    unknown.append((path, 'no known hash'))
+                else:
+                    checks[path] = (dir, filename, algo, hashes[algo].lower(), hashes)
+            if os.path.exists(dir):
+                for file in sorted(os.listdir(dir)):
+                    if file.endswith(('.jar', '.zip')) and file not in files:
+                        unexpected.append(os.path.join(dir, file))
+
+        corrupt = []
+        with ThreadPoolExecutor(max_workers=self.config.verify_workers) as executor:
+            pbar = console.progress_bar(len(checks), "[ 🔍 ] Verifying")
+            futures = {executor.submit(hash_installed_file, path, [check[2]], cache): path
+                       for path, check in checks.items()}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                dir, filename, algo, digest, hashes = checks[path]
+                try:
+                    record = future.result()
+                except OSError as e:
+                    corrupt.append((dir, filename, str(e)))
+                else:
+                    cache[os.path.abspath(path)] = record
+                    if record['hashes'][algo] != digest:
+                        corrupt.append((dir, filename, f'{algo} mismatch'))
+                        # a hardlinked install shares its bytes with the cache
+                        cache_path = self.downloader.cache.path({'hashes': hashes})
+                        if (cache_path is not None and os.path.exists(cache_path)
+                                and os.path.samefile(path, cache_path)):
+                            os.remove(cache_path)
+                pbar.update(1)
+            pbar.close()
+        self.write_verify_cache(cache)
+
+        for dir in expected:
+            manifest = read_manifest(dir)
+            bad = [filename for file_dir, filename, _ in corrupt
+                   if file_dir == dir and filename in manifest]
+            for filename in bad:
+                del manifest[filename]
+            if len(bad) > 0:
+                write_manifest(dir, manifest)
+
+        print(f"Verified {len(checks) - len(corrupt)} files: {len(corrupt)} corrupt, "
+              f"{len(missing)} missing, {len(unexpected)} unexpected, "
+              f"{len(unknown)} unchecked")
+        for dir, filename, reason in sorted(corrupt):
+            print(f"{RED}  {dir}{filename}: {reason}{CLEAR} ")
+        for path in missing:
+            print(f"{RED}  {path}: missing{CLEAR} ")
+        for path in unexpected:
+            print(f"{YELLOW}  {path}: not in the getters{CLEAR} ")
+        for path, reason in unknown:
+            print(f"{YELLOW}  {path}: {reason}{CLEAR} ")
+        if len(corrupt) + len(missing) > 0:
+            print(f"{YELLOW}Run with --sync to repair{CLEAR} ")
+            return False
+        return True
+
+    def check(self, csv_names: list) -> bool:
+        """
+        Look for jars that will not load together in the directories of the
+        given getters CSVs: mod IDs provided by more than one jar and jars
+        built for another loader or Minecraft version
+
+        Jars are hashed through the stat cache of verify() and their
+        metadata is looked up by hash in the JarIndex, so only new jars are
+        opened, on a thread pool.
+
+        Returns:
+            True if no conflicts were found
+        """
+        RED, YELLOW, CLEAR = console.RED, console.YELLOW, console.CLEAR
+        dirs = sorted({GETTERS[csv_name] for csv_name in csv_names})
+        paths = [os.path.join(dir, file) for dir in dirs if os.path.exists(dir)
+                 for file in sorted(os.listdir(dir)) if file.endswith('.jar')]
+        cache = self.read_verify_cache()
+        index = JarIndex(self.config)
+
+        def read_jar(path: str) -> dict:
+            record = hash_installed_file(path, ['sha1'], cache)
+            cache[os.path.abspath(path)] = record
+            return index.lookup(path, record['hashes']['sha1'])
+
+        with ThreadPoolExecutor(max_workers=self.config.verify_workers) as executor:
+            records = dict(zip(paths, executor.map(read_jar, paths)))
+        self.write_verify_cache(cache)
+        index.write()
+
+        errors = []
+        warnings = []
+        for dir in dirs:
+            jars = {os.path.basename(path): record for path, record in records.items()
+                    if os.path.dirname(path) + '/' == dir}
+            dir_errors, dir_warnings = get_jar_problems(
+                dir, jars, self.config.loaders.get(dir, []), self.config.mc_version)
+            errors += dir_errors
+            warnings += dir_warnings
+        print(f"Checked {len(paths)} jars: {len(errors)} conflicts, "
+              f"{len(warnings)} without metadata")
+        for path, reason in errors:
+            print(f"{RED}  {path}: {reason}{CLEAR} ")
+        for path, reason in warnings:
+            print(f"{YELLOW}  {path}: {reason}{CLEAR} ")
+        return len(errors) == 0
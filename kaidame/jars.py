@@ -0,0 +1,368 @@
+"""
+Metadata of installed jars: which mods and plugins they provide and what
+they were built for
+
+Only the zip central directory and the metadata files are read from a jar,
+the rest of it is never decompressed.
+"""
+import json
+import os
+import re
+
+from .config import Config
+
+# metadata of the jars by sha1 of their content, in the cache directory
+JAR_INDEX = 'jars.json'
+# loader -> loaders whose jars it runs
+LOADER_FAMILIES = {
+    'forge': ['forge'],
+    'neoforge': ['neoforge'],
+    'fabric': ['fabric'],
+    'quilt': ['quilt', 'fabric'],
+    'bukkit': ['bukkit'],
+    'spigot': ['bukkit'],
+    'paper': ['bukkit'],
+    'purpur': ['bukkit'],
+}
+
+
+def parse_version(version: str) -> tuple:
+    """
+    Numeric part of a version, e.g. (1, 20, 1) for 1.20.1-pre2
+
+    Returns:
+        None if the version does not start with a number
+    """
+    match = re.match(r'\d+(\.\d+)*', version.strip())
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.group().split('.'))
+
+
+def compare_versions(a: tuple, b: tuple) -> int:
+    # 1.20 is 1.20.0
+    length = max(len(a), len(b))
+    a = a + (0,) * (length - len(a))
+    b = b + (0,) * (length - len(b))
+    return (a > b) - (a < b)
+
+
+def is_in_maven_range(version: str, spec: str) -> bool:
+    """
+    Check a version against a Maven version range of a mods.toml, e.g.
+    [1.20,1.21) or [1.20.1]
+
+    A bare version is only a recommendation and matches everything, so do
+    versions that cannot be compared.
+    """
+    current = parse_version(version)
+    ranges = re.findall(r'([\[(])([^\])]*)([\])])', spec)
+    if current is None or len(ranges) == 0:
+        return True
+    for start, bounds, end in ranges:
+        bounds = [parse_version(bound) if bound.strip() else None
+                  for bound in bounds.split(',')]
+        if len(bounds) == 1:
+            if bounds[0] is None or compare_versions(current, bounds[0]) == 0:
+                return True
+            continue
+        low, high = bounds[0], bounds[-1]
+        if low is not None and compare_versions(current, low) < (0 if start == '[' else 1):
+            continue
+        if high is not None and compare_versions(current, high) > (0 if end == ']' else -1):
+            continue
+        return True
+    return False
+
+
+def is_fabric_match(current: tuple, predicate: str) -> bool:
+    """
+    Check a version against one fabric.mod.json predicate, e.g. >=1.20,
+    ~1.20.1 or 1.20.x
+    """
+    match = re.match(r'(>=|<=|>|<|=|~|\^)?(.*)', predicate)
+    operator, version = match.group(1) or '', match.group(2)
+    if version in ('*', 'x', 'X'):
+        return True
+    parts = version.split('-')[0].split('.')
+    wildcard = next((i for i, part in enumerate(parts) if part in ('x', 'X', '*')),
+                    None)
+    if wildcard is not None:
+        # wildcards only compare the parts before them
+        prefix = parse_version('.'.join(parts[:wildcard]))
+        return prefix is None or current[:len(prefix)] == prefix
+    wanted = parse_version(version)
+    if wanted is None:
+        return True
+    order = compare_versions(current, wanted)
+    if operator == '>=':
+        return order >= 0
+    if operator == '<=':
+        return order <= 0
+    if operator == '>':
+        return order > 0
+    if operator == '<':
+        return order < 0
+    if operator == '~':
+        return order >= 0 and current[:2] == (wanted + (0,))[:2]
+    if operator == '^':
+        return order >= 0 and current[:1] == wanted[:1]
+    return order == 0
+
+
+def is_in_fabric_range(version: str, spec) -> bool:
+    """
+    Check a version against a fabric.mod.json dependency: a list of
+    alternatives, each a string of predicates that all have to match
+    """
+    current = parse_version(version)
+    if current is None:
+        return True
+    if isinstance(spec, str):
+        spec = [spec]
+    return any(all(is_fabric_match(current, predicate)
+                   for predicate in alternative.split())
+               for alternative in spec)
+
+
+def parse_mods_toml(text: str) -> dict:
+    """
+    Read the [[mods]] and [[dependencies.<modId>]] tables of a mods.toml
+
+    Forge itself is lenient about the TOML it accepts, so this reads the
+    file line by line instead of failing on the whole of it.
+
+    Returns:
+        the top level keys, 'mods': list of tables and
+        'dependencies': modId -> list of tables
+    """
+    result = {'mods': [], 'dependencies': {}}
+    table = result
+    closing = None
+    for line in text.splitlines():
+        if closing is not None:
+            # inside a multi-line string
+            if closing in line:
+                closing = None
+            continue
+        line = line.strip()
+        if line.startswith('#') or line == '':
+            continue
+        header = re.match(r'\[\[\s*([^\]]+?)\s*\]\]', line)
+        if header is not None:
+            name = header.group(1).replace('"', '')
+            table = {}
+            if name == 'mods':
+                result['mods'].append(table)
+            elif name.startswith('dependencies.'):
+                owner = name.split('.', 1)[1]
+                result['dependencies'].setdefault(owner, []).append(table)
+            continue
+        if line.startswith('['):
+            # other tables, e.g. [modproperties.<modId>]
+            table = {}
+            continue
+        pair = re.match(r'([\w\-]+)\s*=\s*(.*)', line)
+        if pair is None:
+            continue
+        key, value = pair.groups()
+        if value.startswith(('"""', "'''")):
+            if value.find(value[:3], 3) < 0:
+                closing = value[:3]
+            continue
+        if value.startswith(('"', "'")):
+            end = value.find(value[0], 1)
+            value = value[1:end if end > 0 else None]
+        else:
+            value = value.split('#')[0].strip()
+            if value in ('true', 'false'):
+                value = value == 'true'
+        table[key] = value
+    return result
+
+
+def parse_plugin_yml(text: str) -> dict:
+    """
+    Read the top level scalars of a plugin.yml, e.g. name and api-version
+    """
+    result = {}
+    for line in text.splitlines():
+        pair = re.match(r'([\w\-]+)\s*:\s*(.*)', line)
+        if pair is None:
+            # indented lines belong to nested sections
+            continue
+        key, value = pair.groups()
+        value = value.split(' #')[0].strip()
+        if value[:1] in ('"', "'") and value.endswith(value[0]) and len(value) > 1:
+            value = value[1:-1]
+        result[key] = value
+    return result
+
+
+def is_required(dependency: dict) -> bool:
+    # mandatory before Forge 1.20.5, type after
+    if 'type' in dependency:
+        return str(dependency['type']).lower() == 'required'
+    return dependency.get('mandatory', True) is not False
+
+
+def get_mods_toml_mods(data: dict) -> list:
+    loader = 'forge'
+    for dependencies in data['dependencies'].values():
+        if any(dependency.get('modId') == 'neoforge' and is_required(dependency)
+               for dependency in dependencies):
+            loader = 'neoforge'
+    mods = []
+    for mod in data['mods']:
+        if 'modId' not in mod:
+            continue
+        minecraft = next(
+            (dependency.get('versionRange') for dependency
+             in data['dependencies'].get(mod['modId'], [])
+             if dependency.get('modId') == 'minecraft' and is_required(dependency)),
+            None)
+        mods.append({'id': mod['modId'], 'version': str(mod.get('version', '')),
+                     'loader': loader, 'minecraft': minecraft})
+    return mods
+
+
+def read_jar_metadata(path: str) -> dict:
+    """
+    Read what a jar provides from its mods.toml, fabric.mod.json and
+    plugin.yml
+
+    Returns:
+        'mods': list of {'id', 'version', 'loader', 'minecraft'}, where
+        minecraft is the version range or plugin api-version the jar needs,
+        and 'error' if the jar could not be read
+    """
+    import zipfile
+    mods = []
+    try:
+        with zipfile.ZipFile(path) as jar:
+            names = set(jar.namelist())
+            if 'META-INF/mods.toml' in names:
+                mods += get_mods_toml_mods(parse_mods_toml(
+                    jar.read('META-INF/mods.toml').decode('utf-8', 'replace')))
+            if 'fabric.mod.json' in names:
+                data = json.loads(jar.read('fabric.mod.json').decode('utf-8-sig'),
+                                  strict=False)
+                if 'id' in data:
+                    mods.append({'id': data['id'],
+                                 'version': str(data.get('version', '')),
+                                 'loader': 'fabric',
+                                 'minecraft': data.get('depends', {}).get('minecraft')})
+            if 'plugin.yml' in names:
+                data = parse_plugin_yml(
+                    jar.read('plugin.yml').decode('utf-8', 'replace'))
+                if 'name' in data:
+                    mods.append({'id': data['name'], 'version': data.get('version', ''),
+                                 'loader': 'bukkit',
+                                 'minecraft': data.get('api-version')})
+    except (zipfile.BadZipFile, ValueError, OSError) as e:
+        return {'mods': mods, 'error': str(e)}
+    return {'mods': mods}
+
+
+def is_minecraft_match(mod: dict, mc_version: str) -> bool:
+    if not mod['minecraft']:
+        return True
+    if mod['loader'] == 'bukkit':
+        # api-version is the oldest API the plugin runs on
+        wanted = parse_version(mod['minecraft'])
+        current = parse_version(mc_version)
+        return wanted is None or current is None or (
+            compare_versions(current[:len(wanted)], wanted) >= 0)
+    if mod['loader'] == 'fabric':
+        return is_in_fabric_range(mc_version, mod['minecraft'])
+    return is_in_maven_range(mc_version, mod['minecraft'])
+
+
+def get_jar_problems(dir: str, jars: dict, loaders: list, mc_version: str) -> tuple:
+    """
+    Look for conflicts between the jars of one directory
+
+    Args:
+        jars: filename -> record of read_jar_metadata()
+        loaders: loaders the directory's jars must be built for
+
+    Returns:
+        (errors, warnings), lists of (path, reason)
+    """
+    accepted = {family for loader in loaders
+                for family in LOADER_FAMILIES.get(loader.lower(), [loader.lower()])}
+    errors = []
+    warnings = []
+    providers = {}
+    for filename, record in sorted(jars.items()):
+        path = os.path.join(dir, filename)
+        if 'error' in record:
+            errors.append((path, f"could not be read: {record['error']}"))
+            continue
+        if len(record['mods']) == 0:
+            warnings.append((path, 'no mods.toml, fabric.mod.json or plugin.yml'))
+            continue
+        mods = [mod for mod in record['mods'] if mod['loader'] in accepted]
+        if len(mods) == 0:
+            built_for = sorted({mod['loader'] for mod in record['mods']})
+            errors.append((path, f"built for {', '.join(built_for)}, "
+                                 f"not {', '.join(loaders)}"))
+            continue
+        for mod in mods:
+            if not is_minecraft_match(mod, mc_version):
+                errors.append((path, f"{mod['id']} needs Minecraft "
+                                     f"{mod['minecraft']}, not {mc_version}"))
+        for id in {mod['id'] for mod in mods}:
+            providers.setdefault(id, []).append(filename)
+    for id, filenames in sorted(providers.items()):
+        if len(filenames) > 1:
+            errors.append((dir, f"{id} is provided by {', '.join(filenames)}"))
+    return errors, warnings
+
+
+class JarIndex:
+    """
+    Metadata of jars by content hash, shared by every instance in the
+    cache directory, so a jar is only opened the first time it is seen
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.records = self.read()
+        self.changed = False
+
+    def read(self) -> dict:
+        if not self.config.use_cache:
+            return {}
+        path = os.path.join(self.config.get_cache_dir(), JAR_INDEX)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (ValueError, IOError):
+            # a broken index only costs reading the jars again
+            return {}
+
+    def write(self):
+        if not self.config.use_cache or not self.changed:
+            return
+        cache_dir = self.config.get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, JAR_INDEX)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.records, file, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def lookup(self, path: str, sha1: str) -> dict:
+        """
+        Metadata of the jar at path, read from it if its hash is not indexed
+        """
+        record = self.records.get(sha1)
+        if record is None:
+            record = read_jar_metadata(path)
+            # unreadable jars are not remembered, they may be retried
+            if 'error' not in record:
+                self.records[sha1] = record
+                self.changed = True
+        return record
@@ -0,0 +1,331 @@
+"""
+LAN mirror of the client pack: --serve publishes it, --client --from
+syncs from it
+
+Imports http.server, so it is only imported when a mirror is used.
+"""
+import hashlib
+import json
+import os
+import shutil
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, urljoin, quote, unquote
+
+from . import console
+from .config import CLIENT_CSVS, GETTERS
+from .downloader import print_failures
+from .files import hash_file, is_up_to_date, read_manifest
+from .installer import Installer
+from .net import HTTPClient
+
+MIRROR_ADDRESS = '0.0.0.0:8770'
+MIRROR_MANIFEST = '/manifest.json'
+MIRROR_VERSION = 1
+# published as they are next to the resolved jars
+MIRROR_DIRS = ['config/']
+MIRROR_STAGING = 'mirror-staging'
+
+
+def parse_range(header: str, size: int) -> tuple:
+    """
+    Parse a single byte range of a Range header
+
+    Returns:
+        (first, last) byte, None to send the whole file
+
+    Raises:
+        ValueError: the range is outside the file
+    """
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                raise ValueError(header)
+            return max(0, size - suffix), size - 1
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        # malformed ranges are ignored, not refused
+        return None
+    if first > last:
+        raise ValueError(header)
+    return first, last
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """
+    Serves the manifest and the files of a mirror, see Mirror.serve()
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_path(head=True)
+
+    def do_GET(self):
+        self.send_path()
+
+    def send_empty(self, status: int, headers: dict = {}):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_path(self, head: bool = False):
+        path = unquote(urlparse(self.path).path)
+        if path == MIRROR_MANIFEST:
+            body, etag = self.server.manifest
+            if self.headers.get('If-None-Match') == etag:
+                return self.send_empty(304, {'ETag': etag})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            return
+        local = self.server.files.get(path)
+        if local is None or not os.path.isfile(local):
+            return self.send_empty(404)
+        with open(local, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            size = stat.st_size
+            etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+            span = None
+            if self.headers.get('If-Range') in (None, etag):
+                try:
+                    span = parse_range(self.headers.get('Range', ''), size)
+                except ValueError:
+                    return self.send_empty(416, {'Content-Range': f'bytes */{size}'})
+            first, last = span or (0, size - 1)
+            self.send_response(200 if span is None else 206)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(last - first + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            if span is not None:
+                self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+            self.end_headers()
+            if head or last < first:
+                return
+            try:
+                # zero-copy where the platform has sendfile()
+                self.connection.sendfile(file, first, last - first + 1)
+            except ConnectionError:
+                # the client went away, it resumes with a Range request
+                self.close_connection = True
+
+
+class Mirror:
+    """
+    Publishes what an Installer would install, from the artifact cache or
+    the installed directories
+    """
+
+    def __init__(self, installer: Installer):
+        self.installer = installer
+        self.config = installer.config
+        self.cache = installer.downloader.cache
+
+    def get_source(self, dir: str, entry: dict, manifest: dict) -> tuple:
+        """
+        Local copy of a resolved entry the mirror can serve
+
+        Args:
+            manifest: manifest of dir
+
+        Returns:
+            (path, hashes), None if neither the artifact cache nor dir has it
+        """
+        cache_path = self.cache.path(entry) if self.config.use_cache else None
+        if (cache_path is not None and os.path.isfile(cache_path)
+                and entry.get('size') in (None, os.path.getsize(cache_path))):
+            return cache_path, entry['hashes']
+        if is_up_to_date(dir, entry, manifest):
+            path = os.path.join(dir, entry['filename'])
+            return path, entry['hashes'] or hash_file(path)
+        return None
+
+    def prefetch(self, tables: dict) -> list:
+        """
+        Download the entries no local copy exists of into the artifact cache,
+        so the mirror serves them instead of every client fetching them upstream
+
+        Returns:
+            results of Downloader.run_jobs()
+        """
+        if not self.config.use_cache:
+            return []
+        staging = os.path.join(self.config.get_cache_dir(), MIRROR_STAGING) + '/'
+        manifests = {}
+        jobs = {}
+        for csv_name, items in tables.items():
+            dir = GETTERS[csv_name]
+            manifest = manifests.setdefault(dir, read_manifest(dir))
+            for frame, entry in items:
+                # only entries with a hash can be kept in the cache
+                if (isinstance(entry, Exception) or self.cache.path(entry) is None
+                        or self.get_source(dir, entry, manifest) is not None):
+                    continue
+                jobs.setdefault(entry['url'], {
+                    'frame': frame, 'entry': entry, 'targets': [staging],
+                    'phases': ["[ 🌐 ] Fetching mirror files  "]})
+        try:
+            return self.installer.downloader.run_jobs(list(jobs.values()))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def build(self, csv_names: list) -> tuple:
+        """
+        Resolve the getters CSVs into the manifest of a mirror
+
+        Jars are published by directory and filename, with the hashes clients
+        verify them against. Entries the mirror has no copy of keep their
+        upstream url. Everything in MIRROR_DIRS is published as it is.
+
+        Returns:
+            (manifest, url path -> local path)
+        """
+        tables = self.installer.resolver.get_entries(csv_names)
+        print_failures(self.prefetch(tables))
+        manifest = {'version': MIRROR_VERSION, 'getters': {}, 'files': []}
+        files = {}
+        manifests = {}
+        for csv_name, items in tables.items():
+            dir = GETTERS[csv_name]
+            dir_manifest = manifests.setdefault(dir, read_manifest(dir))
+            rows = manifest['getters'][csv_name] = []
+            for frame, entry in items:
+                if isinstance(entry, Exception):
+                    print(f"{console.YELLOW}Not publishing {frame['filename']}: {entry}{console.CLEAR} ")
+                    continue
+                row = {'filename': entry['filename'], 'url': entry['url'],
+                       'size': entry.get('size'), 'hashes': entry['hashes']}
+                source = self.get_source(dir, entry, dir_manifest)
+                if source is not None:
+                    path, hashes = source
+                    files[f"/{dir}{entry['filename']}"] = path
+                    row.update(url=quote(f"/{dir}{entry['filename']}"),
+                               size=os.path.getsize(path), hashes=hashes)
+                rows.append(row)
+        for top in MIRROR_DIRS:
+            for root, dirs, filenames in os.walk(top):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path).replace(os.sep, '/')
+                    files[f'/{name}'] = path
+                    manifest['files'].append({
+                        'path': name, 'url': quote(f'/{name}'),
+                        'size': os.path.getsize(path), 'hashes': hash_file(path)})
+        return manifest, files
+
+    def serve(self, address: str = MIRROR_ADDRESS):
+        """
+        Publish the client pack over HTTP until interrupted
+
+        Clients sync from it with --client --from http://<host>:<port>. The
+        manifest is built once on start, restart the mirror after updating.
+        """
+        host, _, port = address.rpartition(':')
+        manifest, files = self.build(CLIENT_CSVS)
+        body = json.dumps(manifest, sort_keys=True).encode()
+        server = ThreadingHTTPServer((host or '0.0.0.0', int(port)), MirrorHandler)
+        server.daemon_threads = True
+        server.manifest = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+        server.files = files
+        upstream = sum(1 for rows in manifest['getters'].values()
+                       for row in rows if urlparse(row['url']).scheme)
+        print(f"{console.GREEN}Serving {len(files)} files on "
+              f"http://{host or '0.0.0.0'}:{server.server_address[1]}/{console.CLEAR} ")
+        if upstream > 0:
+            print(f"{console.YELLOW}{upstream} files are not on this machine, "
+                  f"clients download them upstream{console.CLEAR} ")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+
+def get_mirror_base(mirror: str) -> str:
+    if '://' not in mirror:
+        mirror = 'http://' + mirror
+    return mirror.rstrip('/') + '/'
+
+
+def is_safe_filename(filename: str) -> bool:
+    """
+    Check that a filename from a mirror names a file in the directory it is
+    installed to, and nothing outside of it
+    """
+    return (isinstance(filename, str) and filename not in ('', '.')
+            and not os.path.isabs(filename) and '..' not in filename
+            and not any(sep in filename for sep in ('/', '\\', os.sep)))
+
+
+def get_safe_path(path: str) -> str:
+    """
+    Normalise a path from a mirror
+
+    Returns:
+        the path, None if it is not inside one of MIRROR_DIRS
+    """
+    if not isinstance(path, str) or os.path.isabs(path) or '..' in path.split('/'):
+        return None
+    path = os.path.normpath(path)
+    if not any(path.startswith(os.path.normpath(top) + os.sep) for top in MIRROR_DIRS):
+        return None
+    return path
+
+
+def get_mirror_tables(http: HTTPClient, mirror: str) -> tuple:
+    """
+    Read the manifest of a mirror
+
+    Returns:
+        (csv name -> list of (frame, entry) as Resolver.get_entries() returns,
+         files of MIRROR_DIRS with absolute urls)
+
+    Raises:
+        requests.RequestException or ValueError
+    """
+    base = get_mirror_base(mirror)
+    response = http.get(urljoin(base, MIRROR_MANIFEST.lstrip('/')), timeout=30)
+    response.raise_for_status()
+    manifest = response.json()
+    if manifest.get('version') != MIRROR_VERSION:
+        raise ValueError(f"{mirror} serves an unsupported manifest version "
+                         f"{manifest.get('version')}")
+    tables = {}
+    for csv_name, rows in manifest['getters'].items():
+        if csv_name not in GETTERS:
+            continue
+        tables[csv_name] = []
+        for row in rows:
+            # never write outside mods/ and plugins/
+            if not is_safe_filename(row['filename']):
+                print(f"{console.YELLOW}Ignoring {row['filename']!r} from "
+                      f"{mirror}{console.CLEAR} ")
+                continue
+            entry = {'url': urljoin(base, row['url']), 'filename': row['filename'],
+                     'size': row['size'], 'hashes': row['hashes']}
+            frame = {'url': entry['url'], 'filename': entry['filename'],
+                     'loader': '', 'comment': ''}
+            tables[csv_name].append((frame, entry))
+    files = []
+    for row in manifest['files']:
+        # never write outside the published directories
+        path = get_safe_path(row['path'])
+        if path is None:
+            print(f"{console.YELLOW}Ignoring {row['path']!r} from "
+                  f"{mirror}{console.CLEAR} ")
+            continue
+        files.append(dict(row, path=path, url=urljoin(base, row['url'])))
+    return tables, files
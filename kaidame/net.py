@@ -0,0 +1,267 @@
+"""
+HTTP sessions and the cache of API responses
+
+requests and urllib3 are only imported once the first session is opened.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from .config import Config
+from .telemetry import Telemetry
+
+# seconds the API key is reused for
+CURSEFORGE_KEY_TTL = 60 * 60
+
+
+class OfflineMiss(Exception):
+    """
+    Something that is not cached was needed while offline
+    """
+
+
+def get_adapter_class(telemetry: Telemetry):
+    """
+    requests HTTPAdapter whose pools count and time the connections they
+    open into telemetry
+    """
+    import requests.adapters
+    import urllib3
+
+    class ProfiledHTTPConnection(urllib3.connection.HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            telemetry.record_span('connect', self.host, start,
+                                  time.perf_counter(), self.host)
+
+    class ProfiledHTTPSConnection(urllib3.connection.HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            telemetry.record_span('connect', self.host, start,
+                                  time.perf_counter(), self.host)
+
+    class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+        ConnectionCls = ProfiledHTTPConnection
+
+        def _new_conn(self):
+            telemetry.count_connection(self.host)
+            return super()._new_conn()
+
+    class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+        ConnectionCls = ProfiledHTTPSConnection
+
+        def _new_conn(self):
+            telemetry.count_connection(self.host)
+            return super()._new_conn()
+
+    class PooledAdapter(requests.adapters.HTTPAdapter):
+        """
+        HTTPAdapter that counts the connections its pools open
+        """
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': CountingHTTPConnectionPool,
+                'https': CountingHTTPSConnectionPool,
+            }
+
+    return PooledAdapter
+
+
+class HTTPClient:
+    """
+    Keep-alive sessions per host and JSON API calls through the metadata
+    cache
+    """
+
+    def __init__(self, config: Config, telemetry: Telemetry):
+        self.config = config
+        self.telemetry = telemetry
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.adapter_class = None
+        self.curseforge_key = None
+        self.curseforge_key_time = 0
+        self.curseforge_key_lock = threading.Lock()
+
+    def get_session(self, url: str):
+        """
+        Get the keep-alive session for the host of url
+
+        Sessions are shared by all worker threads, so API calls and file
+        downloads reuse already open connections instead of doing a new
+        TLS handshake every time.
+        """
+        host = urlparse(url).netloc
+        with self.sessions_lock:
+            session = self.sessions.get(host)
+            if session is None:
+                import requests
+                if self.adapter_class is None:
+                    self.adapter_class = get_adapter_class(self.telemetry)
+                session = requests.Session()
+                adapter = self.adapter_class(
+                    pool_connections=4, pool_maxsize=self.config.http_pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[host] = session
+            return session
+
+    def get(self, url: str, **kwargs):
+        return self.get_session(url).get(url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.get_session(url).post(url, **kwargs)
+
+    def get_metadata_path(self, method: str, url: str, params: dict = None,
+                          body=None) -> str:
+        """
+        Where the cached response of an API call is kept
+        """
+        key = json.dumps([method, url, sorted((params or {}).items()), body],
+                         sort_keys=True)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.config.get_cache_dir(), 'metadata', digest[:2],
+                            digest + '.json')
+
+    def read_metadata(self, path: str) -> dict:
+        if not self.config.use_cache:
+            return None
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def write_metadata(self, path: str, url: str, data, etag: str = None,
+                       last_modified: str = None):
+        if not self.config.use_cache:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'url': url, 'time': time.time(), 'etag': etag,
+                       'last_modified': last_modified, 'data': data}, file)
+        os.replace(tmp_path, path)
+
+    def get_cached_metadata(self, path: str, url: str):
+        """
+        Cached response of an API call that can be used without asking the API
+
+        Returns:
+            (cached record or None, True if its data can be used as is)
+
+        Raises:
+            OfflineMiss: offline and nothing is cached
+        """
+        cached = self.read_metadata(path)
+        if self.config.offline:
+            if cached is None:
+                raise OfflineMiss(f'{url} is not cached, cannot resolve it offline')
+            return cached, True
+        return cached, (cached is not None
+                        and time.time() - cached['time'] < self.config.metadata_ttl)
+
+    def api_request(self, method: str, url: str, params: dict = None, json=None,
+                    headers=None):
+        """
+        Call a JSON API through the metadata cache
+
+        Responses younger than metadata_ttl are used without a request, older
+        ones are revalidated with If-None-Match / If-Modified-Since.
+
+        Args:
+            headers: dict, or function returning it that is only called when a
+                request is made
+
+        Returns:
+            decoded JSON response
+        """
+        path, cached, fresh = self.lookup_api_request(method, url, params, json)
+        if fresh:
+            return cached['data']
+        headers = dict((headers() if callable(headers) else headers) or {})
+        if cached is not None:
+            headers.update(get_revalidation_headers(cached))
+        response = self.get_session(url).request(
+            method, url, params=params, json=json, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            return self.keep_api_response(path, url, cached)
+        response.raise_for_status()
+        return self.store_api_response(path, url, response.json(), response.headers)
+
+    def lookup_api_request(self, method: str, url: str, params: dict = None,
+                           json=None) -> tuple:
+        """
+        Look up an API call in the metadata cache, before it is made
+
+        Returns:
+            (metadata path, cached record or None, True if its data can be
+            used as is)
+        """
+        path = self.get_metadata_path(method, url, params, json)
+        cached, fresh = self.get_cached_metadata(path, url)
+        if fresh:
+            self.telemetry.count('fresh')
+        return path, cached, fresh
+
+    def keep_api_response(self, path: str, url: str, cached: dict):
+        """
+        Renew a cached response the API answered with 304 Not Modified
+
+        Returns:
+            its data
+        """
+        self.telemetry.count('revalidated')
+        self.write_metadata(path, url, cached['data'], cached.get('etag'),
+                            cached.get('last_modified'))
+        return cached['data']
+
+    def store_api_response(self, path: str, url: str, data, headers):
+        """
+        Cache a new response of an API call with its validators
+
+        Returns:
+            data
+        """
+        self.telemetry.count('fetched')
+        self.write_metadata(path, url, data, headers.get('ETag'),
+                            headers.get('Last-Modified'))
+        return data
+
+    def needs_curseforge_key(self) -> bool:
+        return (self.curseforge_key is None
+                or time.time() - self.curseforge_key_time > CURSEFORGE_KEY_TTL)
+
+    def set_curseforge_key(self, key: str):
+        self.curseforge_key = key
+        self.curseforge_key_time = time.time()
+
+    def get_curseforge_key(self) -> str:
+        """
+        Get the CurseForge API key, fetched once and reused for CURSEFORGE_KEY_TTL
+        """
+        with self.curseforge_key_lock:
+            if self.needs_curseforge_key():
+                response = self.get(self.config.curseforge_api_key)
+                response.raise_for_status()
+                self.set_curseforge_key(response.json()['token'])
+            return self.curseforge_key
+
+    def curseforge_headers(self) -> dict:
+        return {'x-api-key': self.get_curseforge_key()}
+
+
+def get_revalidation_headers(cached: dict) -> dict:
+    headers = {}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+    return headers
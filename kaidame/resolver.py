@@ -0,0 +1,838 @@
+"""
+Resolving getters rows to concrete files, the lockfile and dependencies
+"""
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+from urllib.parse import urlparse
+
+from . import console
+from .config import Config, GETTERS
+from .net import HTTPClient, OfflineMiss
+from .telemetry import Telemetry, get_profile_item
+
+# hashes per /version_files/update request, ids per /projects and /versions request
+MODRINTH_BATCH_SIZE = 100
+# projects with at most this many versions are fetched whole through /versions,
+# longer histories through the filtered version list of the project
+MODRINTH_BATCH_VERSIONS = 10
+# CurseForge HashAlgo enum
+CURSEFORGE_HASH_ALGOS = {1: 'sha1', 2: 'md5'}
+# relationType of CurseForge file dependencies that are followed
+CURSEFORGE_RELATIONS = {3: 'required', 5: 'incompatible'}
+# CurseForge ModLoaderType enum
+CURSEFORGE_MOD_LOADERS = {'forge': 1, 'fabric': 4, 'quilt': 5, 'neoforge': 6}
+# ids per POST /mods and /mods/files request
+CURSEFORGE_BATCH_SIZE = 100
+LOCK_VERSION = 2
+
+
+def read_csv(filename: str) -> list:
+    with open(filename, 'r') as file:
+        reader = csv.reader(file)
+        data = list(reader)
+    if len(data) == 0:
+        return []
+    header = data[0]
+    data = data[1:]
+    # construct a dictionary
+    data = [{header[i]: data[j][i]
+             for i in range(len(header))} for j in range(len(data))]
+    # check for duplicates and print them
+    seen_urls = set()
+    duplicates = set()
+    for frame in data:
+        url = frame['url']
+        if url in seen_urls:
+            duplicates.add(url)
+        seen_urls.add(url)
+    if len(duplicates) > 0:
+        print(f"{console.YELLOW}Duplicates found in {filename}: {duplicates}{console.CLEAR} ")
+    # check for duplicates in filenames
+    seen_filenames = set()
+    duplicates = set()
+    for frame in data:
+        _filename = frame['filename']
+        if _filename in seen_filenames:
+            duplicates.add(_filename)
+        seen_filenames.add(_filename)
+    if len(duplicates) > 0:
+        print(f"{console.YELLOW}Duplicates found in {filename}: {duplicates
+                }{console.CLEAR} ")
+    return data
+
+
+def get_project_id(url: str) -> str:
+    return list(filter(None, url.split('/')))[-1]
+
+
+def modrinth_entry(version: dict) -> dict:
+    """
+    Lockfile entry for the file of a Modrinth version
+    """
+    file = version['files'][0]
+    return {
+        'url': file['url'],
+        'filename': file['filename'],
+        'size': file.get('size'),
+        'hashes': file.get('hashes', {}),
+        'project': f"modrinth:{version['project_id']}",
+        'version': version['id'],
+        'dependencies': [
+            {'project': f"modrinth:{dependency['project_id']}",
+             'version': dependency.get('version_id'),
+             'type': dependency['dependency_type']}
+            for dependency in version.get('dependencies', [])
+            if dependency.get('project_id')
+            and dependency.get('dependency_type') in ('required', 'incompatible')
+        ],
+    }
+
+
+def is_curseforge_match(file: dict, mc_version: str, modloader: str) -> bool:
+    # gameVersions holds both the Minecraft versions and the loaders
+    return (mc_version in file['gameVersions']
+            and modloader.lower() in [v.lower() for v in file['gameVersions']])
+
+
+def pick_modrinth_version(
+    all_version: list, mc_version: str, modloader: str
+) -> dict:
+    """
+    Pick the newest Modrinth version for a game version and loader
+    """
+    # if mc_version is not in game_versions, remove it from the list
+    filtered_version = list(filter(
+        lambda x: mc_version in x['game_versions'], all_version)
+    )
+    # if modloader is not in loaders, remove it from the list
+    filtered_version = list(filter(
+        lambda x: modloader in x['loaders'], filtered_version)
+    )
+    # sort by date_published
+    filtered_version = sorted(
+        filtered_version, key=lambda x: x['date_published'], reverse=True
+    )
+    return filtered_version[0]
+
+
+def pick_curseforge_file(all_files: list, mc_version: str, modloader: str) -> dict:
+    """
+    Pick the newest CurseForge file for a game version and loader
+    """
+    # in gameVersions check if mc_version is in it and modloader is in it
+    all_files = list(filter(
+        lambda x: is_curseforge_match(x, mc_version, modloader),
+        all_files
+    ))
+    # sort by dateModified
+    all_files = sorted(
+        all_files, key=lambda x: x['fileDate'], reverse=True
+    )
+    return all_files[0]
+
+
+def lock_source(frame: dict) -> dict:
+    """
+    Part of a CSV row the lockfile entry was resolved from
+    """
+    return {
+        'url': frame['url'],
+        'filename': frame['filename'],
+        'loader': frame['loader'],
+    }
+
+
+def get_known_hashes(lock: dict) -> dict:
+    """
+    Row url -> sha1 of the file it is locked to, for bulk re-resolution
+    """
+    known = {}
+    for entries in lock['files'].values():
+        for url, entry in entries.items():
+            if 'sha1' in entry.get('hashes', {}):
+                known[url] = entry['hashes']['sha1']
+    return known
+
+
+class Resolver:
+    """
+    Resolves the rows of ./getters/*.csv into lockfile entries: the url,
+    filename, size, hashes and dependencies of the file to install
+    """
+
+    def __init__(self, config: Config, http: HTTPClient, telemetry: Telemetry):
+        self.config = config
+        self.http = http
+        self.telemetry = telemetry
+
+    def is_modrinth_project(self, url: str) -> bool:
+        return (url.startswith(self.config.modrinth_base_url + '/data/')
+                and 'versions/' not in url)
+
+    def is_curseforge_project(self, url: str) -> bool:
+        return ((url.startswith(self.config.curseforge_api)
+                 or url.startswith(self.config.curseforge_api_old))
+                and 'files/' not in url)
+
+    def curseforge_entry(self, file: dict) -> dict:
+        """
+        Lockfile entry for a CurseForge file
+        """
+        url = file.get('downloadUrl')
+        if url is None:
+            # mods that opted out of third party downloads have no downloadUrl
+            url = f"{self.config.curseforge_cdn}/files/{file['id'] // 1000}/{file['id'] % 1000}/{file['fileName']}"
+        return {
+            'url': url,
+            'filename': file['fileName'],
+            'size': file.get('fileLength'),
+            'hashes': {
+                CURSEFORGE_HASH_ALGOS[h['algo']]: h['value']
+                for h in file.get('hashes', [])
+                if h.get('algo') in CURSEFORGE_HASH_ALGOS
+            },
+            'project': f"curseforge:{file['modId']}",
+            'version': file['id'],
+            'dependencies': [
+                {'project': f"curseforge:{dependency['modId']}", 'version': None,
+                 'type': CURSEFORGE_RELATIONS[dependency['relationType']]}
+                for dependency in file.get('dependencies', [])
+                if dependency.get('relationType') in CURSEFORGE_RELATIONS
+            ],
+        }
+
+    def resolve_curseforge_batch(self, frames: list) -> dict:
+        """
+        Resolve CurseForge rows in bulk
+
+        POST /mods returns the latest file id of every mod per game version and
+        loader, POST /mods/files then returns those files, so all rows take two
+        requests no matter how many there are.
+
+        Args:
+            frames: bare CurseForge project rows
+
+        Returns:
+            (project id, loader) -> entry, rows that could not be resolved are
+            left out
+        """
+        mc_version = self.config.mc_version
+        wanted = {(get_project_id(frame['url']), frame['loader']) for frame in frames}
+        mod_ids = sorted({int(project_id) for project_id, _ in wanted})
+        file_ids = {}
+        for i in range(0, len(mod_ids), CURSEFORGE_BATCH_SIZE):
+            data = self.http.api_request(
+                'POST', f"{self.config.curseforge_api}/mods",
+                json={'modIds': mod_ids[i:i + CURSEFORGE_BATCH_SIZE]},
+                headers=self.http.curseforge_headers
+            )
+            for mod in data['data']:
+                for project_id, loader in wanted:
+                    if project_id != str(mod['id']):
+                        continue
+                    indexes = [
+                        index for index in mod.get('latestFilesIndexes', [])
+                        if index['gameVersion'] == mc_version
+                        and index.get('modLoader') == CURSEFORGE_MOD_LOADERS.get(loader)
+                    ]
+                    if len(indexes) > 0:
+                        # file ids grow over time, the highest one is the newest
+                        file_ids[(project_id, loader)] = max(
+                            index['fileId'] for index in indexes)
+
+        ids = sorted(set(file_ids.values()))
+        files = {}
+        for i in range(0, len(ids), CURSEFORGE_BATCH_SIZE):
+            data = self.http.api_request(
+                'POST', f"{self.config.curseforge_api}/mods/files",
+                json={'fileIds': ids[i:i + CURSEFORGE_BATCH_SIZE]},
+                headers=self.http.curseforge_headers
+            )
+            for file in data['data']:
+                files[file['id']] = file
+
+        resolved = {}
+        for (project_id, loader), file_id in file_ids.items():
+            file = files.get(file_id)
+            if file is not None and is_curseforge_match(file, mc_version, loader):
+                resolved[(project_id, loader)] = self.curseforge_entry(file)
+        return resolved
+
+    def resolve_modrinth_updates(self, frames: list, known: dict) -> dict:
+        """
+        Resolve Modrinth rows in bulk from the files they resolved to before
+
+        /version_files/update returns the newest version matching a loader and
+        game version for every file hash it is given, so all rows of a loader
+        take a single request instead of one version list per project.
+
+        Args:
+            frames: bare Modrinth project rows
+            known: row url -> sha1 of the file the row resolved to before
+
+        Returns:
+            row url -> entry, rows that could not be resolved are left out
+        """
+        mc_version = self.config.mc_version
+        by_loader = {}
+        for frame in frames:
+            if frame['url'] in known:
+                by_loader.setdefault(frame['loader'], []).append(frame)
+        resolved = {}
+        for loader, group in by_loader.items():
+            for i in range(0, len(group), MODRINTH_BATCH_SIZE):
+                batch = group[i:i + MODRINTH_BATCH_SIZE]
+                versions = self.http.api_request(
+                    'POST', f"{self.config.modrinth_api}/version_files/update",
+                    json={
+                        'hashes': [known[frame['url']] for frame in batch],
+                        'algorithm': 'sha1',
+                        'loaders': [loader],
+                        'game_versions': [mc_version],
+                    }
+                )
+                for frame in batch:
+                    version = versions.get(known[frame['url']])
+                    if (version is None
+                            or version['project_id'] != get_project_id(frame['url'])
+                            or mc_version not in version['game_versions']
+                            or loader not in version['loaders']):
+                        continue
+                    resolved[frame['url']] = modrinth_entry(version)
+        return resolved
+
+    def resolve_modrinth_batch(self, frames: list) -> dict:
+        """
+        Resolve Modrinth rows in bulk without knowing their previous files
+
+        GET /projects returns the version ids of every project. Projects with
+        at most MODRINTH_BATCH_VERSIONS versions are fetched whole through GET
+        /versions, MODRINTH_BATCH_SIZE versions per request instead of a
+        request per row. Longer histories are left to the row by row lookup,
+        which only gets the versions for the game version and loader, and so
+        are projects that do not list them, which the lookup reports.
+
+        Args:
+            frames: bare Modrinth project rows
+
+        Returns:
+            (project id, loader) -> entry, rows that could not be resolved are
+            left out
+        """
+        mc_version = self.config.mc_version
+        wanted = {(get_project_id(frame['url']), frame['loader']) for frame in frames}
+        project_ids = sorted({project_id for project_id, _ in wanted})
+        projects = {}
+        for i in range(0, len(project_ids), MODRINTH_BATCH_SIZE):
+            data = self.http.api_request(
+                'GET', f"{self.config.modrinth_api}/projects",
+                params={'ids': json.dumps(project_ids[i:i + MODRINTH_BATCH_SIZE])}
+            )
+            for project in data:
+                projects[project['id']] = project
+                # rows may use the slug instead of the id
+                if project.get('slug'):
+                    projects[project['slug']] = project
+
+        version_ids = sorted({
+            version_id for project_id, loader in wanted if project_id in projects
+            and mc_version in projects[project_id].get('game_versions', [mc_version])
+            and loader in projects[project_id].get('loaders', [loader])
+            and len(projects[project_id].get('versions', [])) <= MODRINTH_BATCH_VERSIONS
+            for version_id in projects[project_id].get('versions', [])})
+        versions = {}
+        for i in range(0, len(version_ids), MODRINTH_BATCH_SIZE):
+            data = self.http.api_request(
+                'GET', f"{self.config.modrinth_api}/versions",
+                params={'ids': json.dumps(version_ids[i:i + MODRINTH_BATCH_SIZE])}
+            )
+            for version in data:
+                versions.setdefault(version['project_id'], []).append(version)
+
+        resolved = {}
+        for project_id, loader in wanted:
+            project = projects.get(project_id)
+            if project is None:
+                continue
+            try:
+                version = pick_modrinth_version(
+                    versions.get(project['id'], []), mc_version, loader)
+            except IndexError:
+                continue
+            resolved[(project_id, loader)] = modrinth_entry(version)
+        return resolved
+
+    def resolve_file(self, frame: dict, modloader: str = "forge") -> dict:
+        """
+        Resolve a CSV row to the concrete file that should be downloaded
+
+        Args:
+            frame: CSV row
+            modloader: mod loader to resolve for
+
+        Returns:
+            dict with url, filename, size and hashes of the file
+        """
+        with self.telemetry.span('resolve', get_profile_item(frame['filename']),
+                                 urlparse(frame['url']).hostname):
+            return self.resolve_row(frame, modloader)
+
+    def resolve_row(self, frame: dict, modloader: str) -> dict:
+        request = self.get_row_request(frame, modloader)
+        if request is None:
+            # direct download, including Modrinth/CurseForge links to a version
+            return {'url': frame['url'], 'filename': frame['filename'],
+                    'size': None, 'hashes': {}}
+        url, params, needs_key = request
+        data = self.http.api_request(
+            'GET', url, params=params,
+            headers=self.http.curseforge_headers if needs_key else None)
+        return self.pick_row_entry(frame, modloader, data)
+
+    def get_row_request(self, frame: dict, modloader: str) -> tuple:
+        """
+        API call listing the files a CSV row can resolve to
+
+        Returns:
+            (url, params, True if it needs the CurseForge key), None for
+            direct downloads
+        """
+        mc_version = self.config.mc_version
+        url = frame['url']
+        # if url in in pattern "https://cdn.modrinth.com/data/XXXXXXXX/"
+        if self.is_modrinth_project(url):
+            return (
+                f"{self.config.modrinth_api}/project/{get_project_id(url)}/version",
+                # let Modrinth filter instead of sending the whole history
+                {
+                    'game_versions': json.dumps([mc_version]),
+                    'loaders': json.dumps([modloader]),
+                },
+                False)
+        if self.is_curseforge_project(url):
+            return (
+                f"{self.config.curseforge_api}/mods/{get_project_id(url)}/files",
+                {
+                    'gameVersion': mc_version,
+                    'modLoaderType': modloader.capitalize(),
+                },
+                True)
+        return None
+
+    def pick_row_entry(self, frame: dict, modloader: str, data) -> dict:
+        """
+        Pick the file of a CSV row from the response to get_row_request()
+        """
+        if self.is_modrinth_project(frame['url']):
+            return modrinth_entry(
+                pick_modrinth_version(data, self.config.mc_version, modloader))
+        return self.curseforge_entry(
+            pick_curseforge_file(data['data'], self.config.mc_version, modloader))
+
+    def empty_lock(self) -> dict:
+        return {'version': LOCK_VERSION, 'mc_version': self.config.mc_version,
+                'files': {}}
+
+    def read_lock(self) -> dict:
+        """
+        Read the lockfile, returns an empty lock if there is none
+        """
+        if not os.path.exists(self.config.lockfile):
+            return self.empty_lock()
+        with open(self.config.lockfile, 'r') as file:
+            lock = json.load(file)
+        if (lock.get('version') != LOCK_VERSION
+                or lock.get('mc_version') != self.config.mc_version):
+            # resolved for something else, nothing in it can be reused
+            return self.empty_lock()
+        return lock
+
+    def write_lock(self, lock: dict):
+        tmp_path = self.config.lockfile + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(lock, file, indent=2, sort_keys=True)
+            file.write('\n')
+        os.replace(tmp_path, self.config.lockfile)
+
+    def get_locked_entries(self, csv_name: str, data: list, lock: dict) -> list:
+        """
+        Get lockfile entries for the rows of a CSV
+
+        Returns:
+            list aligned with data, None for rows that are not locked
+        """
+        locked = lock['files'].get(csv_name, {})
+        entries = []
+        missing = 0
+        for frame in data:
+            entry = locked.get(frame['url'])
+            if entry is not None and entry['source'] != lock_source(frame):
+                entry = None
+            if entry is None:
+                missing += 1
+            entries.append(entry)
+        if os.path.exists(self.config.lockfile) and missing > 0:
+            print(f"{console.YELLOW}{missing} rows of {csv_name} are not locked, "
+                  f"resolving them online. Run --update to refresh "
+                  f"{self.config.lockfile}{console.CLEAR} ")
+        return entries
+
+    def resolve_locked(self, frame: dict) -> dict:
+        entry = self.resolve_file(frame, frame['loader'])
+        entry['source'] = lock_source(frame)
+        return entry
+
+    def resolve_frames(
+        self, frames: list, desc: str = "[ 🔒 ] Resolving files", known: dict = None,
+        bulk_only: bool = False
+    ) -> list:
+        """
+        Resolve CSV rows into lockfile entries
+
+        Modrinth and CurseForge rows are resolved in bulk first, Modrinth rows
+        whose previous file is known through /version_files/update and the
+        others with short histories through /projects and /versions. Only
+        what the bulk lookups could not resolve is looked up row by row. Rows of the same project
+        that appear in several CSVs are looked up once.
+
+        Args:
+            known: row url -> sha1 of the file the row resolved to before
+            bulk_only: leave rows the bulk lookups could not resolve as None
+
+        Returns:
+            list aligned with frames, holding the exception for rows that failed
+        """
+        import requests
+        results = [None] * len(frames)
+        modrinth = [frame for frame in frames if self.is_modrinth_project(frame['url'])]
+        if known and len(modrinth) > 0:
+            try:
+                with self.telemetry.span(
+                        'resolve', f'Modrinth bulk lookup ({len(modrinth)} rows)',
+                        urlparse(self.config.modrinth_api).hostname):
+                    bulk = self.resolve_modrinth_updates(modrinth, known)
+            except (requests.RequestException, ValueError, KeyError, OfflineMiss) as e:
+                print(f"{console.YELLOW}Bulk Modrinth lookup failed, resolving "
+                      f"one by one: {e}{console.CLEAR} ")
+                bulk = {}
+            for i, frame in enumerate(frames):
+                if self.is_modrinth_project(frame['url']) and frame['url'] in bulk:
+                    results[i] = dict(bulk[frame['url']], source=lock_source(frame))
+        modrinth = [frame for frame, entry in zip(frames, results)
+                    if entry is None and self.is_modrinth_project(frame['url'])]
+        if len(modrinth) > 0:
+            try:
+                with self.telemetry.span(
+                        'resolve', f'Modrinth bulk lookup ({len(modrinth)} rows)',
+                        urlparse(self.config.modrinth_api).hostname):
+                    bulk = self.resolve_modrinth_batch(modrinth)
+            except (requests.RequestException, ValueError, KeyError, OfflineMiss) as e:
+                print(f"{console.YELLOW}Bulk Modrinth lookup failed, resolving "
+                      f"one by one: {e}{console.CLEAR} ")
+                bulk = {}
+            for i, frame in enumerate(frames):
+                key = (get_project_id(frame['url']), frame['loader'])
+                if (results[i] is None and self.is_modrinth_project(frame['url'])
+                        and key in bulk):
+                    results[i] = dict(bulk[key], source=lock_source(frame))
+        curseforge = [frame for frame in frames
+                      if self.is_curseforge_project(frame['url'])]
+        if len(curseforge) > 0:
+            try:
+                with self.telemetry.span(
+                        'resolve', f'CurseForge bulk lookup ({len(curseforge)} rows)',
+                        urlparse(self.config.curseforge_api).hostname):
+                    bulk = self.resolve_curseforge_batch(curseforge)
+            except (requests.RequestException, ValueError, KeyError, OfflineMiss) as e:
+                print(f"{console.YELLOW}Bulk CurseForge lookup failed, resolving "
+                      f"one by one: {e}{console.CLEAR} ")
+                bulk = {}
+            for i, frame in enumerate(frames):
+                key = (get_project_id(frame['url']), frame['loader'])
+                if self.is_curseforge_project(frame['url']) and key in bulk:
+                    results[i] = dict(bulk[key], source=lock_source(frame))
+        if bulk_only:
+            return results
+        pending = []
+        duplicates = {}
+        for i, entry in enumerate(results):
+            if entry is not None:
+                continue
+            key = (frames[i]['url'], frames[i]['loader'])
+            if key in duplicates:
+                duplicates[key].append(i)
+            else:
+                duplicates[key] = []
+                pending.append(i)
+        if self.config.use_threading and len(pending) > 0:
+            with ThreadPoolExecutor(max_workers=self.config.threads) as executor:
+                pbar = console.progress_bar(len(pending), desc)
+                futures = {executor.submit(self.resolve_locked, frames[i]): i
+                           for i in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        results[futures[future]] = e
+                    pbar.update(1)
+                pbar.close()
+        else:
+            for i in pending:
+                print(f"Resolving {frames[i]['filename']}...")
+                try:
+                    results[i] = self.resolve_locked(frames[i])
+                except Exception as e:
+                    results[i] = e
+        for i in pending:
+            for j in duplicates[(frames[i]['url'], frames[i]['loader'])]:
+                if isinstance(results[i], Exception):
+                    results[j] = results[i]
+                else:
+                    results[j] = dict(results[i], source=lock_source(frames[j]))
+        return results
+
+    def get_frame_project(self, frame: dict) -> str:
+        """
+        Project a CSV row points to, as in entries, None for direct downloads
+        """
+        if self.is_modrinth_project(frame['url']):
+            return f"modrinth:{get_project_id(frame['url'])}"
+        if self.is_curseforge_project(frame['url']):
+            return f"curseforge:{get_project_id(frame['url'])}"
+        return None
+
+    def get_dependency_frame(self, project: str, loader: str, parent: str) -> dict:
+        """
+        CSV row standing in for a dependency that is not listed anywhere
+        """
+        source, project_id = project.split(':', 1)
+        if source == 'modrinth':
+            url = f"{self.config.modrinth_base_url}/data/{project_id}"
+        else:
+            url = f"{self.config.curseforge_api}/mods/{project_id}"
+        return {'url': url, 'filename': project, 'loader': loader,
+                'comment': f'dependency of {parent}'}
+
+    def resolve_dependencies(self, tables: dict, lock: dict = None) -> dict:
+        """
+        Find the required dependencies of resolved rows that are not listed
+
+        The dependency graph is walked one level at a time, every level is
+        resolved at once with resolve_frames() and each project is resolved
+        once per loader, however many mods need it. Conflicts and duplicates
+        are reported.
+
+        Args:
+            tables: csv name -> (frame, entry) pairs, see get_entries()
+            lock: dependencies locked in it are not resolved again
+
+        Returns:
+            csv name -> (frame, entry) pairs to add, entry is the exception for
+            dependencies that could not be resolved
+        """
+        locked = lock['files'] if lock is not None else {}
+        # (project, loader) -> entry, whatever CSV it came from
+        memo = {}
+        # csv name -> projects it installs
+        present = {csv_name: set() for csv_name in tables}
+        added = {csv_name: [] for csv_name in tables}
+        queue = []
+        for csv_name, items in tables.items():
+            for frame, entry in items:
+                project = self.get_frame_project(frame)
+                if project is None:
+                    continue
+                present[csv_name].add(project)
+                if entry is not None:
+                    memo[(project, frame['loader'])] = entry
+                if isinstance(entry, dict):
+                    queue.append((csv_name, frame, entry))
+
+        while len(queue) > 0:
+            # dependencies of this level: (csv name, frame) wanting each project
+            wanted = {}
+            for csv_name, frame, entry in queue:
+                # common.csv is installed along with every other CSV of its directory
+                shared = (present.get('common.csv', set())
+                          if GETTERS[csv_name] == GETTERS['common.csv'] else set())
+                for dependency in entry.get('dependencies', []):
+                    project = dependency['project']
+                    if (dependency['type'] != 'required' or project in present[csv_name]
+                            or project in shared):
+                        continue
+                    present[csv_name].add(project)
+                    wanted.setdefault((project, frame['loader']), []).append(
+                        (csv_name, frame))
+
+            pending = []
+            for (project, loader), needed_by in wanted.items():
+                if (project, loader) in memo:
+                    continue
+                frame = self.get_dependency_frame(
+                    project, loader, needed_by[0][1]['filename'])
+                entry = locked.get(needed_by[0][0], {}).get(frame['url'])
+                if entry is not None and entry['source'] == lock_source(frame):
+                    memo[(project, loader)] = entry
+                else:
+                    pending.append(frame)
+            for frame, entry in zip(pending, self.resolve_frames(
+                    pending, desc="[ 🔗 ] Resolving dependencies",
+                    known=get_known_hashes(lock) if lock is not None else None)):
+                memo[(frame['filename'], frame['loader'])] = entry
+
+            queue = []
+            for (project, loader), needed_by in wanted.items():
+                entry = memo[(project, loader)]
+                parents = ', '.join(sorted({frame['filename'] for _, frame in needed_by}))
+                if isinstance(entry, Exception):
+                    print(f"{console.RED}Missing dependency {project} of {parents}: "
+                          f"{entry}{console.CLEAR} ")
+                for csv_name in sorted({csv_name for csv_name, _ in needed_by}):
+                    frame = self.get_dependency_frame(project, loader, parents)
+                    added[csv_name].append((frame, entry))
+                    if isinstance(entry, dict):
+                        queue.append((csv_name, frame, entry))
+
+        count = sum(len(items) for items in added.values())
+        if count > 0:
+            print(f"{console.CYAN}Added {count} dependencies: " + ', '.join(
+                f"{entry['filename'] if isinstance(entry, dict) else frame['filename']} "
+                f"({csv_name})"
+                for csv_name, items in added.items() for frame, entry in items)
+                + console.CLEAR)
+        report_dependency_problems(
+            {csv_name: tables[csv_name] + added[csv_name] for csv_name in tables})
+        return added
+
+    def get_entries(self, csv_names: list, bulk_only: bool = False) -> dict:
+        """
+        Read getters CSVs and resolve their rows, from the lockfile where possible
+
+        Rows that are not locked are collected over all CSVs and resolved in
+        one go, so bulk lookups cover every CSV at once.
+
+        Args:
+            bulk_only: leave rows the bulk lookups could not resolve as None,
+                for the asyncio engine to resolve while it downloads
+
+        Returns:
+            csv name -> list of (frame, entry), entry is the exception for rows
+            that could not be resolved
+        """
+        lock = self.read_lock()
+        tables = {}
+        unlocked = []
+        for csv_name in csv_names:
+            path = f'getters/{csv_name}'
+            data = read_csv(path) if os.path.exists(path) else []
+            entries = self.get_locked_entries(csv_name, data, lock)
+            tables[csv_name] = (data, entries)
+            unlocked += [(csv_name, i) for i, entry in enumerate(entries)
+                         if entry is None]
+        results = self.resolve_frames(
+            [tables[csv_name][0][i] for csv_name, i in unlocked],
+            known=get_known_hashes(lock),
+            # dependencies can only be followed from resolved rows
+            bulk_only=bulk_only and not self.config.follow_dependencies
+        )
+        for (csv_name, i), entry in zip(unlocked, results):
+            data, entries = tables[csv_name]
+            if isinstance(entry, Exception):
+                print(f"{console.RED}Error resolving {data[i]['filename']} "
+                      f"({csv_name}): {entry}{console.CLEAR} ")
+            entries[i] = entry
+        tables = {csv_name: list(zip(*tables[csv_name]))
+                  for csv_name in csv_names}
+        if self.config.follow_dependencies:
+            for csv_name, items in self.resolve_dependencies(tables, lock).items():
+                tables[csv_name] += items
+        return tables
+
+    def lock_files(self, update: bool = False) -> bool:
+        """
+        Resolve every row of ./getters/*.csv and write the lockfile
+
+        Args:
+            update: keep entries of rows that did not change since the last lock
+        """
+        old_lock = self.read_lock()
+        old_files = old_lock['files'] if update else {}
+        lock = self.empty_lock()
+        jobs = []
+        rows = {}
+        for csv_name in GETTERS:
+            path = f'getters/{csv_name}'
+            data = rows[csv_name] = read_csv(path) if os.path.exists(path) else []
+            lock['files'][csv_name] = {}
+            for frame in data:
+                entry = old_files.get(csv_name, {}).get(frame['url'])
+                if entry is not None and entry['source'] == lock_source(frame):
+                    lock['files'][csv_name][frame['url']] = entry
+                else:
+                    jobs.append((csv_name, frame))
+
+        failed = []
+        results = self.resolve_frames(
+            [frame for _, frame in jobs], known=get_known_hashes(old_lock))
+        for (csv_name, frame), entry in zip(jobs, results):
+            if isinstance(entry, Exception):
+                failed.append((csv_name, frame, entry))
+            else:
+                lock['files'][csv_name][frame['url']] = entry
+
+        for csv_name, frame, e in failed:
+            print(f"{console.RED}Error resolving {frame['filename']} ({csv_name}): "
+                  f"{e}{console.CLEAR} ")
+            # keep whatever was locked before rather than dropping the row
+            entry = old_files.get(csv_name, {}).get(frame['url'])
+            if entry is not None:
+                lock['files'][csv_name][frame['url']] = entry
+
+        if self.config.follow_dependencies:
+            tables = {csv_name: [(frame, lock['files'][csv_name].get(frame['url']))
+                                 for frame in data]
+                      for csv_name, data in rows.items()}
+            added = self.resolve_dependencies(tables, old_lock if update else None)
+            for csv_name, items in added.items():
+                for frame, entry in items:
+                    if isinstance(entry, dict):
+                        lock['files'][csv_name][frame['url']] = dict(
+                            entry, source=lock_source(frame))
+
+        self.write_lock(lock)
+        print(f"{console.GREEN}Resolved {len(jobs) - len(failed)}/{len(jobs)} files, "
+              f"lockfile saved to {self.config.lockfile}{console.CLEAR} ")
+        return len(failed) == 0
+
+
+def report_dependency_problems(tables: dict):
+    """
+    Print incompatible mods and files installed twice into one directory
+    """
+    by_dir = {}
+    for csv_name, items in tables.items():
+        by_dir.setdefault(GETTERS[csv_name], []).extend(
+            (frame, entry) for frame, entry in items if isinstance(entry, dict))
+    for dir, items in by_dir.items():
+        projects = {entry['project']: entry for _, entry in items if entry.get('project')}
+        for _, entry in items:
+            for dependency in entry.get('dependencies', []):
+                other = projects.get(dependency['project'])
+                if dependency['type'] == 'incompatible' and other is not None:
+                    print(f"{console.RED}Conflict in {dir}: {entry['filename']} is "
+                          f"incompatible with {other['filename']}{console.CLEAR} ")
+        # the same jar from two sources, or two rows with one file name
+        seen = {}
+        for frame, entry in items:
+            for key in [entry['filename'], entry.get('hashes', {}).get('sha1')]:
+                if key is None:
+                    continue
+                if key in seen and seen[key][1]['url'] != entry['url']:
+                    print(f"{console.YELLOW}Duplicate in {dir}: {entry['filename']} "
+                          f"({frame['filename']}) and {seen[key][1]['filename']} "
+                          f"({seen[key][0]['filename']}){console.CLEAR} ")
+                    break
+                seen.setdefault(key, (frame, entry))
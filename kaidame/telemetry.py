@@ -0,0 +1,271 @@
+"""
+Counters and per-stage timings of a run
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from . import console
+
+STAGES = ['resolve', 'connect', 'ttfb', 'transfer', 'write', 'verify', 'decrypt']
+
+# getters row the current job installs, spans of its stages are filed under it
+_profile_item = contextvars.ContextVar('profile_item', default=None)
+
+
+def get_profile_item(default: str) -> str:
+    return _profile_item.get() or default
+
+
+def set_profile_item(job: dict):
+    _profile_item.set(job['frame']['filename'] if job['frame'] is not None
+                      else job['entry']['filename'])
+
+
+class Telemetry:
+    """
+    What a run did: cache hits, API responses by origin, connections opened
+    per host and, when profiling, a span for every stage of every file
+    """
+
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.cache_stats = {'hits': 0, 'bytes': 0, 'fresh': 0,
+                            'revalidated': 0, 'fetched': 0}
+        self.connections = {}
+        # download queues of the threaded engine, see record_workers()
+        self.pools = []
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def record_span(self, stage: str, item: str, start: float, end: float,
+                    host: str = None, bytes: int = 0):
+        """
+        Record how long a stage of an item took, when profiling
+
+        Args:
+            stage: one of STAGES
+            item: file (or host, for connect) the stage belongs to
+            start, end: time.perf_counter() values
+        """
+        if not self.profile:
+            return
+        with self.lock:
+            self.spans.append({
+                'stage': stage, 'item': item, 'host': host, 'bytes': bytes,
+                'start': start - self.start, 'end': end - self.start,
+                'thread': threading.get_ident(),
+            })
+
+    @contextlib.contextmanager
+    def span(self, stage: str, item: str, host: str = None):
+        """
+        Record the time spent in the with block, see record_span()
+
+        Yields:
+            dict whose 'bytes' can be set in the block
+        """
+        span = {'bytes': 0}
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record_span(stage, item, start, time.perf_counter(), host,
+                             span['bytes'])
+
+    def count(self, kind: str, amount: int = 1):
+        """
+        Count a cache hit, its bytes, or an API response (fresh,
+        revalidated or fetched)
+        """
+        with self.lock:
+            self.cache_stats[kind] += amount
+
+    def count_connection(self, host: str):
+        with self.lock:
+            self.connections[host] = self.connections.get(host, 0) + 1
+
+    def get_connection_count(self) -> dict:
+        """
+        Connections opened so far in this run, by host
+        """
+        with self.lock:
+            return dict(self.connections)
+
+    def record_workers(self, workers: list, elapsed: float, limit: int, maximum: int):
+        """
+        Record how busy the workers of a download queue were
+
+        Args:
+            workers: (seconds busy, seconds since its first job) of every worker
+            elapsed: seconds the queue ran
+            limit: jobs the queue ran at once in the end, see WorkerLimit
+            maximum: most jobs it was allowed to run at once
+        """
+        with self.lock:
+            self.pools.append({'workers': workers, 'elapsed': elapsed,
+                               'limit': limit, 'maximum': maximum})
+
+    def write_profile(self, path: str, format: str = 'json'):
+        """
+        Write the recorded spans
+
+        Args:
+            format: json for the spans and per-item totals, chrome for the
+                Trace Event Format of chrome://tracing and Perfetto
+        """
+        with self.lock:
+            spans = list(self.spans)
+        if format == 'chrome':
+            data = {'traceEvents': [{
+                'name': f"{span['stage']} {span['item']}", 'cat': span['stage'],
+                'ph': 'X', 'pid': os.getpid(), 'tid': span['thread'],
+                'ts': span['start'] * 1e6, 'dur': (span['end'] - span['start']) * 1e6,
+                'args': {'item': span['item'], 'host': span['host'],
+                         'bytes': span['bytes']},
+            } for span in spans], 'displayTimeUnit': 'ms'}
+        else:
+            data = {'spans': spans, 'items': get_profile_totals(spans, 'item'),
+                    'hosts': get_profile_totals(spans, 'host')}
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
+        print(f"Profile written to {path}")
+
+    def print_profile_summary(self, top: int = 10):
+        """
+        Time per stage and the slowest items and hosts of the run
+        """
+        with self.lock:
+            spans = list(self.spans)
+        if len(spans) == 0:
+            return
+        stages = list(STAGES)
+        print(f"{'stage':<10} {'count':>6} {'seconds':>9} {'MB':>8}")
+        for stage in stages:
+            matching = [span for span in spans if span['stage'] == stage]
+            if len(matching) > 0:
+                print(f"{stage:<10} {len(matching):>6} "
+                      f"{sum(span['end'] - span['start'] for span in matching):>9.2f} "
+                      f"{sum(span['bytes'] for span in matching) / 1024**2:>8.1f}")
+
+        # connections are not opened for one item
+        stages.remove('connect')
+        items = get_profile_totals(spans, 'item')
+        print("\nSlowest items (seconds):")
+        print(f"{'item':<32} {'total':>7} " + ' '.join(f'{stage:>8}' for stage in stages))
+        for item, total in sorted(items.items(), key=lambda item: -item[1]['total'])[:top]:
+            print(f"{item[:32]:<32} {total['total']:>7.2f} "
+                  + ' '.join(f"{total.get(stage, 0):>8.2f}" for stage in stages))
+
+        hosts = get_profile_totals(spans, 'host')
+        print("\nSlowest hosts:")
+        print(f"{'host':<32} {'seconds':>8} {'requests':>8} {'avg ttfb':>8} "
+              f"{'connects':>8} {'MB':>8} {'MB/s':>7}")
+        for host, total in sorted(hosts.items(), key=lambda item: -item[1]['total'])[:top]:
+            requests_made = sum(1 for span in spans
+                                if span['host'] == host and span['stage'] in ('ttfb', 'resolve'))
+            ttfbs = [span['end'] - span['start'] for span in spans
+                     if span['host'] == host and span['stage'] == 'ttfb']
+            connects = sum(1 for span in spans
+                           if span['host'] == host and span['stage'] == 'connect')
+            transfer = total.get('transfer', 0)
+            print(f"{host[:32]:<32} {total['total']:>8.2f} {requests_made:>8} "
+                  f"{(sum(ttfbs) / len(ttfbs) if ttfbs else 0):>8.3f} {connects:>8} "
+                  f"{total['bytes'] / 1024**2:>8.1f} "
+                  f"{(total['bytes'] / 1024**2 / transfer if transfer else 0):>7.1f}")
+
+    def print_done(self, start: float):
+        connections = self.get_connection_count()
+        stats = self.cache_stats
+        print(f'{console.GREEN}Done! {(time.time() - start):.1f}s{console.CLEAR} ')
+        if stats['hits'] > 0:
+            print(f"Installed from cache: {stats['hits']} files, "
+                  f"{stats['bytes'] / 1024**2:.1f} MB")
+        if stats['fresh'] + stats['revalidated'] + stats['fetched'] > 0:
+            print(f"API responses: {stats['fresh']} from cache, "
+                  f"{stats['revalidated']} revalidated, "
+                  f"{stats['fetched']} fetched")
+        if len(connections) > 0:
+            hosts = ', '.join(f'{host}: {count}'
+                              for host, count in sorted(connections.items()))
+            print(f'Connections opened: {sum(connections.values())} ({hosts})')
+        for pool in self.pools:
+            busy = sum(worker[0] for worker in pool['workers'])
+            alive = sum(worker[1] for worker in pool['workers'])
+            if alive <= 0:
+                continue
+            shares = sorted((worker[0] / worker[1] if worker[1] > 0 else 1.0
+                             for worker in pool['workers']), reverse=True)
+            print(f"Worker threads: {len(pool['workers'])}, {pool['limit']} of "
+                  f"{pool['maximum']} jobs at once, {busy / pool['elapsed']:.1f} "
+                  f"busy on average, {100 * busy / alive:.0f}% utilised")
+            print('  per worker: ' + ' '.join(f'{100 * share:.0f}%' for share in shares))
+
+
+class TransferTimer:
+    """
+    Times one download, the write and hash time of its chunks add up
+    """
+
+    def __init__(self, telemetry: Telemetry, item: str, url: str):
+        self.telemetry = telemetry
+        self.item = get_profile_item(item)
+        self.host = urlparse(url).hostname
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.write = 0
+        self.verify = 0
+
+    def response(self):
+        """
+        The headers arrived
+        """
+        self.first_byte = time.perf_counter()
+        self.telemetry.record_span('ttfb', self.item, self.start,
+                                   self.first_byte, self.host)
+
+    def write_chunk(self, file, hasher, chunk: bytes):
+        start = time.perf_counter()
+        file.write(chunk)
+        written = time.perf_counter()
+        if hasher:
+            hasher.update(chunk)
+        self.write += written - start
+        self.verify += time.perf_counter() - written
+
+    def done(self, downloaded: int):
+        """
+        The body arrived, write and verify are drawn from its start
+        """
+        end = time.perf_counter()
+        start = self.first_byte or self.start
+        record_span = self.telemetry.record_span
+        record_span('transfer', self.item, start, end, self.host, downloaded)
+        record_span('write', self.item, start, start + self.write, self.host)
+        record_span('verify', self.item, start, start + self.verify, self.host)
+
+
+def get_profile_totals(spans: list, key: str) -> dict:
+    """
+    Seconds per stage and bytes of every item or host
+
+    Returns:
+        item or host -> {stage: seconds, 'bytes': bytes, 'total': seconds}
+    """
+    totals = {}
+    for span in spans:
+        if span[key] is None or (key == 'item' and span['stage'] == 'connect'):
+            continue
+        total = totals.setdefault(span[key], {'bytes': 0, 'total': 0})
+        duration = span['end'] - span['start']
+        total[span['stage']] = total.get(span['stage'], 0) + duration
+        total['bytes'] += span['bytes']
+        # write and verify happen during the transfer
+        if span['stage'] not in ('write', 'verify'):
+            total['total'] += duration
+    return totals
@@ -0,0 +1,142 @@
+"""
+Local stand-ins for the CDNs and APIs the tests talk to
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# keep the progress bars of resolving and verifying out of the test output
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route('GET', None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.route('POST', json.loads(self.rfile.read(length) or b'{}'))
+
+    def route(self, method: str, body):
+        url = urlparse(self.path)
+        self.server.requests.append((method, url.path, dict(self.headers)))
+        failures = self.server.failures.get(url.path)
+        if failures:
+            return self.send_failure(*failures.pop(0))
+        if url.path in self.server.files:
+            return self.send_file(self.server.files[url.path])
+        if url.path in self.server.streams:
+            return self.send_stream(self.server.streams[url.path])
+        handler = self.server.routes.get((method, url.path))
+        if handler is None:
+            return self.send_json({'error': url.path}, 404)
+        self.send_json(handler(parse_qs(url.query), body))
+
+    def send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_failure(self, status: int, headers: dict):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_file(self, data: bytes):
+        start = 0
+        range = self.headers.get('Range')
+        if range is not None and self.headers.get('If-Range') in (None, '"v1"'):
+            start = int(range.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def send_stream(self, data: bytes):
+        # chunked, so there is no Content-Length
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(data), 4096):
+            chunk = data[i:i + 4096]
+            self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class FakeServer:
+    """
+    Serves files by path and JSON from handlers, records every request
+
+    Args:
+        files: path -> bytes, served with Range support
+        routes: (method, path) -> handler(query, body) returning the JSON
+        streams: path -> bytes, served chunked without a Content-Length
+        failures: path -> (status, headers) answered in turn before the
+            path is served normally
+    """
+
+    def __init__(self, files: dict = None, routes: dict = None, streams: dict = None,
+                 failures: dict = None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeHandler)
+        self.server.daemon_threads = True
+        self.server.files = files or {}
+        self.server.routes = routes or {}
+        self.server.streams = streams or {}
+        self.server.failures = failures or {}
+        self.server.requests = []
+        self.base = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def requests(self) -> list:
+        return self.server.requests
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class InstanceTestCase(unittest.TestCase):
+    """
+    Runs every test in an empty instance directory with its own cache
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix='kaidame-test-')
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def get_config(self, **settings):
+        from kaidame import Config
+        return Config(root=self.dir, cache_dir=os.path.join(self.dir, 'cache'),
+                      progress=False, **settings)
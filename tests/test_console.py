@@ -0,0 +1,60 @@
+import contextlib
+import io
+import os
+import threading
+import unittest
+
+from kaidame import Telemetry
+from kaidame.cache import ArtifactCache
+from kaidame.console import ProgressRenderer
+
+from .helpers import InstanceTestCase
+
+JOB = {'phases': ['mods'], 'entry': {'filename': 'a.jar', 'size': 10}}
+
+
+class RendererTest(InstanceTestCase):
+
+    def test_message(self):
+        stream = io.StringIO()
+        renderer = ProgressRenderer([JOB], stream=stream)
+        worker = threading.Thread(target=renderer.message, args=['from a worker'])
+        worker.start()
+        worker.join()
+        # only the renderer thread writes
+        self.assertEqual(stream.getvalue(), '')
+        renderer.stop()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], 'from a worker')
+        self.assertTrue(lines[1].startswith('Progress: '))
+        # shown once
+        renderer.render()
+        self.assertEqual(stream.getvalue().count('from a worker'), 1)
+
+    def test_message_without_display(self):
+        stream = io.StringIO()
+        renderer = ProgressRenderer([JOB], show=False, stream=stream)
+        renderer.message('nothing is drawn')
+        self.assertEqual(stream.getvalue(), 'nothing is drawn\n')
+
+    def test_cache_warning(self):
+        config = self.get_config()
+        # the cache can not be created where a file is
+        with open(config.cache_dir, 'w'):
+            pass
+        with open('a.jar', 'w'):
+            pass
+        stream = io.StringIO()
+        renderer = ProgressRenderer([JOB], stream=stream)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            ArtifactCache(config, Telemetry()).store(
+                'a.jar', {'filename': 'a.jar', 'hashes': {'sha1': '0' * 40}}, renderer)
+        renderer.stop()
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('Could not cache a.jar', stream.getvalue())
+        self.assertTrue(os.path.exists('a.jar'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from kaidame.crypto import (
+    ENC_HEADER, ENC_TAG_SIZE, DecryptionError, decrypt_file, encrypt_file, generate_key,
+)
+
+from .helpers import InstanceTestCase
+
+CHUNK_SIZE = 1024
+
+
+class EncTest(InstanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key = generate_key()
+
+    def round_trip(self, data: bytes, executor=None) -> bytes:
+        with open('client.jar', 'wb') as file:
+            file.write(data)
+        encrypt_file(self.key, 'client.jar', 'client.jar.enc', CHUNK_SIZE)
+        decrypt_file(self.key, 'client.jar.enc', 'out/client.jar', executor)
+        with open('out/client.jar', 'rb') as file:
+            return file.read()
+
+    def encrypt(self, data: bytes = b'x' * 3000) -> bytes:
+        with open('client.jar', 'wb') as file:
+            file.write(data)
+        encrypt_file(self.key, 'client.jar', 'client.jar.enc', CHUNK_SIZE)
+        with open('client.jar.enc', 'rb') as file:
+            return file.read()
+
+    def assert_rejected(self, enc: bytes, key: bytes = None):
+        with open('client.jar.enc', 'wb') as file:
+            file.write(enc)
+        with self.assertRaises(DecryptionError):
+            decrypt_file(key or self.key, 'client.jar.enc', 'out/client.jar')
+        self.assertFalse(os.path.exists('out/client.jar'))
+        self.assertFalse(os.path.exists('out/client.jar.tmp'))
+
+    def test_round_trip(self):
+        for size in [0, 1, CHUNK_SIZE, CHUNK_SIZE + 1, 5 * CHUNK_SIZE]:
+            data = os.urandom(size)
+            self.assertEqual(self.round_trip(data), data, size)
+
+    def test_parallel(self):
+        data = os.urandom(10 * CHUNK_SIZE + 7)
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(self.round_trip(data, executor), data)
+
+    def test_progress(self):
+        self.encrypt()
+        read = []
+        decrypt_file(self.key, 'client.jar.enc', 'out/client.jar', progress=read.append)
+        self.assertEqual(sum(read), os.path.getsize('client.jar.enc') - ENC_HEADER.size)
+
+    def test_wrong_key(self):
+        self.assert_rejected(self.encrypt(), generate_key())
+
+    def test_tampered_chunk(self):
+        enc = bytearray(self.encrypt())
+        enc[ENC_HEADER.size + CHUNK_SIZE + 10] ^= 1
+        self.assert_rejected(bytes(enc))
+
+    def test_dropped_chunk(self):
+        # without its last chunk the file ends on a chunk that is not marked final
+        record = CHUNK_SIZE + ENC_TAG_SIZE
+        self.assert_rejected(self.encrypt()[:ENC_HEADER.size + 2 * record])
+
+    def test_swapped_chunks(self):
+        enc = self.encrypt(os.urandom(3 * CHUNK_SIZE))
+        record = CHUNK_SIZE + ENC_TAG_SIZE
+        first = enc[ENC_HEADER.size:ENC_HEADER.size + record]
+        second = enc[ENC_HEADER.size + record:ENC_HEADER.size + 2 * record]
+        self.assert_rejected(enc[:ENC_HEADER.size] + second + first
+                             + enc[ENC_HEADER.size + 2 * record:])
+
+    def test_truncated(self):
+        self.assert_rejected(self.encrypt()[:ENC_HEADER.size + 5])
+
+    def test_other_version(self):
+        enc = bytearray(self.encrypt())
+        enc[6] += 1
+        self.assert_rejected(bytes(enc))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import time
+import unittest
+
+from kaidame import Telemetry, build_installer
+from kaidame.downloader import (
+    WORKER_SAMPLE_INTERVAL, IncompleteDownload, WorkerLimit, check_download, get_job_order,
+    get_resume_headers,
+)
+
+from .helpers import FakeServer, InstanceTestCase
+
+DATA = bytes(range(256)) * 1024
+
+
+class FetchFileTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeServer({'/file.jar': DATA}, streams={'/stream.jar': DATA})
+        cls.url = cls.server.base + '/file.jar'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        self.downloader = build_installer(self.get_config(use_cache=False),
+                                          Telemetry()).downloader
+        os.makedirs('mods')
+
+    def write_part(self, data: bytes):
+        with open('mods/file.jar.part', 'wb') as file:
+            file.write(data)
+        with open('mods/file.jar.part.json', 'w') as file:
+            json.dump({'url': self.url, 'validator': '"v1"'}, file)
+
+    def fetch(self, size=len(DATA), hashes=None, url=None):
+        if hashes is None:
+            hashes = {'sha1': hashlib.sha1(DATA).hexdigest()}
+        self.downloader.fetch_file(url or self.url, 'mods', 'file.jar', True, size, hashes)
+
+    def assert_installed(self):
+        with open('mods/file.jar', 'rb') as file:
+            self.assertEqual(file.read(), DATA)
+        self.assertFalse(os.path.exists('mods/file.jar.part'))
+        self.assertFalse(os.path.exists('mods/file.jar.part.json'))
+
+    def get_ranges(self) -> list:
+        return [headers.get('Range') for _, _, headers in self.server.requests]
+
+    def test_download(self):
+        self.fetch()
+        self.assert_installed()
+        self.assertEqual(self.get_ranges(), [None])
+
+    def test_hash_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.fetch(hashes={'sha1': '0' * 40})
+        self.assertFalse(os.path.exists('mods/file.jar'))
+        self.assertFalse(os.path.exists('mods/file.jar.part'))
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.fetch(size=len(DATA) + 1, hashes={})
+        self.assertFalse(os.path.exists('mods/file.jar'))
+
+    def test_keeps_old_file(self):
+        with open('mods/file.jar', 'wb') as file:
+            file.write(b'old')
+        with self.assertRaises(ValueError):
+            self.fetch(hashes={'sha1': '0' * 40})
+        # only a verified download replaces the installed file
+        with open('mods/file.jar', 'rb') as file:
+            self.assertEqual(file.read(), b'old')
+        self.fetch()
+        self.assert_installed()
+
+    def test_sha512_first(self):
+        # the strongest hash that is known is the one checked
+        self.fetch(hashes={'sha512': hashlib.sha512(DATA).hexdigest(), 'sha1': '0' * 40})
+        self.assert_installed()
+        with self.assertRaises(ValueError):
+            self.fetch(hashes={'sha512': '0' * 128,
+                               'sha1': hashlib.sha1(DATA).hexdigest()})
+
+    def test_no_content_length(self):
+        self.fetch(url=self.server.base + '/stream.jar')
+        self.assert_installed()
+        with self.assertRaises(ValueError):
+            self.fetch(url=self.server.base + '/stream.jar', size=len(DATA) - 1)
+
+    def test_resume(self):
+        self.write_part(DATA[:1000])
+        self.fetch()
+        self.assert_installed()
+        self.assertEqual(self.get_ranges(), ['bytes=1000-'])
+
+    def test_resume_corrupt_part(self):
+        self.write_part(b'\0' * 1000)
+        with self.assertRaises(ValueError):
+            self.fetch()
+        # the next attempt starts over
+        self.fetch()
+        self.assert_installed()
+
+    def test_interrupted_at_end(self):
+        self.write_part(DATA)
+        self.fetch()
+        self.assert_installed()
+        self.assertEqual(self.get_ranges(), [None])
+
+    def test_interrupted_at_end_unknown_size(self):
+        # the server answers the Range with a 416
+        self.write_part(DATA)
+        self.fetch(size=None, hashes={})
+        self.assert_installed()
+        self.assertEqual(self.get_ranges(), [f'bytes={len(DATA)}-', None])
+
+    def test_oversized_part(self):
+        self.write_part(DATA + b'more')
+        self.fetch(size=None)
+        self.assert_installed()
+
+    def test_resume_headers(self):
+        self.assertEqual(get_resume_headers(self.url, 'mods/file.jar.part'), (0, {}))
+        self.write_part(DATA[:10])
+        self.assertEqual(get_resume_headers(self.server.base + '/other.jar',
+                                            'mods/file.jar.part'), (0, {}))
+        self.assertEqual(get_resume_headers(self.url, 'mods/file.jar.part', len(DATA)),
+                         (10, {'Range': 'bytes=10-', 'If-Range': '"v1"'}))
+        self.assertEqual(get_resume_headers(self.url, 'mods/file.jar.part', 10), (0, {}))
+        self.assertFalse(os.path.exists('mods/file.jar.part'))
+
+
+class CheckDownloadTest(unittest.TestCase):
+
+    def test_check_download(self):
+        hasher = hashlib.sha1(DATA)
+        hashes = {'sha1': hasher.hexdigest().upper()}
+        check_download(len(DATA), len(DATA), len(DATA), hasher, hashes)
+        check_download(len(DATA) - 10, None, len(DATA), hasher, hashes, offset=10)
+        check_download(len(DATA), None, None, None, {})
+        with self.assertRaises(IncompleteDownload):
+            check_download(10, 20, None, None, {})
+        with self.assertRaises(ValueError):
+            check_download(10, None, 20, None, {})
+        with self.assertRaises(ValueError):
+            check_download(len(DATA), None, None, hashlib.sha1(b''), hashes)
+
+
+class RetryTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeServer({'/file.jar': DATA})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+
+    def run_job(self, failures: list, **settings) -> list:
+        self.server.server.failures['/file.jar'] = failures
+        config = self.get_config(use_cache=False, use_async=False, backoff_base=0.01,
+                                 **settings)
+        downloader = build_installer(config, Telemetry()).downloader
+        entry = {'url': self.server.base + '/file.jar', 'filename': 'file.jar',
+                 'size': len(DATA), 'hashes': {'sha1': hashlib.sha1(DATA).hexdigest()}}
+        job = {'frame': {'filename': 'file.jar'}, 'entry': entry,
+               'targets': ['mods/'], 'phases': ['mods']}
+        return downloader.run_jobs([job])
+
+    def test_retry_after(self):
+        start = time.monotonic()
+        results = self.run_job([(429, {'Retry-After': '0.5'}), (500, {})])
+        # the 500 only backs off for up to backoff_base * 2
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+        self.assertEqual(results, [True])
+        self.assertEqual(len(self.server.requests), 3)
+        with open('mods/file.jar', 'rb') as file:
+            self.assertEqual(file.read(), DATA)
+
+    def test_retry_after_max(self):
+        start = time.monotonic()
+        results = self.run_job([(503, {'Retry-After': '3600'})], retry_after_max=0.1)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(results, [True])
+
+    def test_attempts(self):
+        results = self.run_job([(500, {})] * 3, max_attempts=3)
+        self.assertEqual(results[0].attempts, 3)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertFalse(os.path.exists('mods/file.jar'))
+
+    def test_not_retryable(self):
+        results = self.run_job([(404, {})])
+        self.assertEqual(results[0].attempts, 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+def make_job(size: int = None) -> dict:
+    return {'frame': {'filename': 'x'}, 'entry': {'filename': 'x', 'size': size},
+            'targets': ['mods/'], 'phases': ['mods']}
+
+
+class JobOrderTest(unittest.TestCase):
+
+    def test_largest_first(self):
+        jobs = [make_job(10), make_job(), make_job(1000), make_job(50), make_job(1000)]
+        # the unknown size counts as the average, 515
+        self.assertEqual(get_job_order(jobs), [2, 4, 1, 3, 0])
+
+    def test_encrypted_source(self):
+        # the encrypted jar is what is downloaded, not the small entry
+        jobs = [make_job(100), dict(make_job(10), decrypt={'source': {'size': 5000}}),
+                dict(make_job(), entry=None)]
+        self.assertEqual(get_job_order(jobs), [1, 2, 0])
+
+    def test_unknown_sizes(self):
+        self.assertEqual(get_job_order([make_job(), make_job(), make_job()]), [0, 1, 2])
+        self.assertEqual(get_job_order([]), [])
+
+
+class WorkerLimitTest(unittest.TestCase):
+
+    def sample(self, limit: WorkerLimit, rates: list) -> list:
+        """
+        Feed one sample per rate in bytes per second, returns the limits
+        """
+        now, transferred = 0, 0
+        limit.update(now, transferred, True)
+        limits = []
+        for rate in rates:
+            now += WORKER_SAMPLE_INTERVAL
+            transferred += rate * WORKER_SAMPLE_INTERVAL
+            limits.append(limit.update(now, transferred, True))
+        return limits
+
+    def test_grow_and_settle(self):
+        limit = WorkerLimit(2, 16)
+        # 8 workers are no faster than 4, so it goes back to 4 and stays there
+        self.assertEqual(self.sample(limit, [1000, 2000, 2100, 10000]), [4, 8, 4, 4])
+        self.assertTrue(limit.settled)
+
+    def test_errors(self):
+        # failed jobs move no bytes, which undoes the doubling that caused them
+        limit = WorkerLimit(2, 16)
+        self.assertEqual(self.sample(limit, [1000, 0]), [4, 2])
+        self.assertTrue(limit.settled)
+
+    def test_maximum(self):
+        limit = WorkerLimit(2, 3)
+        # the maximum is measured once before it is kept
+        self.assertEqual(self.sample(limit, [1000, 2000]), [3, 3])
+        self.assertTrue(limit.settled)
+        self.assertTrue(WorkerLimit(8, 4).settled)
+        self.assertEqual(WorkerLimit(8, 4).limit, 4)
+        self.assertEqual(WorkerLimit(0, 4).limit, 1)
+
+    def test_samples(self):
+        limit = WorkerLimit(2, 16)
+        limit.update(0, 0, True)
+        # too short for a sample
+        self.assertEqual(limit.update(WORKER_SAMPLE_INTERVAL / 2, 1000, True), 2)
+        # while the queue waits on backoffs the limit does not hold it back,
+        # the idle time does not count as a slow sample
+        self.assertEqual(limit.update(10, 1000, False), 2)
+        self.assertEqual(limit.update(10 + WORKER_SAMPLE_INTERVAL, 2000, True), 4)
+        self.assertFalse(limit.settled)
+
+
+@unittest.skipIf(importlib.util.find_spec('aiohttp') is None, 'needs aiohttp')
+class AsyncFetchFileTest(FetchFileTest):
+    """
+    The same cases with the asyncio engine
+    """
+
+    def fetch(self, size=len(DATA), hashes=None, url=None):
+        import aiohttp
+        from kaidame.aio import AsyncDownloader
+        if hashes is None:
+            hashes = {'sha1': hashlib.sha1(DATA).hexdigest()}
+
+        async def fetch():
+            async with aiohttp.ClientSession() as session:
+                await AsyncDownloader(self.downloader, session).fetch_file(
+                    url or self.url, 'mods', 'file.jar', size, hashes)
+        asyncio.run(fetch())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import unittest
+import zipfile
+
+from kaidame import Config
+from kaidame.exporter import (
+    DELTA_BACKUP, DELTA_JOURNAL, DELTA_MANIFEST, Exporter, get_delta_path, rollback_delta,
+)
+
+from .helpers import InstanceTestCase
+
+FILES = {
+    'config/a.toml': b'a = 1\n',
+    'config/sub/b.json': b'{"b": 2}\n',
+    'mods/old.jar': b'old jar',
+    'mods/same.jar': b'same jar' * 1000,
+}
+
+
+def write_files(root: str, files: dict):
+    for name, data in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+
+def read_files(root: str) -> dict:
+    files = {}
+    for dir in ['config', 'mods']:
+        for parent, _, names in os.walk(os.path.join(root, dir)):
+            for name in names:
+                path = os.path.join(parent, name)
+                with open(path, 'rb') as file:
+                    files[os.path.relpath(path, root).replace(os.sep, '/')] = file.read()
+    return files
+
+
+class DeltaTest(InstanceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.dir, 'source')
+        self.target = os.path.join(self.dir, 'target')
+        write_files(self.source, FILES)
+        self.run_quietly(Exporter(Config(root=self.source)).export_client)
+        # the target starts out as the full export
+        with zipfile.ZipFile(os.path.join(self.source, 'client.zip')) as zf:
+            zf.extractall(self.target)
+        # then the source changes
+        write_files(self.source, {'config/a.toml': b'a = 2\n', 'mods/new.jar': b'new jar'})
+        os.remove(os.path.join(self.source, 'mods/old.jar'))
+        self.delta = os.path.join(self.source, 'client-delta.zip')
+        self.assertTrue(self.run_quietly(
+            Exporter(Config(root=self.source)).export_client, None,
+            os.path.join(self.source, 'client.zip.index.json')))
+
+    def run_quietly(self, function, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args)
+
+    def apply(self) -> bool:
+        return self.run_quietly(Exporter(Config(root=self.target)).apply_delta, self.delta)
+
+    def test_delta_archive(self):
+        with zipfile.ZipFile(self.delta) as zf:
+            self.assertEqual(sorted(zf.namelist()),
+                             sorted([DELTA_MANIFEST, 'config/a.toml', 'mods/new.jar']))
+            manifest = json.loads(zf.read(DELTA_MANIFEST))
+        self.assertEqual(manifest['deleted'], ['mods/old.jar'])
+        self.assertEqual(sorted(manifest['files']), sorted(read_files(self.source)))
+
+    def test_apply(self):
+        self.assertTrue(self.apply())
+        self.assertEqual(read_files(self.target), read_files(self.source))
+        self.assertFalse(os.path.exists(os.path.join(self.target, DELTA_JOURNAL)))
+        self.assertFalse(os.path.exists(os.path.join(self.target, DELTA_BACKUP)))
+        # applying it again changes nothing
+        self.assertTrue(self.apply())
+        self.assertEqual(read_files(self.target), read_files(self.source))
+
+    def test_local_change(self):
+        write_files(self.target, {'config/a.toml': b'a = 3\n'})
+        before = read_files(self.target)
+        self.assertFalse(self.apply())
+        self.assertEqual(read_files(self.target), before)
+
+    def test_corrupt_delta(self):
+        with zipfile.ZipFile(self.delta) as zf:
+            entries = {name: zf.read(name) for name in zf.namelist()}
+        entries['mods/new.jar'] = b'not the new jar'
+        with zipfile.ZipFile(self.delta, 'w') as zf:
+            for name, data in entries.items():
+                zf.writestr(name, data)
+        before = read_files(self.target)
+        self.assertFalse(self.apply())
+        self.assertEqual(read_files(self.target), before)
+
+    def test_rollback(self):
+        before = read_files(self.target)
+        # interrupted after replacing a.toml and adding new.jar
+        backup = os.path.join(self.target, DELTA_BACKUP)
+        os.makedirs(os.path.join(backup, 'config'))
+        shutil.move(os.path.join(self.target, 'config/a.toml'),
+                    os.path.join(backup, 'config/a.toml'))
+        write_files(self.target, {'config/a.toml': b'a = 2\n', 'mods/new.jar': b'new jar'})
+        with open(os.path.join(self.target, DELTA_JOURNAL), 'w') as file:
+            json.dump({'files': ['config/a.toml', 'mods/new.jar', 'mods/old.jar'],
+                       'existed': ['config/a.toml', 'mods/old.jar']}, file)
+        self.assertTrue(rollback_delta(self.target))
+        self.assertEqual(read_files(self.target), before)
+        self.assertFalse(os.path.exists(backup))
+        self.assertFalse(rollback_delta(self.target))
+
+    def test_interrupted_apply(self):
+        write_files(self.target, {'mods/new.jar': b'half'})
+        with open(os.path.join(self.target, DELTA_JOURNAL), 'w') as file:
+            json.dump({'files': ['mods/new.jar'], 'existed': []}, file)
+        # the interrupted delta is rolled back before the next one is applied
+        self.assertTrue(self.apply())
+        self.assertEqual(read_files(self.target), read_files(self.source))
+
+    def test_delta_path(self):
+        self.assertEqual(get_delta_path(self.target, 'mods/x.jar'),
+                         os.path.join(self.target, 'mods', 'x.jar'))
+        for arcname in ['../x.jar', 'mods/../../x.jar', '/etc/x.jar']:
+            with self.assertRaises(ValueError):
+                get_delta_path(self.target, arcname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import json
+import os
+import unittest
+import zipfile
+
+from kaidame.jars import (
+    JarIndex, get_jar_problems, is_fabric_match, is_in_fabric_range, is_in_maven_range,
+    parse_mods_toml, parse_plugin_yml, parse_version, read_jar_metadata,
+)
+
+from .helpers import InstanceTestCase
+
+MODS_TOML = '''
+modLoader="javafml" # the loader
+loaderVersion="[47,)"
+license='MIT'
+
+[[mods]]
+modId="examplemod"
+version="1.2.3"
+description=\'\'\'
+A mod with [[brackets]] and modId="fake" in its description
+\'\'\'
+
+[[mods]]
+modId = "examplelib"
+version = "1.0"
+
+[modproperties.examplemod]
+modId="properties"
+
+[[dependencies.examplemod]]
+modId="forge"
+mandatory=true
+versionRange="[47,)"
+
+[[dependencies.examplemod]]
+modId="minecraft"
+mandatory=true
+versionRange="[1.20,1.21)"
+
+[[dependencies."examplelib"]]
+modId="jei"
+type="optional"
+'''
+
+
+def write_jar(path: str, files: dict):
+    with zipfile.ZipFile(path, 'w') as jar:
+        for name, text in files.items():
+            jar.writestr(name, text)
+
+
+def mods_toml(mod_id: str, minecraft: str = '[1.20,1.21)',
+              loader: str = 'forge') -> str:
+    return (f'[[mods]]\nmodId="{mod_id}"\nversion="1"\n'
+            f'[[dependencies.{mod_id}]]\nmodId="{loader}"\nmandatory=true\n'
+            f'[[dependencies.{mod_id}]]\nmodId="minecraft"\nmandatory=true\n'
+            f'versionRange="{minecraft}"\n')
+
+
+class VersionTest(unittest.TestCase):
+
+    def test_parse_version(self):
+        self.assertEqual(parse_version('1.20.1'), (1, 20, 1))
+        self.assertEqual(parse_version('1.20.1-pre2'), (1, 20, 1))
+        self.assertIsNone(parse_version('${version}'))
+
+    def test_maven_range(self):
+        self.assertTrue(is_in_maven_range('1.20.1', '[1.20,1.21)'))
+        self.assertTrue(is_in_maven_range('1.20', '[1.20,1.21)'))
+        self.assertFalse(is_in_maven_range('1.21', '[1.20,1.21)'))
+        self.assertTrue(is_in_maven_range('1.21', '[1.20,1.21]'))
+        self.assertFalse(is_in_maven_range('1.20', '(1.20,1.21]'))
+        self.assertTrue(is_in_maven_range('1.20.1', '[1.20.1]'))
+        self.assertFalse(is_in_maven_range('1.20.2', '[1.20.1]'))
+        self.assertTrue(is_in_maven_range('1.20.1', '[1.19,)'))
+        self.assertFalse(is_in_maven_range('1.18.2', '[1.19,)'))
+        self.assertTrue(is_in_maven_range('1.16.5', '(,1.17)'))
+        self.assertTrue(is_in_maven_range('1.20.1', '[1.18,1.19),[1.20,1.21)'))
+        # a bare version is only a recommendation
+        self.assertTrue(is_in_maven_range('1.20.1', '1.19.2'))
+        self.assertTrue(is_in_maven_range('1.20.1', '*'))
+
+    def test_fabric_match(self):
+        current = (1, 20, 1)
+        self.assertTrue(is_fabric_match(current, '>=1.20'))
+        self.assertFalse(is_fabric_match(current, '>1.20.1'))
+        self.assertTrue(is_fabric_match(current, '<1.21'))
+        self.assertTrue(is_fabric_match(current, '~1.20'))
+        self.assertFalse(is_fabric_match((1, 21), '~1.20'))
+        self.assertTrue(is_fabric_match(current, '^1.19'))
+        self.assertFalse(is_fabric_match((2, 0), '^1.19'))
+        self.assertTrue(is_fabric_match(current, '1.20.x'))
+        self.assertFalse(is_fabric_match(current, '1.19.x'))
+        self.assertTrue(is_fabric_match(current, '*'))
+        self.assertTrue(is_fabric_match(current, '1.20.1'))
+        self.assertFalse(is_fabric_match(current, '=1.20'))
+
+    def test_fabric_range(self):
+        self.assertTrue(is_in_fabric_range('1.20.1', '>=1.20 <1.21'))
+        self.assertFalse(is_in_fabric_range('1.21', '>=1.20 <1.21'))
+        self.assertTrue(is_in_fabric_range('1.20.1', ['1.19.x', '1.20.x']))
+        self.assertFalse(is_in_fabric_range('1.18.2', ['1.19.x', '1.20.x']))
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_mods_toml(self):
+        data = parse_mods_toml(MODS_TOML)
+        self.assertEqual(data['modLoader'], 'javafml')
+        self.assertEqual(data['license'], 'MIT')
+        self.assertEqual([mod['modId'] for mod in data['mods']],
+                         ['examplemod', 'examplelib'])
+        self.assertEqual(data['mods'][0]['version'], '1.2.3')
+        self.assertEqual(len(data['dependencies']['examplemod']), 2)
+        self.assertEqual(data['dependencies']['examplemod'][1]['versionRange'],
+                         '[1.20,1.21)')
+        self.assertIs(data['dependencies']['examplemod'][0]['mandatory'], True)
+        self.assertEqual(data['dependencies']['examplelib'][0]['type'], 'optional')
+
+    def test_plugin_yml(self):
+        data = parse_plugin_yml('name: Example\nversion: "2.0"\n'
+                                "api-version: '1.20' # comment\n"
+                                'commands:\n  example:\n    usage: /example\n')
+        self.assertEqual(data, {'name': 'Example', 'version': '2.0',
+                                'api-version': '1.20', 'commands': ''})
+
+
+class JarTest(InstanceTestCase):
+
+    def test_read_jar_metadata(self):
+        write_jar('forge.jar', {'META-INF/mods.toml': MODS_TOML})
+        write_jar('fabric.jar', {'fabric.mod.json': json.dumps(
+            {'id': 'fabricmod', 'version': '1', 'depends': {'minecraft': '~1.20'}})})
+        write_jar('plugin.jar', {'plugin.yml': 'name: Plugin\napi-version: 1.20\n'})
+        write_jar('empty.jar', {'README': ''})
+        with open('broken.jar', 'wb') as file:
+            file.write(b'not a zip')
+        self.assertEqual(read_jar_metadata('forge.jar')['mods'], [
+            {'id': 'examplemod', 'version': '1.2.3', 'loader': 'forge',
+             'minecraft': '[1.20,1.21)'},
+            {'id': 'examplelib', 'version': '1.0', 'loader': 'forge',
+             'minecraft': None},
+        ])
+        self.assertEqual(read_jar_metadata('fabric.jar')['mods'], [
+            {'id': 'fabricmod', 'version': '1', 'loader': 'fabric',
+             'minecraft': '~1.20'}])
+        self.assertEqual(read_jar_metadata('plugin.jar')['mods'], [
+            {'id': 'Plugin', 'version': '', 'loader': 'bukkit', 'minecraft': '1.20'}])
+        self.assertEqual(read_jar_metadata('empty.jar'), {'mods': []})
+        self.assertIn('error', read_jar_metadata('broken.jar'))
+
+    def test_neoforge(self):
+        write_jar('neo.jar', {'META-INF/mods.toml': mods_toml('neomod', loader='neoforge')})
+        self.assertEqual(read_jar_metadata('neo.jar')['mods'][0]['loader'], 'neoforge')
+
+    def test_jar_problems(self):
+        jars = {
+            'a.jar': mods_toml('shared'),
+            'b.jar': mods_toml('shared'),
+            'old.jar': mods_toml('oldmod', minecraft='[1.16,1.17)'),
+            'neo.jar': mods_toml('neomod', loader='neoforge'),
+            'ok.jar': mods_toml('okmod'),
+        }
+        for filename, text in jars.items():
+            write_jar(filename, {'META-INF/mods.toml': text})
+        write_jar('empty.jar', {'README': ''})
+        records = {filename: read_jar_metadata(filename)
+                   for filename in list(jars) + ['empty.jar']}
+        errors, warnings = get_jar_problems('mods', records, ['forge'], '1.20.1')
+        self.assertEqual(sorted(path for path, _ in errors),
+                         ['mods', 'mods/neo.jar', 'mods/old.jar'])
+        self.assertIn('a.jar, b.jar', dict(errors)['mods'])
+        self.assertIn('[1.16,1.17)', dict(errors)['mods/old.jar'])
+        self.assertEqual([path for path, _ in warnings], ['mods/empty.jar'])
+
+    def test_index(self):
+        write_jar('a.jar', {'META-INF/mods.toml': mods_toml('amod')})
+        index = JarIndex(self.get_config())
+        record = index.lookup('a.jar', 'a' * 40)
+        index.write()
+        os.remove('a.jar')
+        # known hashes are not read from the jar again, not even by another run
+        self.assertEqual(JarIndex(self.get_config()).lookup('a.jar', 'a' * 40), record)
+        self.assertIn('error', index.lookup('a.jar', 'b' * 40))
+        self.assertNotIn('b' * 40, index.records)
+
+    def test_plugin_problems(self):
+        records = {'new.jar': {'mods': [{'id': 'New', 'version': '', 'loader': 'bukkit',
+                                         'minecraft': '1.21'}]},
+                   'old.jar': {'mods': [{'id': 'Old', 'version': '', 'loader': 'bukkit',
+                                         'minecraft': '1.13'}]}}
+        errors, warnings = get_jar_problems('plugins', records, ['bukkit'], '1.20.1')
+        self.assertEqual([path for path, _ in errors], ['plugins/new.jar'])
+        # Paper runs Bukkit plugins
+        errors, _ = get_jar_problems('plugins', records, ['paper'], '1.21')
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
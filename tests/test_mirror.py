@@ -0,0 +1,83 @@
+import contextlib
+import io
+import os
+import unittest
+
+from kaidame import HTTPClient, Telemetry
+from kaidame.mirror import (
+    MIRROR_MANIFEST, MIRROR_VERSION, get_mirror_tables, get_safe_path,
+    is_safe_filename, parse_range,
+)
+
+from .helpers import FakeServer, InstanceTestCase
+
+
+class PathTest(unittest.TestCase):
+
+    def test_safe_filename(self):
+        self.assertTrue(is_safe_filename('jei-1.20.1.jar'))
+        for filename in ['', '.', '..', '../x.jar', 'mods/../../x.jar',
+                         'sub/x.jar', 'sub\\x.jar', '/etc/x.jar',
+                         os.path.abspath('x.jar'), None]:
+            self.assertFalse(is_safe_filename(filename), filename)
+
+    def test_safe_path(self):
+        self.assertEqual(get_safe_path('config/fml.toml'),
+                         os.path.join('config', 'fml.toml'))
+        self.assertEqual(get_safe_path('config/ae2/client.json'),
+                         os.path.join('config', 'ae2', 'client.json'))
+        for path in ['config', 'mods/x.jar', 'config/../x', 'config/../../x',
+                     '/config/x', os.path.abspath('config/x'), 'configx/y']:
+            self.assertIsNone(get_safe_path(path), path)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 19))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+
+class MirrorTablesTest(InstanceTestCase):
+
+    def test_hostile_manifest(self):
+        def manifest(query, body):
+            row = {'url': '/files/x.jar', 'size': 1, 'hashes': {'sha1': '0' * 40}}
+            return {
+                'version': MIRROR_VERSION,
+                'getters': {
+                    'common.csv': [dict(row, filename='ok.jar'),
+                                   dict(row, filename='../evil.jar'),
+                                   dict(row, filename='/tmp/evil.jar'),
+                                   dict(row, filename='sub/evil.jar')],
+                    '../evil.csv': [dict(row, filename='ok.jar')],
+                },
+                'files': [dict(row, path='config/ok.toml'),
+                          dict(row, path='config/../evil.toml'),
+                          dict(row, path='/etc/evil.toml')],
+            }
+        server = FakeServer(routes={('GET', MIRROR_MANIFEST): manifest})
+        try:
+            config = self.get_config()
+            telemetry = Telemetry()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                tables, files = get_mirror_tables(HTTPClient(config, telemetry),
+                                                  server.base)
+        finally:
+            server.close()
+        self.assertEqual(output.getvalue().count('Ignoring'), 5)
+        self.assertEqual(list(tables), ['common.csv'])
+        self.assertEqual([entry['filename'] for _, entry in tables['common.csv']],
+                         ['ok.jar'])
+        self.assertEqual(tables['common.csv'][0][1]['url'],
+                         server.base + '/files/x.jar')
+        self.assertEqual([file['path'] for file in files],
+                         [os.path.join('config', 'ok.toml')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,459 @@
+import asyncio
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import unittest
+
+from kaidame import Telemetry, build_installer
+
+from .helpers import FakeServer, InstanceTestCase
+
+PROJECTS = ['AAAAAAAA', 'BBBBBBBB', 'CCCCCCCC', 'LIBLIBLI']
+
+
+def make_version(project_id: str, number: int, game_version: str = '1.20.1',
+                 loader: str = 'forge', dependencies: dict = None) -> dict:
+    filename = f'{project_id}-{number}.jar'
+    return {
+        'id': f'{project_id}{number}', 'project_id': project_id,
+        'game_versions': [game_version], 'loaders': [loader],
+        'date_published': (datetime.datetime(2024, 1, 1)
+                           + datetime.timedelta(hours=number)).isoformat() + 'Z',
+        'dependencies': [{'project_id': dependency, 'dependency_type': type}
+                         for dependency, type in (dependencies or {}).items()],
+        'files': [{'url': f'https://cdn.example/{filename}', 'filename': filename,
+                   'size': 100 + number, 'primary': True,
+                   'hashes': {'sha1': f'{project_id}{number}'.lower().ljust(40, '0')}}],
+    }
+
+
+# the newest version of every project is for another game version or loader
+VERSIONS = {project_id: [make_version(project_id, 1), make_version(project_id, 2),
+                         make_version(project_id, 3, game_version='1.21'),
+                         make_version(project_id, 4, loader='fabric')]
+            for project_id in PROJECTS}
+# like most of the shipped getters: a long history, a third of it for 1.20.1
+LONG_PROJECTS = [f'LONG{i:04d}' for i in range(138)]
+VERSIONS.update({project_id: [make_version(project_id, number, game_version=(
+                     '1.20.1' if number % 3 == 0 else '1.19.2'))
+                              for number in range(1, 151)]
+                 for project_id in LONG_PROJECTS})
+# APP needs LIB, which needs CORE, which needs LIB again
+DEPENDENCIES = {
+    'DEPAPP01': {'DEPLIB01': 'required', 'DEPOPT01': 'optional'},
+    'DEPLIB01': {'DEPCORE1': 'required'},
+    'DEPCORE1': {'DEPLIB01': 'required'},
+    'DEPOPT01': {},
+    'DEPBAD01': {'MISSING1': 'required'},
+}
+VERSIONS.update({project_id: [make_version(project_id, 1, dependencies=dependencies)]
+                 for project_id, dependencies in DEPENDENCIES.items()})
+
+
+def get_projects(query, body):
+    ids = json.loads(query['ids'][0])
+    return [{'id': project_id, 'slug': project_id.lower(),
+             'game_versions': ['1.20.1', '1.21'], 'loaders': ['forge', 'fabric'],
+             'versions': [version['id'] for version in VERSIONS[project_id]]}
+            for project_id in ids if project_id in VERSIONS]
+
+
+def get_versions(query, body):
+    ids = set(json.loads(query['ids'][0]))
+    return [version for versions in VERSIONS.values() for version in versions
+            if version['id'] in ids]
+
+
+def get_updates(query, body):
+    updates = {}
+    for versions in VERSIONS.values():
+        for version in versions:
+            if version['files'][0]['hashes']['sha1'] in body['hashes']:
+                updates[version['files'][0]['hashes']['sha1']] = versions[1]
+    return updates
+
+
+def get_project_versions(project_id):
+    def handler(query, body):
+        game_versions = json.loads(query['game_versions'][0])
+        loaders = json.loads(query['loaders'][0])
+        return [version for version in VERSIONS[project_id]
+                if set(game_versions) & set(version['game_versions'])
+                and set(loaders) & set(version['loaders'])]
+    return handler
+
+
+def start_server() -> FakeServer:
+    routes = {
+        ('GET', '/v2/projects'): get_projects,
+        ('GET', '/v2/versions'): get_versions,
+        ('POST', '/v2/version_files/update'): get_updates,
+    }
+    for project_id in VERSIONS:
+        routes[('GET', f'/v2/project/{project_id}/version')] = (
+            get_project_versions(project_id))
+    return FakeServer(routes=routes)
+
+
+class ResolverTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        config = self.get_config(
+            modrinth_base_url=self.server.base, modrinth_api=self.server.base + '/v2',
+            use_cache=False, follow_dependencies=False)
+        self.resolver = build_installer(config, Telemetry()).resolver
+
+    def get_frames(self, project_ids=PROJECTS) -> list:
+        return [{'url': f'{self.server.base}/data/{project_id}', 'filename': project_id,
+                 'loader': 'forge', 'comment': ''} for project_id in project_ids]
+
+    def get_paths(self) -> list:
+        return sorted(path for _, path, _ in self.server.requests)
+
+    def test_cold_bulk(self):
+        results = self.resolver.resolve_frames(self.get_frames())
+        self.assertEqual([entry['filename'] for entry in results],
+                         [f'{project_id}-2.jar' for project_id in PROJECTS])
+        self.assertEqual(results[0]['source']['filename'], 'AAAAAAAA')
+        # one request for all projects and one for all their versions
+        self.assertEqual(self.get_paths(), ['/v2/projects', '/v2/versions'])
+
+    def test_long_histories(self):
+        frames = self.get_frames(PROJECTS[:2] + LONG_PROJECTS)
+        results = self.resolver.resolve_frames(frames)
+        self.assertEqual([entry['filename'] for entry in results],
+                         [f'{project_id}-2.jar' for project_id in PROJECTS[:2]]
+                         + [f'{project_id}-150.jar' for project_id in LONG_PROJECTS])
+        paths = self.get_paths()
+        # whole histories are only fetched for the short ones, the long ones
+        # are asked for their matching versions only
+        self.assertEqual(paths.count('/v2/projects'), 2)
+        self.assertEqual(paths.count('/v2/versions'), 1)
+        self.assertEqual(len(paths), 3 + len(LONG_PROJECTS))
+        for project_id in PROJECTS[:2]:
+            self.assertNotIn(f'/v2/project/{project_id}/version', paths)
+
+    def test_known_bulk(self):
+        known = {frame['url']: VERSIONS[frame['filename']][0]['files'][0]['hashes']['sha1']
+                 for frame in self.get_frames()}
+        results = self.resolver.resolve_frames(self.get_frames(), known=known)
+        self.assertEqual([entry['filename'] for entry in results],
+                         [f'{project_id}-2.jar' for project_id in PROJECTS])
+        self.assertEqual(self.get_paths(), ['/v2/version_files/update'])
+
+    def test_unknown_project(self):
+        results = self.resolver.resolve_frames(self.get_frames(['AAAAAAAA', 'MISSING0']))
+        self.assertEqual(results[0]['filename'], 'AAAAAAAA-2.jar')
+        # left to the row by row lookup, which fails
+        self.assertIsInstance(results[1], Exception)
+        self.assertIn('/v2/project/MISSING0/version', self.get_paths())
+
+    def test_duplicate_rows(self):
+        frames = self.get_frames(['AAAAAAAA', 'AAAAAAAA'])
+        frames[1]['filename'] = 'again'
+        results = self.resolver.resolve_frames(frames)
+        self.assertEqual(results[0]['filename'], results[1]['filename'])
+        self.assertEqual(results[1]['source']['filename'], 'again')
+
+    @unittest.skipIf(importlib.util.find_spec('aiohttp') is None, 'needs aiohttp')
+    def test_async_row(self):
+        import aiohttp
+        from kaidame.aio import AsyncDownloader
+        config = self.get_config(modrinth_base_url=self.server.base,
+                                 modrinth_api=self.server.base + '/v2')
+        telemetry = Telemetry()
+        downloader = build_installer(config, telemetry).downloader
+        frame = self.get_frames(['BBBBBBBB'])[0]
+
+        async def resolve():
+            async with aiohttp.ClientSession() as session:
+                return await AsyncDownloader(downloader, session).resolve_file(frame)
+        self.assertEqual(asyncio.run(resolve())['filename'], 'BBBBBBBB-2.jar')
+        # the second lookup comes from the metadata cache
+        self.assertEqual(asyncio.run(resolve())['filename'], 'BBBBBBBB-2.jar')
+        self.assertEqual(self.get_paths(), ['/v2/project/BBBBBBBB/version'])
+        self.assertEqual(telemetry.cache_stats['fetched'], 1)
+        self.assertEqual(telemetry.cache_stats['fresh'], 1)
+
+
+class DependencyTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        os.mkdir('getters')
+        config = self.get_config(
+            modrinth_base_url=self.server.base, modrinth_api=self.server.base + '/v2',
+            use_cache=False)
+        self.resolver = build_installer(config, Telemetry()).resolver
+
+    def write_csv(self, csv_name: str, project_ids: list):
+        with open(f'getters/{csv_name}', 'w') as file:
+            file.write('url,filename,loader,comment\n')
+            for project_id in project_ids:
+                file.write(f'{self.server.base}/data/{project_id},{project_id},forge,\n')
+
+    def get_entries(self, csv_names: list) -> dict:
+        self.output = io.StringIO()
+        with contextlib.redirect_stdout(self.output):
+            tables = self.resolver.get_entries(csv_names)
+        return {csv_name: [entry if isinstance(entry, Exception) else entry['filename']
+                           for _, entry in items]
+                for csv_name, items in tables.items()}
+
+    def test_required_only(self):
+        self.write_csv('common.csv', ['DEPAPP01'])
+        # LIB and CORE, one level after the other, not the optional one and
+        # nothing twice for the cycle
+        self.assertEqual(self.get_entries(['common.csv']), {
+            'common.csv': ['DEPAPP01-1.jar', 'DEPLIB01-1.jar', 'DEPCORE1-1.jar']})
+
+    def test_listed_dependency(self):
+        self.write_csv('common.csv', ['DEPAPP01', 'DEPCORE1'])
+        self.assertEqual(self.get_entries(['common.csv']), {
+            'common.csv': ['DEPAPP01-1.jar', 'DEPCORE1-1.jar', 'DEPLIB01-1.jar']})
+
+    def test_common_dependency(self):
+        # common.csv is installed along with server.csv, LIB is not added twice
+        self.write_csv('server.csv', ['DEPAPP01'])
+        self.write_csv('common.csv', ['DEPLIB01'])
+        self.assertEqual(self.get_entries(['server.csv', 'common.csv']), {
+            'server.csv': ['DEPAPP01-1.jar'],
+            'common.csv': ['DEPLIB01-1.jar', 'DEPCORE1-1.jar']})
+
+    def test_missing_dependency(self):
+        self.write_csv('common.csv', ['DEPBAD01'])
+        entries = self.get_entries(['common.csv'])['common.csv']
+        self.assertEqual(entries[0], 'DEPBAD01-1.jar')
+        self.assertIsInstance(entries[1], Exception)
+        self.assertIn('Missing dependency modrinth:MISSING1 of DEPBAD01',
+                      self.output.getvalue())
+
+    def test_locked_dependencies(self):
+        self.write_csv('common.csv', ['DEPAPP01'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(self.resolver.lock_files())
+        self.server.requests.clear()
+        self.assertEqual(self.get_entries(['common.csv']), {
+            'common.csv': ['DEPAPP01-1.jar', 'DEPLIB01-1.jar', 'DEPCORE1-1.jar']})
+        self.assertEqual(self.server.requests, [])
+
+
+def make_file(file_id: int, mod_id: int, game_versions: list) -> dict:
+    return {'id': file_id, 'modId': mod_id, 'fileName': f'{mod_id}-{file_id}.jar',
+            'fileLength': file_id, 'gameVersions': game_versions,
+            'fileDate': f'2024-01-01T00:00:{file_id % 60:02d}Z',
+            'downloadUrl': f'https://edge.example/{mod_id}-{file_id}.jar',
+            'hashes': [{'algo': 1, 'value': f'{file_id}'.ljust(40, '0')}],
+            'dependencies': []}
+
+
+FORGE_1_20 = ['1.20.1', 'Forge']
+CURSEFORGE_FILES = {file['id']: file for file in [
+    make_file(1000, 101, ['1.19.2', 'Forge']),
+    make_file(1001, 101, FORGE_1_20),
+    make_file(1002, 101, FORGE_1_20),
+    dict(make_file(1003, 102, ['1.20.1', 'Fabric']), downloadUrl=None),
+    make_file(1004, 103, FORGE_1_20),
+    make_file(1005, 104, FORGE_1_20),
+]}
+CURSEFORGE_MODS = {
+    # the newest of several files for the game version and loader is picked
+    101: [(1000, '1.19.2', 1), (1001, '1.20.1', 1), (1002, '1.20.1', 1)],
+    102: [(1003, '1.20.1', 4)],
+    # no index for 1.20.1 Forge
+    103: [(1000, '1.19.2', 1)],
+    # its file is missing from /mods/files
+    104: [(9999, '1.20.1', 1)],
+}
+
+
+def get_mods(query, body):
+    return {'data': [
+        {'id': mod_id, 'latestFilesIndexes': [
+            {'fileId': file_id, 'gameVersion': game_version, 'modLoader': loader}
+            for file_id, game_version, loader in CURSEFORGE_MODS[mod_id]]}
+        for mod_id in body['modIds'] if mod_id in CURSEFORGE_MODS]}
+
+
+def get_files(query, body):
+    return {'data': [CURSEFORGE_FILES[file_id] for file_id in body['fileIds']
+                     if file_id in CURSEFORGE_FILES]}
+
+
+def get_mod_files(mod_id):
+    return lambda query, body: {'data': [file for file in CURSEFORGE_FILES.values()
+                                         if file['modId'] == mod_id]}
+
+
+class CurseForgeTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        routes = {
+            ('GET', '/key'): lambda query, body: {'token': 'key'},
+            ('POST', '/v1/mods'): get_mods,
+            ('POST', '/v1/mods/files'): get_files,
+        }
+        for mod_id in [103, 104]:
+            routes[('GET', f'/v1/mods/{mod_id}/files')] = get_mod_files(mod_id)
+        cls.server = FakeServer(routes=routes)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        config = self.get_config(
+            curseforge_api=self.server.base + '/v1',
+            curseforge_api_key=self.server.base + '/key',
+            curseforge_cdn='https://cdn.example',
+            use_cache=False, follow_dependencies=False)
+        self.resolver = build_installer(config, Telemetry()).resolver
+
+    def get_frames(self, rows: list) -> list:
+        return [{'url': f'{self.server.base}/v1/mods/{mod_id}', 'filename': str(mod_id),
+                 'loader': loader, 'comment': ''} for mod_id, loader in rows]
+
+    def get_paths(self) -> list:
+        return [path for _, path, _ in self.server.requests]
+
+    def test_bulk(self):
+        results = self.resolver.resolve_frames(
+            self.get_frames([(101, 'forge'), (102, 'fabric'), (101, 'forge')]))
+        self.assertEqual([entry['filename'] for entry in results],
+                         ['101-1002.jar', '102-1003.jar', '101-1002.jar'])
+        self.assertEqual(results[0]['hashes'], {'sha1': '1002'.ljust(40, '0')})
+        self.assertEqual(results[0]['project'], 'curseforge:101')
+        # files without a downloadUrl come from the CDN
+        self.assertEqual(results[1]['url'], 'https://cdn.example/files/1/3/102-1003.jar')
+        self.assertEqual(self.get_paths(), ['/key', '/v1/mods', '/v1/mods/files'])
+        for _, path, headers in self.server.requests[1:]:
+            self.assertEqual(headers['x-api-key'], 'key')
+
+    def test_missing_rows(self):
+        results = self.resolver.resolve_frames(
+            self.get_frames([(101, 'forge'), (103, 'forge'), (104, 'forge'),
+                             (105, 'forge')]))
+        self.assertEqual(results[0]['filename'], '101-1002.jar')
+        # the rows the bulk lookup could not resolve are looked up one by one
+        self.assertEqual(results[1]['filename'], '103-1004.jar')
+        self.assertEqual(results[2]['filename'], '104-1005.jar')
+        self.assertIsInstance(results[3], Exception)
+        self.assertEqual(sorted(self.get_paths()[1:]),
+                         ['/v1/mods', '/v1/mods/103/files', '/v1/mods/104/files',
+                          '/v1/mods/105/files', '/v1/mods/files'])
+
+
+class LockTest(InstanceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        os.mkdir('getters')
+        self.write_csv(['AAAAAAAA', 'BBBBBBBB'])
+        self.resolver = self.get_resolver()
+
+    def get_resolver(self, **settings):
+        config = self.get_config(
+            modrinth_base_url=self.server.base, modrinth_api=self.server.base + '/v2',
+            use_cache=False, follow_dependencies=False, **settings)
+        return build_installer(config, Telemetry()).resolver
+
+    def write_csv(self, project_ids: list, loader: str = 'forge'):
+        with open('getters/common.csv', 'w') as file:
+            file.write('url,filename,loader,comment\n')
+            for project_id in project_ids:
+                file.write(f'{self.server.base}/data/{project_id},{project_id},'
+                           f'{loader},\n')
+            file.write('https://example.com/direct.jar,direct.jar,forge,\n')
+
+    def lock(self, update: bool = False) -> bool:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.resolver.lock_files(update)
+
+    def get_entries(self) -> list:
+        with contextlib.redirect_stdout(io.StringIO()):
+            tables = self.resolver.get_entries(['common.csv'])
+        return [entry for _, entry in tables['common.csv']]
+
+    def test_round_trip(self):
+        self.assertTrue(self.lock())
+        with open('getters/lock.json') as file:
+            lock = json.load(file)
+        locked = lock['files']['common.csv']
+        self.assertEqual(len(locked), 3)
+        self.assertEqual(locked[f'{self.server.base}/data/AAAAAAAA']['filename'],
+                         'AAAAAAAA-2.jar')
+        self.server.requests.clear()
+        # installing from the lockfile asks no API
+        entries = self.get_entries()
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(entries, [locked[entry['source']['url']] for entry in entries])
+        self.assertEqual(entries[2]['url'], 'https://example.com/direct.jar')
+
+    def test_changed_row(self):
+        self.lock()
+        self.write_csv(['AAAAAAAA', 'BBBBBBBB', 'CCCCCCCC'])
+        self.server.requests.clear()
+        entries = self.get_entries()
+        self.assertEqual([entry['filename'] for entry in entries],
+                         ['AAAAAAAA-2.jar', 'BBBBBBBB-2.jar', 'CCCCCCCC-2.jar',
+                          'direct.jar'])
+        # only the new row is resolved
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_update(self):
+        self.lock()
+        self.write_csv(['AAAAAAAA', 'BBBBBBBB'], loader='fabric')
+        self.server.requests.clear()
+        self.assertTrue(self.lock(update=True))
+        with open('getters/lock.json') as file:
+            locked = json.load(file)['files']['common.csv']
+        self.assertEqual(locked[f'{self.server.base}/data/AAAAAAAA']['filename'],
+                         'AAAAAAAA-4.jar')
+        self.assertEqual(locked[f'{self.server.base}/data/AAAAAAAA']['source']['loader'],
+                         'fabric')
+        self.assertEqual(locked['https://example.com/direct.jar']['filename'],
+                         'direct.jar')
+
+    def test_other_game_version(self):
+        self.lock()
+        resolver = self.get_resolver(mc_version='1.21')
+        self.assertEqual(resolver.read_lock()['files'], {})
+        self.assertEqual(self.resolver.read_lock()['mc_version'], '1.20.1')
+
+
+if __name__ == '__main__':
+    unittest.main()